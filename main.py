@@ -4,9 +4,10 @@ import click
 import gurobipy
 import pypsa
 
-from run.run_scenarios import RunBrownfieldSimulation, RunCFE, RunRES100
-from src import brownfield, cfe, helpers, postprocess
-
+from run.pipeline import run_dag
+from run.screening import RunScreening
+from src import autotune as solver_autotune
+from src import brownfield, bundle, cfe, helpers, postprocess
 
 def build_brownfield_network(run, configs) -> None:
     """
@@ -59,46 +60,19 @@ def solve_brownfield_network(run, configs, with_cfe: bool, env=None) -> pypsa.Ne
     return final_brownfield
 
 
-def run_scenarios(configs):
+def run_scenarios(configs, workers: int = 1, force: bool = False):
     env = None
     if configs["solver"]["name"] == "gurobi":
         env = gurobipy.Env()
 
     for run in configs["model_runs"]:
-        helpers.setup_dir(
-            path_to_dir=configs["paths"]["output_model_runs"]
-            + run["name"]
-            + "/solved_networks/"
-        )
         print(f"Running: {run['name']}")
-        ci_identifier = configs["global_vars"]["ci_label"]
-        N_BROWNFIELD = RunBrownfieldSimulation(run, configs, env=env)
-        RES_TARGET = 100
-        print(f"Computing annual matching scenario (RES Target: {int(RES_TARGET)}%)...")
-        N_BROWNFIELD_original = helpers.load_brownfield_network(run, configs)
-        RunRES100(
-            N_BROWNFIELD_original,
-            ci_identifier=ci_identifier,
-            run=run,
-            res_target=RES_TARGET,
-            configs=configs,
-            env=env,
-        )
-        for CFE_Score in run["cfe_score"]:
-            print(f"Computing hourly matching scenario (CFE: {int(CFE_Score*100)}...")
-            N_BROWNFIELD_original = helpers.load_brownfield_network(run, configs)
-            RunCFE(
-                N_BROWNFIELD_original,
-                CFE_Score=CFE_Score,
-                ci_identifier=ci_identifier,
-                run=run,
-                configs=configs,
-                env=env,
-            )
-        path_to_run_dir = os.path.join(
-            configs["paths"]["output_model_runs"], run["name"]
-        )
-        postprocess.plot_results(path_to_run_dir,run,run["nodes_with_ci_load"][0])
+        # solve with the recommended solver options of the model, if it has been tuned
+        run_configs = solver_autotune.with_tuned_profile(run, configs)
+        if run_configs is not configs:
+            print(f"Using tuned solver options: {solver_autotune.load_recommendation(run, configs)['candidate']}")
+        # brownfield -> RES100 / CFE scores -> plots, resuming from the run manifest
+        run_dag(run, run_configs, workers=workers, env=env, force=force)
     print("*" * 100)
 
 
@@ -107,6 +81,25 @@ def cli():
     pass
 
 
+@cli.command()
+@click.option("--config", default="configs.yaml", help="Path to the configuration file")
+def compile_stock_models(config):
+    """
+    Compiles the stock model in the configuration into a binary bundle, which is loaded
+    instead of the CSV files when stock_model_bundle is enabled.
+    Args:
+        config (str): Path to the configuration file.
+    Returns:
+        None
+    """
+
+    configs = helpers.load_configs(config)
+    path = bundle.compile_bundle(configs)
+    print(f"Compiled stock model bundle: {path}")
+    if not bundle.bundle_settings(configs)["enable"]:
+        print("Stock model bundles are disabled: set stock_model_bundle.enable in the configuration to use it")
+
+
 @cli.command()
 @click.option("--config", default="configs.yaml", help="Path to the configuration file")
 @click.option("--with_cfe", default=False, help="Include CFE components in the model")
@@ -184,9 +177,58 @@ def solve_brownfield_cfe(config):
 
 @cli.command()
 @click.option("--config", default="configs.yaml", help="Path to the configuration file")
-def run_full_cfe(config):
+@click.option("--workers", default=1, help="Number of RES100/CFE scenarios to solve in parallel")
+@click.option("--force", is_flag=True, default=False, help="Re-run all scenarios, ignoring completed ones")
+def run_full_cfe(config, workers: int, force: bool):
+    configs = helpers.load_configs(config)
+    run_scenarios(configs, workers=workers, force=force)
+
+
+@cli.command()
+@click.option("--config", default="configs.yaml", help="Path to the configuration file")
+@click.option("--run", "run_name", default=None, help="Name of the model run to tune (default: the first)")
+@click.option("--timesteps", default=None, type=int, help="Solve only the first timesteps snapshots")
+def autotune(config, run_name, timesteps):
+    """
+    Solves the brownfield of a run with each candidate solver options (autotune.profiles,
+    combined with autotune.grid) and records the fastest for the model, which run_full_cfe
+    then uses.
+    Args:
+        config (str): Path to the configuration file.
+        run_name (str): Name of the model run to tune.
+        timesteps (int): Number of snapshots to solve.
+    Returns:
+        None
+    """
+    configs = helpers.load_configs(config)
+    runs = {run["name"]: run for run in configs["model_runs"]}
+    if run_name is not None and run_name not in runs:
+        raise click.BadParameter(f"No model run named {run_name}", param_hint="--run")
+    run = runs[run_name] if run_name is not None else configs["model_runs"][0]
+    solver_autotune.autotune(run, configs, timesteps=timesteps)
+
+
+@cli.command()
+@click.option("--config", default="configs.yaml", help="Path to the configuration file")
+@click.option("--run", "run_name", default=None, help="Name of the model run to screen (default: all)")
+@click.option("--days", default=None, type=int, help="Number of representative days")
+def screen_cfe(config, run_name, days):
+    """
+    Solves the RES100 and CFE scenarios of each run on representative days and writes the
+    approximate cost curve, validated against full-resolution solves of screening.validate.
+    Args:
+        config (str): Path to the configuration file.
+        run_name (str): Name of the model run to screen.
+        days (int): Number of representative days.
+    Returns:
+        None
+    """
     configs = helpers.load_configs(config)
-    run_scenarios(configs)
+    runs = [run for run in configs["model_runs"] if run_name in (None, run["name"])]
+    if not runs:
+        raise click.BadParameter(f"No model run named {run_name}", param_hint="--run")
+    for run in runs:
+        RunScreening(run, configs, representative_days=days)
 
 
 @cli.command()
@@ -199,7 +241,7 @@ def run_plots(
         path_to_run_dir = os.path.join(
             config["paths"]["output_model_runs"], run["name"]
         )
-        postprocess.plot_results(path_to_run_dir,run,run["nodes_with_ci_load"][0])
+        postprocess.plot_results(path_to_run_dir,run,run["nodes_with_ci_load"][0],configs=config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+import copy
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import gurobipy
+
+from run.run_scenarios import RunCFE, RunCFESweep, RunRES100
+from src import helpers
+
+
+def scenario_jobs(run: dict, configs: dict) -> list:
+    """
+    Lists the scenarios that can be solved independently once the brownfield of a run is solved.
+
+    Parameters:
+    -----------
+    run : dict
+        The run configuration (an entry of configs["model_runs"]).
+    configs : dict
+        The configuration settings.
+
+    Returns:
+    -----------
+    list
+        One job per scenario: the annual matching (RES100) scenario followed by one hourly
+        matching scenario per CFE score. With global_vars.cfe_sweep, all CFE scores are
+        solved by a single sweep job instead.
+    """
+    jobs = [{"name": "RES100", "kind": "res100", "res_target": 100}]
+    if configs["global_vars"].get("cfe_sweep", False):
+        jobs.append(
+            {"name": "CFE-sweep", "kind": "cfe_sweep", "cfe_scores": sorted(run["cfe_score"])}
+        )
+        return jobs
+
+    for CFE_Score in run["cfe_score"]:
+        jobs.append(
+            {"name": f"CFE{int(CFE_Score * 100)}", "kind": "cfe", "cfe_score": CFE_Score}
+        )
+    return jobs
+
+
+def split_solver_threads(configs: dict, workers: int) -> dict:
+    """
+    Returns a copy of the configs where the solver threads are shared between workers.
+
+    Each solver option profile gets at most its configured number of threads (or the number of
+    cores, if not set) divided by the number of workers, so that running several solves at once
+    does not oversubscribe the machine.
+    """
+    configs = copy.deepcopy(configs)
+    if workers <= 1:
+        return configs
+
+    for options in configs["solver_options"].values():
+        total_threads = options.get("threads") or os.cpu_count()
+        options["threads"] = max(1, int(total_threads) // workers)
+    return configs
+
+
+def run_scenario_job(job: dict, run: dict, configs: dict, env=None) -> str:
+    """
+    Solves a single RES100 or CFE scenario on top of the solved brownfield of a run.
+
+    The brownfield is re-loaded from disk, so each job works on its own copy of the network.
+    When called in a worker process, a new Gurobi environment is created if required.
+    """
+    if env is None and configs["solver"]["name"] == "gurobi":
+        env = gurobipy.Env()
+
+    ci_identifier = configs["global_vars"]["ci_label"]
+    N_BROWNFIELD = helpers.load_brownfield_network(run, configs)
+
+    if job["kind"] == "res100":
+        print(f"Computing annual matching scenario (RES Target: {int(job['res_target'])}%)...")
+        RunRES100(
+            N_BROWNFIELD,
+            ci_identifier=ci_identifier,
+            run=run,
+            res_target=job["res_target"],
+            configs=configs,
+            env=env,
+        )
+    elif job["kind"] == "cfe":
+        print(f"Computing hourly matching scenario (CFE: {int(job['cfe_score']*100)}...")
+        RunCFE(
+            N_BROWNFIELD,
+            CFE_Score=job["cfe_score"],
+            ci_identifier=ci_identifier,
+            run=run,
+            configs=configs,
+            env=env,
+        )
+    elif job["kind"] == "cfe_sweep":
+        print(f"Computing hourly matching scenarios (CFE: {job['cfe_scores']})...")
+        RunCFESweep(
+            N_BROWNFIELD,
+            CFE_Scores=job["cfe_scores"],
+            ci_identifier=ci_identifier,
+            run=run,
+            configs=configs,
+            env=env,
+        )
+    else:
+        raise ValueError(f"Invalid job kind: {job['kind']}")
+
+    return job["name"]
+
+
+def run_scenario_jobs(
+    jobs: list, run: dict, configs: dict, workers: int = 1, env=None, on_done=None
+) -> None:
+    """
+    Runs the scenario jobs of a run, either one after another or in a pool of worker processes.
+
+    Parameters:
+    -----------
+    jobs : list
+        Jobs as returned by scenario_jobs.
+    run : dict
+        The run configuration.
+    configs : dict
+        The configuration settings.
+    workers : int
+        Number of scenarios to solve at the same time. With 1, jobs run in the current process.
+    env : gurobipy.Env, optional
+        Gurobi environment to use when running in the current process.
+    on_done : callable, optional
+        Called in the current process with each job as soon as it has finished.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            run_scenario_job(job, run, configs, env=env)
+            if on_done is not None:
+                on_done(job)
+        # the brownfield of the run is not needed by later runs
+        helpers.clear_brownfield_cache()
+        return
+
+    workers = min(workers, len(jobs))
+    worker_configs = split_solver_threads(configs, workers)
+
+    # use "spawn" so that workers do not inherit solver environments from the parent process
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = {
+            pool.submit(run_scenario_job, job, run, worker_configs): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            print(f"Finished {run['name']}: {future.result()}")
+            if on_done is not None:
+                on_done(futures[future])
@@ -0,0 +1,274 @@
+import datetime
+import hashlib
+import json
+import os
+
+from run.executor import run_scenario_jobs, scenario_jobs
+from run.run_scenarios import RunBrownfieldSimulation
+from src import cache, convergence, helpers, postprocess
+from src.helpers import hash_file
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_signature(path: str, known: list = None):
+    """
+    Returns the signature of a file (size, modification time, content hash), or None if it does
+    not exist. The content hash is reused from known, an earlier signature of the file, if its
+    size and modification time are unchanged, so that untouched files are not read again.
+    """
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    if known is not None and len(known) == 3 and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known
+    h = hashlib.sha256()
+    hash_file(path, h)
+    return [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+
+
+def dir_signature(path: str, known: dict = None) -> dict:
+    """Returns the signatures of all files in a directory (non-recursive)."""
+    if not os.path.isdir(path):
+        return {}
+    known = known or {}
+    return {
+        f: file_signature(os.path.join(path, f), known.get(f))
+        for f in sorted(os.listdir(path))
+        if os.path.isfile(os.path.join(path, f))
+    }
+
+
+def content_signature(signatures: dict) -> dict:
+    """Drops the modification times from file signatures, so that files rewritten with the same
+    content (e.g., a brownfield copied from the cache) compare equal."""
+    return {
+        f: None if sig is None else [sig[0], sig[-1]] for f, sig in signatures.items()
+    }
+
+
+def fingerprint(*parts) -> str:
+    """Hashes any JSON-serialisable inputs into a single fingerprint."""
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def build_run_dag(run: dict, configs: dict) -> list:
+    """
+    Models the scenarios of a run as a DAG of nodes: brownfield -> RES100 / each CFE score -> plots.
+
+    Parameters:
+    -----------
+    run : dict
+        The run configuration.
+    configs : dict
+        The configuration settings.
+
+    Returns:
+    -----------
+    list
+        Nodes in topological order. Each node is a dict with a name, the names of the nodes it
+        depends on, its output files (relative to the run directory) and the inputs that
+        determine its result.
+    """
+    year = str(configs["global_vars"]["year"])
+    solver_inputs = {
+        "solver": configs["solver"],
+        "solver_options": configs["solver_options"][configs["solver"]["options"]],
+    }
+
+    nodes = [
+        {
+            "name": "brownfield",
+            "deps": [],
+            "outputs": [os.path.join("solved_networks", f"brownfield_{year}.nc")],
+            "inputs": {
+                # only the settings the brownfield depends on, so that e.g. adding a CFE score
+                # does not re-solve it
+                "run": {k: run.get(k) for k in cache.BROWNFIELD_RUN_KEYS},
+                "global_vars": {
+                    k: configs["global_vars"].get(k)
+                    for k in cache.BROWNFIELD_GLOBAL_VARS + ["representative_days"]
+                },
+                "constraints": configs["constraints"],
+                "technology_palette": configs["technology_palette"][run["palette"]],
+                "stock_model": content_signature(dir_signature(configs["paths"]["path_to_model"])),
+                **solver_inputs,
+            },
+        }
+    ]
+
+    for job in scenario_jobs(run, configs):
+        if job["kind"] == "res100":
+            outputs = [
+                os.path.join(
+                    "solved_networks", f"annual_matching_RES{job['res_target']}_{year}.nc"
+                )
+            ]
+        else:
+            outputs = []
+            for CFE_Score in job.get("cfe_scores", [job.get("cfe_score")]):
+                cfe = int(CFE_Score * 100)
+                outputs += [
+                    os.path.join("solved_networks", f"hourly_matching_CFE{cfe}_{year}.nc"),
+                    os.path.join("grid_supply_cfe_iterations", f"cfe{cfe}.csv"),
+                ]
+        nodes.append(
+            {
+                "name": job["name"],
+                "deps": ["brownfield"],
+                "outputs": outputs,
+                "inputs": {
+                    "job": job,
+                    "global_vars": configs["global_vars"],
+                    "grid_cfe_convergence": convergence.convergence_settings(configs),
+                    **solver_inputs,
+                },
+                "job": job,
+            }
+        )
+
+    nodes.append(
+        {
+            "name": "plots",
+            "deps": [node["name"] for node in nodes],
+            # plot outputs are recorded from the results directory once rendered
+            "outputs": [],
+            "inputs": {
+                "nodes_with_ci_load": run["nodes_with_ci_load"],
+                # the number of workers does not change the plots
+                "formats": {
+                    key: value
+                    for key, value in postprocess.plot_settings(configs).items()
+                    if key != "workers"
+                },
+            },
+        }
+    )
+    return nodes
+
+
+def load_manifest(path_to_run_dir: str) -> dict:
+    """Loads the manifest of completed nodes of a run, or an empty manifest."""
+    path = os.path.join(path_to_run_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"nodes": {}}
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def save_manifest(path_to_run_dir: str, manifest: dict) -> None:
+    """Writes the manifest atomically, so that a crash never leaves it half-written."""
+    path = os.path.join(path_to_run_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def node_fingerprint(node: dict, manifest: dict) -> str:
+    """Fingerprint of a node: its own inputs plus the recorded outputs of the nodes it depends on."""
+    upstream = [
+        content_signature(manifest["nodes"].get(dep, {}).get("outputs") or {})
+        for dep in node["deps"]
+    ]
+    return fingerprint(node["inputs"], upstream)
+
+
+def node_outputs(node: dict, path_to_run_dir: str, known: dict = None) -> dict:
+    """Returns the current signatures of the outputs of a node (see file_signature)."""
+    known = known or {}
+    if node["name"] == "plots":
+        results = {
+            f[len("results") + 1:]: sig for f, sig in known.items() if f.startswith("results")
+        }
+        return {
+            os.path.join("results", f): sig
+            for f, sig in dir_signature(os.path.join(path_to_run_dir, "results"), results).items()
+        }
+    return {
+        output: file_signature(os.path.join(path_to_run_dir, output), known.get(output))
+        for output in node["outputs"]
+    }
+
+
+def is_node_current(node: dict, manifest: dict, path_to_run_dir: str) -> bool:
+    """A node is current if its inputs are unchanged and the content of its recorded outputs is
+    unchanged."""
+    record = manifest["nodes"].get(node["name"])
+    if record is None or record["fingerprint"] != node_fingerprint(node, manifest):
+        return False
+    outputs = node_outputs(node, path_to_run_dir, record["outputs"])
+    return (
+        bool(outputs)
+        and all(outputs.values())
+        and content_signature(outputs) == content_signature(record["outputs"])
+    )
+
+
+def record_node(node: dict, manifest: dict, path_to_run_dir: str) -> None:
+    """Marks a node as completed in the manifest and saves it."""
+    record = manifest["nodes"].get(node["name"]) or {}
+    manifest["nodes"][node["name"]] = {
+        "fingerprint": node_fingerprint(node, manifest),
+        "outputs": node_outputs(node, path_to_run_dir, record.get("outputs")),
+        "completed": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    save_manifest(path_to_run_dir, manifest)
+
+
+def run_dag(run: dict, configs: dict, workers: int = 1, env=None, force: bool = False) -> None:
+    """
+    Runs the DAG of a run, skipping any node that is already complete and unchanged.
+
+    Parameters:
+    -----------
+    run : dict
+        The run configuration.
+    configs : dict
+        The configuration settings.
+    workers : int
+        Number of RES100/CFE scenarios to solve in parallel.
+    env : gurobipy.Env, optional
+        Gurobi environment used for solves in the current process.
+    force : bool
+        If True, ignore the manifest and re-run every node.
+    """
+    path_to_run_dir = os.path.join(configs["paths"]["output_model_runs"], run["name"])
+    helpers.setup_dir(path_to_dir=os.path.join(path_to_run_dir, "solved_networks"))
+
+    manifest = {"nodes": {}} if force else load_manifest(path_to_run_dir)
+    nodes = {node["name"]: node for node in build_run_dag(run, configs)}
+
+    # brownfield
+    if is_node_current(nodes["brownfield"], manifest, path_to_run_dir):
+        print(f"Skipping brownfield for {run['name']} (unchanged)")
+    else:
+        RunBrownfieldSimulation(run, configs, env=env)
+        record_node(nodes["brownfield"], manifest, path_to_run_dir)
+
+    # RES100 and CFE scenarios
+    stale_jobs = []
+    for node in nodes.values():
+        if "job" not in node:
+            continue
+        if is_node_current(node, manifest, path_to_run_dir):
+            print(f"Skipping {node['name']} for {run['name']} (unchanged)")
+        else:
+            stale_jobs.append(node["job"])
+
+    run_scenario_jobs(
+        stale_jobs,
+        run,
+        configs,
+        workers=workers,
+        env=env,
+        on_done=lambda job: record_node(nodes[job["name"]], manifest, path_to_run_dir),
+    )
+
+    # plots
+    if is_node_current(nodes["plots"], manifest, path_to_run_dir):
+        print(f"Skipping plots for {run['name']} (unchanged)")
+    else:
+        postprocess.plot_results(path_to_run_dir, run, run["nodes_with_ci_load"][0], configs=configs)
+        record_node(nodes["plots"], manifest, path_to_run_dir)
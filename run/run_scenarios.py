@@ -1,77 +1,12 @@
 import os
+import shutil
 import sys
 
 import pandas as pd
 import pypsa
 
-from src import brownfield, cfe, helpers, postprocess
-
-
-def GetGridCFE(
-    n: pypsa.Network,   
-    ci_identifier: str,
-    run: dict
-):
-    """
-
-    Calculate the CFE score of a grid, intra- and inter-regionally. Here, we follow the mathematical
-    expressions presented by Xu and Jenkins (2021): https://acee.princeton.edu/24-7/
-
-    Parameters:
-    -----------
-    network : pypsa.Network
-        The optimised network for which we are calculating the GridCFE.
-    bus : str
-        The country bus for which we are calculating the GridCFE.
-    ci_identifier : str
-        The unique identifer used to identify C&I assets.
-
-    Returns:
-    -----------
-    CFE Score: list
-        Hourly resolution CFE scores for each snapshot in the network.
-
-    Let:
-    -----------
-    R = Intra-regional grid
-    Z = Inter-regional grid
-
-    """
-
-    
-
-        # get global clean carriers
-    global_clean_carriers = [
-        i
-        for i in n.carriers.query(" co2_emissions <= 0").index.tolist()
-        if i in n.generators.carrier.tolist()
-    ]
-
-    for bus in run["nodes_with_ci_load"]:
-        # get clean generators in R
-        R_clean_generators = n.generators.loc[
-            # clean carriers
-            (n.generators.carrier.isin(global_clean_carriers))
-            &
-            #exclude assets not in R
-            (n.generators.index.str.contains(bus)) &
-            # exclude C&I assets
-            (~n.generators.index.str.contains(ci_identifier))
-        ].index
-
-        # get all generators
-        R_all_generators = n.generators.loc[
-            (~n.generators.index.str.contains(ci_identifier))
-            &
-            (n.generators.index.str.contains(bus)) 
-        ].index
-
-        # calculate CFE sceore
-        total_clean_generation = n.generators_t.p[R_clean_generators].sum(axis=1)
-        total_generation = n.generators_t.p[R_all_generators].sum(axis=1)
-
-    # return CFE score
-    return (total_clean_generation / total_generation).round(2).tolist()
+from src import brownfield, cache, cfe, convergence, get, helpers, postprocess, solver
+from src.registry import ci_components
 
 
 def PostProcessBrownfield(n: pypsa.Network, ci_identifier: str):
@@ -97,6 +32,20 @@ def RunBrownfieldSimulation(run, configs, env=None):
 
     """Setup and run the brownfield simulation"""
 
+    brownfield_path = os.path.join(
+        configs["paths"]["output_model_runs"],
+        run["name"],
+        "solved_networks",
+        "brownfield_" + str(configs["global_vars"]["year"]) + ".nc",
+    )
+
+    # re-use a solved brownfield with identical inputs, if there is one
+    cached_path = cache.lookup_brownfield(run, configs)
+    if cached_path is not None:
+        print(f"Loading solved brownfield from cache: {cached_path}")
+        shutil.copyfile(cached_path, brownfield_path)
+        return helpers.load_brownfield_network(run, configs)
+
     N_BROWNFIELD = brownfield.SetupBrownfieldNetwork(run, configs)
 
     N_BROWNFIELD = cfe.PrepareNetworkForCFE(
@@ -114,22 +63,11 @@ def RunBrownfieldSimulation(run, configs, env=None):
     N_BROWNFIELD.optimize.create_model()
     brownfield.ApplyBrownfieldConstraints(N_BROWNFIELD, run, configs)
 
-    N_BROWNFIELD.optimize.solve_model(
-        solver_name=configs["solver"]["name"],
-        solver_options=configs["solver_options"][configs["solver"]["options"]],
-        io_api="direct",
-        env=env,
-    )
-
-    brownfield_path = os.path.join(
-        configs["paths"]["output_model_runs"],
-        run["name"],
-        "solved_networks",
-        "brownfield_" + str(configs["global_vars"]["year"]) + ".nc",
-    )
+    solver.solve_model(N_BROWNFIELD, run, configs, env=env)
 
     print(brownfield_path)
     N_BROWNFIELD.export_to_netcdf(brownfield_path)
+    cache.store_brownfield(run, configs, brownfield_path)
 
     return N_BROWNFIELD
 
@@ -154,12 +92,15 @@ def RunRES100(
     # init linopy model
     N_RES_100.optimize.create_model()
 
+    # annual totals are weighted by the snapshot weightings (see helpers.snapshot_weights)
+    weights = helpers.snapshot_weights(N_RES_100)
+
     for bus in run["nodes_with_ci_load"]:
 
         # get total C&I load (float)
         CI_Demand = (
-            N_RES_100.loads_t.p_set.filter(regex=bus)
-            .filter(regex=ci_identifier)
+            N_RES_100.loads_t.p_set[ci_components(N_RES_100, "load", bus, ci_identifier)]
+            .mul(weights, axis=0)
             .sum()
             .sum()
         )
@@ -167,27 +108,21 @@ def RunRES100(
         # get grid exports
         CI_GridExport = (
             N_RES_100.model.variables["Link-p"]
-            .sel(
-                Link=[
-                    i
-                    for i in N_RES_100.links.index
-                    if ci_identifier in i and "Export" in i and bus in i
-                ]
-            )
+            .sel(Link=ci_components(N_RES_100, "export", bus, ci_identifier))
             .sum(dims="Link")
         )
 
         # get total PPA procurement (linopy.Var)
-        ci_ppa_generators = N_RES_100.generators.loc[
-            (N_RES_100.generators.bus.str.contains(bus))
-            & (N_RES_100.generators.bus.str.contains(ci_identifier))
-        ].index.tolist()  # get c&i ppa generators
+        ci_ppa_generators = ci_components(
+            N_RES_100, "ppa_clean", bus, ci_identifier
+        ) + ci_components(N_RES_100, "ppa_fossil", bus, ci_identifier)  # get c&i ppa generators
 
         CI_PPA = (
             N_RES_100.model.variables["Generator-p"]
             .sel(Generator=ci_ppa_generators)
-            .sum()
-        )
+            .sum(dims="Generator")
+            * weights
+        ).sum()
 
         # get clean carriers in the regional grid
         clean_carriers = [
@@ -215,7 +150,7 @@ def RunRES100(
         # Constraint 2: Excess (export from C&I system to grid)
         # ---------------------------------------------------------------
         N_RES_100.model.add_constraints(
-            CI_GridExport.sum()
+            (CI_GridExport * weights).sum()
             <= CI_Demand * configs["global_vars"]["maximum_excess_export_res100"],
         )
 
@@ -223,12 +158,7 @@ def RunRES100(
         # ---------------------------------------------------------------
         brownfield.ApplyBrownfieldConstraints(N_RES_100, run, configs)
 
-    N_RES_100.optimize.solve_model(
-        solver_name=configs["solver"]["name"],
-        solver_options=configs["solver_options"][configs["solver"]["options"]],
-        io_api="direct",
-        env=env,
-    )
+    solver.solve_model(N_RES_100, run, configs, env=env)
 
     N_RES_100.export_to_netcdf(
         os.path.join(
@@ -247,43 +177,152 @@ def RunRES100(
     return N_RES_100
 
 
-def RunCFE(
-    N_BROWNFIELD: pypsa.Network, CFE_Score, ci_identifier: str, run: dict, configs: dict, env=None
+def SeedGridCFE(N_BROWNFIELD: pypsa.Network, ci_identifier: str, run: dict, configs: dict):
+    """Initial grid CFE of the grid CFE iteration: the grid CFE of the brownfield dispatch, or zeros"""
+    seed = convergence.convergence_settings(configs)["seed"]
+    if seed == "brownfield":
+        return get.GetGridCFE(N_BROWNFIELD, ci_identifier, run=run)
+    elif seed == "zeros":
+        return pd.DataFrame(0.0, index=N_BROWNFIELD.snapshots, columns=run["nodes_with_ci_load"])
+    else:
+        raise ValueError(f"Invalid grid CFE seed: {seed}")
+
+
+def RecordGridCFE(
+    GridSupplyCFE: pd.DataFrame, GridCFE: pd.DataFrame, count: int, label: str = "iteration"
+) -> None:
+    """Adds the grid CFE of an iteration to GridSupplyCFE: column {label}_{count}, or one
+    {label}_{count}_{bus} column per C&I bus if there are several"""
+    for bus in GridCFE.columns:
+        name = f"{label}_{count}" if GridCFE.shape[1] == 1 else f"{label}_{count}_{bus}"
+        GridSupplyCFE[name] = GridCFE[bus].values
+
+
+def IterateGridCFE(
+    N_CFE: pypsa.Network,
+    session: solver.SolverSession,
+    GridCFE: pd.DataFrame,
+    CFE_Score,
+    ci_identifier: str,
+    run: dict,
+    configs: dict,
 ):
-    """Run 24/7 CFE scenario"""
+    """
+    Solves the CFE model until the grid CFE converges.
 
-    N_CFE = PostProcessBrownfield(N_BROWNFIELD, ci_identifier=ci_identifier)
+    ---------------------------------------------------------------
 
-    # init linopy model
-    N_CFE.optimize.create_model()
+      ITERATIVELY SOLVE FOR GRID CFE
+
+      Following Xu and Jenkins (2021), here we iteratively solve
+      for the grid supply CFE score. We have to do this to avoid a
+      a non-convex problem, where two dynamic decision variables
+      (grid supply and grid CFE) are being multiplied by one another.
+      This approach allows us to compute the grid CFE "a priori" and
+      then feed it as a parameter into the model.
+
+      The process is as follows:
+          1. Set the grid CFE to a seed (e.g., the brownfield grid CFE) and run the model
+          2. Calculate the real grid CFE from (1)
+          3. Compare (2) against the grid CFE used in (1), hour by hour
+          4. If the difference is below the tolerance, stop. Otherwise, fix the grid CFE
+             to the (damped, Anderson-accelerated) next iterate and repeat from (2)
+
+    ---------------------------------------------------------------
 
-    # ---------------------------------------------------------------
-    #
-    #   ITERATIVELY SOLVE FOR GRID CFE
-    #
-    #   Following Xu and Jenkins (2021), here we iteratively solve
-    #   for the grid supply CFE score. We have to do this to avoid a
-    #   a non-convex problem, where two dynamic decision variables
-    #   (grid supply and grid CFE) are being multiplied by one another.
-    #   This approach allows us to compute the grid CFE "a priori" and
-    #   then feed it as a parameter into the model.
-    #
-    #   The process is as follows:
-    #       1. Set the grid CFE to 0 and run the model
-    #       2. Calculate the real grid CFE from (1)
-    #       3. Now, fix the grid CFE to (2) and re-run the model
-    #       4. Calculate the grid CFE from (3) and compare against (2)
-    #       5. If the difference is less than 0.01, stop. Otherwise, repeat from (3)
-    #
-    # ---------------------------------------------------------------
+    The grid CFE coefficients of the model must already be set to GridCFE.
+
+    If the iteration stalls or reaches max_iterations, the solve with the smallest residual is
+    kept: the model is re-solved with its grid CFE unless it was the last solve.
+
+    Returns:
+    -----------
+    GridSupplyCFE : pd.DataFrame
+        The seed and the grid CFE after each solve (and after the re-solve, if any).
+    GridCFE : pd.DataFrame
+        The grid CFE used in the kept solve (snapshots x C&I buses).
+    """
+    settings = convergence.convergence_settings(configs)
+    settings.pop("seed")
+
+    # the grid generators and their buses do not change between solves
+    incidence = get.grid_cfe_incidence(N_CFE, run["nodes_with_ci_load"], ci_identifier)
 
     # start a counter and initialise a dataframe to store the results
     count = 1
     GridSupplyCFE = pd.DataFrame({})
+    RecordGridCFE(GridSupplyCFE, GridCFE, count)
+
+    print(f"Computing hourly matching scenario (CFE: {int(CFE_Score*100)}) iteration {count}")
+    session.solve()
+
+    iteration = convergence.GridCFEConvergence(**settings)
+    while True:
+        # get GridCFE of the solved dispatch and the next grid CFE to use
+        GridCFE_Solved = get.grid_cfe(N_CFE, run["nodes_with_ci_load"], ci_identifier, incidence)
+        count += 1
+        RecordGridCFE(GridSupplyCFE, GridCFE_Solved, count)
+
+        GridCFE_Next = iteration.step(GridCFE, GridCFE_Solved)
+        if iteration.done:
+            break
+        GridCFE = pd.DataFrame(GridCFE_Next, index=GridCFE_Solved.index, columns=GridCFE_Solved.columns)
+
+        # Only the GridCFE coefficients change between iterations, so update them in place
+        N_CFE = cfe.update_cfe_grid_coefficients(
+            N_CFE,
+            GridCFE,
+            run["nodes_with_ci_load"],
+            ci_identifier,
+            session=session,
+        )
+        print(f"Computing hourly matching scenario (CFE: {int(CFE_Score*100)}) iteration {count}")
+        session.solve()
 
-    # [Step 1] Run the model with grid supply CFE set to 0
-    GridCFE = [0 for i in range(N_CFE.snapshots.size)]
-    GridSupplyCFE[f"iteration_{count}"] = GridCFE
+    print(iteration.summary())
+
+    if not iteration.converged:
+        print(
+            f"Warning: the grid CFE iteration (CFE: {int(CFE_Score*100)}) did not converge; "
+            f"keeping iteration {iteration.best_iteration} (residual {iteration.norm}-norm: "
+            f"{iteration.best:.4f})"
+        )
+        if not iteration.best_is_last:
+            # the model holds the last solve, so re-solve it with the grid CFE of the best one
+            GridCFE = pd.DataFrame(iteration.best_input, index=GridCFE.index, columns=GridCFE.columns)
+            N_CFE = cfe.update_cfe_grid_coefficients(
+                N_CFE,
+                GridCFE,
+                run["nodes_with_ci_load"],
+                ci_identifier,
+                session=session,
+            )
+            session.solve()
+            # column restored_{k} repeats column iteration_{k}: the grid CFE of the kept solve
+            GridCFE_Solved = get.grid_cfe(N_CFE, run["nodes_with_ci_load"], ci_identifier, incidence)
+            RecordGridCFE(GridSupplyCFE, GridCFE_Solved, iteration.best_iteration + 1, label="restored")
+
+    # later models of the run start with the solver options that worked
+    solver.record_solver_profile(run, configs, session.profile)
+
+    return GridSupplyCFE, GridCFE
+
+
+def SetupCFE(
+    N_BROWNFIELD: pypsa.Network,
+    GridCFE: pd.DataFrame,
+    CFE_Score,
+    ci_identifier: str,
+    run: dict,
+    configs: dict,
+    env=None,
+):
+    """Builds the CFE model on top of the brownfield and opens a solver session for it"""
+
+    N_CFE = PostProcessBrownfield(N_BROWNFIELD, ci_identifier=ci_identifier)
+
+    # init linopy model
+    N_CFE.optimize.create_model()
 
     # apply the CFE constraint
     N_CFE = cfe.apply_cfe_constraint(
@@ -298,47 +337,19 @@ def RunCFE(
     # (Re)apply original brownfield constraints
     brownfield.ApplyBrownfieldConstraints(N_CFE, run, configs)
 
-    # optimise
-    N_CFE.optimize.solve_model(
+    # keep the solver model alive so that later solves can be warm-started
+    session = solver.SolverSession(
+        N_CFE,
         solver_name=configs["solver"]["name"],
-        solver_options=configs["solver_options"][configs["solver"]["options"]],
-        io_api="direct",
+        profiles=solver.solver_profiles(run, configs),
+        resolve_options=configs["solver_options"].get(configs["solver"].get("resolve_options")),
         env=env,
     )
+    return N_CFE, session
 
-    # get GridCFE
-    GridCFE = GetGridCFE(N_CFE, ci_identifier, run=run)
-    count += 1
-    GridSupplyCFE[f"iteration_{count}"] = GridCFE
-
-    # calculate difference between iterations with a maximum of 100 loops
-    max_iterations = 100
-    while (
-        GridSupplyCFE[f"iteration_{count}"].sum()
-        - GridSupplyCFE[f"iteration_{count-1}"].sum()
-    ) > 0.01 and count < max_iterations:
-        # Remove constraints from the previous iteration before applying for the current iteration
-        N_CFE.model.remove_constraints(
-            [c for c in N_CFE.model.constraints if "cfe-constraint" in c]
-        )
-        N_CFE = cfe.apply_cfe_constraint(
-            N_CFE,
-            GridCFE,
-            run["nodes_with_ci_load"],
-            ci_identifier,
-            CFE_Score,
-            configs["global_vars"]["maximum_excess_export_cfe"],
-        )
-        print(f"Computing hourly matching scenario (CFE: {int(CFE_Score*100)}) iteration {count}")
-        N_CFE.optimize.solve_model(
-            solver_name=configs["solver"]["name"],
-            solver_options=configs["solver_options"][configs["solver"]["options"]],
-            io_api="direct",
-            env=env,
-        )
-        GridCFE = GetGridCFE(N_CFE, ci_identifier, run=run)
-        count += 1
-        GridSupplyCFE[f"iteration_{count}"] = GridCFE
+
+def ExportCFE(N_CFE: pypsa.Network, GridSupplyCFE: pd.DataFrame, CFE_Score, run: dict, configs: dict):
+    """Saves the grid CFE iterations and the solved network of a CFE scenario"""
 
     # save iteration results
     helpers.setup_dir(
@@ -373,6 +384,58 @@ def RunCFE(
     )
 
 
+def RunCFE(
+    N_BROWNFIELD: pypsa.Network, CFE_Score, ci_identifier: str, run: dict, configs: dict, env=None
+):
+    """Run 24/7 CFE scenario"""
+
+    # seed the grid CFE (before the brownfield solution is replaced)
+    GridCFE = SeedGridCFE(N_BROWNFIELD, ci_identifier, run, configs)
+
+    N_CFE, session = SetupCFE(
+        N_BROWNFIELD, GridCFE, CFE_Score, ci_identifier, run, configs, env=env
+    )
+
+    GridSupplyCFE, GridCFE = IterateGridCFE(
+        N_CFE, session, GridCFE, CFE_Score, ci_identifier, run, configs
+    )
+
+    ExportCFE(N_CFE, GridSupplyCFE, CFE_Score, run, configs)
+
+
+def RunCFESweep(
+    N_BROWNFIELD: pypsa.Network, CFE_Scores: list, ci_identifier: str, run: dict, configs: dict, env=None
+):
+    """
+    Run the 24/7 CFE scenarios of several CFE scores on one model.
+
+    The scores are solved in increasing order. Between scores only the CFE score coefficients
+    and right-hand side of the CFE constraints change, so the model and its solver session are
+    kept, and each score starts from the solution and converged grid CFE of the previous one.
+    """
+
+    CFE_Scores = sorted(CFE_Scores)
+
+    # seed the grid CFE (before the brownfield solution is replaced)
+    GridCFE = SeedGridCFE(N_BROWNFIELD, ci_identifier, run, configs)
+
+    N_CFE, session = SetupCFE(
+        N_BROWNFIELD, GridCFE, CFE_Scores[0], ci_identifier, run, configs, env=env
+    )
+
+    for i, CFE_Score in enumerate(CFE_Scores):
+        if i > 0:
+            N_CFE = cfe.update_cfe_score(
+                N_CFE, CFE_Score, run["nodes_with_ci_load"], ci_identifier, session=session
+            )
+
+        GridSupplyCFE, GridCFE = IterateGridCFE(
+            N_CFE, session, GridCFE, CFE_Score, ci_identifier, run, configs
+        )
+
+        ExportCFE(N_CFE, GridSupplyCFE, CFE_Score, run, configs)
+
+
 if __name__ == "__main__":
 
     print("*" * 100)
@@ -0,0 +1,143 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+from run.run_scenarios import RunBrownfieldSimulation, RunCFE, RunCFESweep, RunRES100
+from src import get, helpers, screening
+from src.registry import ci_components
+
+
+def ScreeningConfigs(configs: dict, representative_days: int = None) -> dict:
+    """
+    Returns a copy of the configs for a screening run: with representative_days, the networks
+    are reduced to that many representative days; without, they are solved at full resolution
+    (for validation). The outputs go to their own directory within screening.path.
+    """
+    settings = screening.screening_settings(configs)
+    path = settings["path"] or os.path.join(configs["paths"]["output_model_runs"], "screening")
+
+    configs = copy.deepcopy(configs)
+    configs["global_vars"]["representative_days"] = representative_days
+    configs["paths"]["output_model_runs"] = os.path.join(
+        path, f"{representative_days}d" if representative_days else "full"
+    ) + os.sep
+    return configs
+
+
+def RunScreeningScenarios(run: dict, configs: dict, CFE_Scores: list, res100: bool = True) -> str:
+    """Solves the brownfield, RES100 and CFE scenarios of a run with the given configs, and
+    returns the directory of the run"""
+    ci_identifier = configs["global_vars"]["ci_label"]
+    path_to_run_dir = os.path.join(configs["paths"]["output_model_runs"], run["name"])
+    helpers.setup_dir(os.path.join(path_to_run_dir, "solved_networks"))
+
+    RunBrownfieldSimulation(run, configs)
+
+    if res100:
+        RunRES100(helpers.load_brownfield_network(run, configs), ci_identifier, run, configs)
+
+    if configs["global_vars"].get("cfe_sweep", False):
+        RunCFESweep(helpers.load_brownfield_network(run, configs), CFE_Scores, ci_identifier, run, configs)
+    else:
+        for CFE_Score in CFE_Scores:
+            RunCFE(helpers.load_brownfield_network(run, configs), CFE_Score, ci_identifier, run, configs)
+
+    helpers.clear_brownfield_cache()
+    return path_to_run_dir
+
+
+def ScreeningSummary(path_to_run_dir: str) -> pd.DataFrame:
+    """
+    Returns the costs of the RES100 and CFE scenarios solved in a run directory: one row per
+    scenario (e.g., CFE90), with annual totals that account for the snapshot weightings.
+    """
+    rows = {}
+    with get.load_from_dir(os.path.join(path_to_run_dir, "solved_networks")) as solved_networks:
+        for k, n in solved_networks.stream([k for k in solved_networks if k != "n_bf"]):
+            scenario = k.split("_")[2]
+            weights = helpers.snapshot_weights(n)
+            ci_load = n.loads_t.p.filter(items=ci_components(n, "load")).sum(axis=1).mul(weights).sum()
+            ci_cost = get.get_total_ci_procurement_cost(n)["annual_system_cost [M$]"].sum()
+            rows[scenario] = {
+                "cfe_score": int(scenario[3:]) / 100 if scenario.startswith("CFE") else np.nan,
+                "system_cost [M$]": get.get_total_annual_system_cost(n)["annual_system_cost [M$]"].sum(),
+                "ci_procurement_cost [M$]": ci_cost,
+                "ci_unit_cost [$/MWh]": ci_cost * 1e6 / ci_load,
+                "ci_ppa_capacity [MW]": n.generators.p_nom_opt.filter(items=ci_components(n, ["ppa_clean", "ppa_fossil"])).sum(),
+                "ci_storage_capacity [MW]": n.storage_units.p_nom_opt.filter(items=ci_components(n, "storage")).sum(),
+            }
+            solved_networks.release([k])
+
+    summary = pd.DataFrame.from_dict(rows, orient="index")
+    summary.index.name = "scenario"
+    return summary.sort_values("cfe_score", na_position="first")
+
+
+def ValidationReport(summary: pd.DataFrame, validation: pd.DataFrame) -> pd.DataFrame:
+    """Compares the screening results of the validated scenarios with their full-resolution
+    results: one row per scenario and metric, with the relative error of the screening"""
+    metrics = [c for c in summary.columns if c != "cfe_score"]
+    scenarios = validation.index.intersection(summary.index)
+
+    report = pd.DataFrame(
+        {
+            "screening": summary.loc[scenarios, metrics].stack(),
+            "full": validation.loc[scenarios, metrics].stack(),
+        }
+    )
+    report.index.names = ["scenario", "metric"]
+    report["error"] = report["screening"] - report["full"]
+    report["relative_error"] = report["error"] / report["full"].abs()
+    return report
+
+
+def RunScreening(run: dict, configs: dict, representative_days: int = None) -> pd.DataFrame:
+    """
+    Screens the CFE cost curve of a run on representative days.
+
+    The RES100 and CFE scenarios of the run are solved on networks reduced to representative
+    days (see src/screening.py), and their costs are written to cost_curve.csv. The CFE scores
+    in screening.validate are also solved at full resolution, and the errors of the screening
+    against them are written to validation.csv.
+
+    Parameters:
+    -----------
+    run : dict
+        The run configuration.
+    configs : dict
+        The configuration settings.
+    representative_days : int, optional
+        Number of representative days (default: screening.representative_days).
+
+    Returns:
+    -----------
+    pd.DataFrame
+        The approximate cost curve: one row per scenario.
+    """
+    settings = screening.screening_settings(configs)
+    representative_days = representative_days or settings["representative_days"]
+    CFE_Scores = sorted(settings["cfe_scores"] or run["cfe_score"])
+
+    print(f"Screening {run['name']} on {representative_days} representative days...")
+    reduced_configs = ScreeningConfigs(configs, representative_days)
+    path_to_run_dir = RunScreeningScenarios(run, reduced_configs, CFE_Scores)
+
+    # scenarios of earlier screenings with other CFE scores may be in the run directory too
+    summary = ScreeningSummary(path_to_run_dir)
+    summary = summary[summary.index.isin(["RES100"] + [f"CFE{int(s * 100)}" for s in CFE_Scores])]
+    summary.to_csv(os.path.join(path_to_run_dir, "cost_curve.csv"))
+    print(summary.to_string())
+
+    if settings["validate"]:
+        print(f"Validating CFE scores {settings['validate']} at full resolution...")
+        full_configs = ScreeningConfigs(configs)
+        path_to_full_run_dir = RunScreeningScenarios(
+            run, full_configs, sorted(settings["validate"]), res100=False
+        )
+        report = ValidationReport(summary, ScreeningSummary(path_to_full_run_dir))
+        report.to_csv(os.path.join(path_to_run_dir, "validation.csv"))
+        print(report.to_string())
+
+    return summary
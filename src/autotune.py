@@ -0,0 +1,235 @@
+import copy
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pypsa
+
+from . import brownfield, cfe
+from .cache import brownfield_cache_key
+from .solver import is_solved, solver_settings
+
+# name of the recommended option profile when it is added to the configs
+TUNED_PROFILE = "autotuned"
+
+def autotune_settings(configs: dict) -> dict:
+    """Returns the solver autotuning settings, with defaults for missing keys."""
+    settings = {
+        "apply": True,
+        "path": "networks/solver_autotune/",
+        "timesteps": None,
+        "profiles": None,
+        "grid": {},
+    }
+    settings.update(configs.get("autotune") or {})
+    if settings["profiles"] is None:
+        solver = solver_settings(configs)
+        settings["profiles"] = [solver["options"], *solver["fallback"]]
+    return settings
+
+
+def model_fingerprint(run: dict, configs: dict) -> str:
+    """
+    Fingerprint of the brownfield model of a run and the solver that solves it: the brownfield
+    cache key (see cache.brownfield_cache_key), which covers the stock model, the run settings
+    and the code that builds the model.
+    """
+    return brownfield_cache_key(run, configs) + "-" + configs["solver"]["name"]
+
+
+def recommendation_path(run: dict, configs: dict) -> str:
+    fingerprint = model_fingerprint(run, configs)
+    return os.path.join(autotune_settings(configs)["path"], fingerprint[:16] + ".json")
+
+
+def load_recommendation(run: dict, configs: dict) -> dict:
+    """Returns the recommended solver options of the model of a run, or None if it has not been tuned."""
+    path = recommendation_path(run, configs)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        recommendation = json.load(file)
+    if recommendation.get("fingerprint") != model_fingerprint(run, configs):
+        return None
+    return recommendation
+
+
+def with_tuned_profile(run: dict, configs: dict) -> dict:
+    """
+    Returns the configs to solve a run with: if the model of the run has been tuned (see
+    autotune) and autotune.apply is set, a copy in which the recommended options are the
+    solver option profile, with the configured profile as the first fallback.
+    """
+    if not autotune_settings(configs)["apply"]:
+        return configs
+    recommendation = load_recommendation(run, configs)
+    if recommendation is None:
+        return configs
+
+    solver = solver_settings(configs)
+    configs = copy.deepcopy(configs)
+    configs["solver_options"][TUNED_PROFILE] = recommendation["options"]
+    configs["solver"]["options"] = TUNED_PROFILE
+    configs["solver"]["fallback"] = [solver["options"], *solver["fallback"]]
+    return configs
+
+
+def candidate_options(configs: dict) -> dict:
+    """
+    Returns the candidate solver options: each profile of autotune.profiles, combined with
+    every combination of the option values in autotune.grid.
+
+    Returns:
+    -----------
+    dict
+        Candidate name -> solver options.
+    """
+    settings = autotune_settings(configs)
+    grid = settings["grid"]
+
+    candidates = {}
+    for profile in settings["profiles"]:
+        for values in itertools.product(*grid.values()):
+            options = dict(configs["solver_options"][profile])
+            options.update(zip(grid, values))
+            name = ",".join([profile] + [f"{k}={v}" for k, v in zip(grid, values)])
+            candidates[name] = options
+    return candidates
+
+
+def build_tuning_network(run: dict, configs: dict, timesteps: int = None) -> pypsa.Network:
+    """Builds the brownfield network of a run as RunBrownfieldSimulation does, optionally with
+    only the first timesteps snapshots."""
+    if timesteps is not None:
+        configs = copy.deepcopy(configs)
+        configs["global_vars"]["timesteps"] = timesteps
+
+    n = brownfield.SetupBrownfieldNetwork(run, configs)
+    return cfe.PrepareNetworkForCFE(
+        n,
+        buses_with_ci_load=run["nodes_with_ci_load"],
+        ci_load_fraction=run["ci_load_fraction"],
+        technology_palette=configs["technology_palette"][run["palette"]],
+        p_nom_extendable=False,
+    )
+
+
+def peak_memory_gb() -> float:
+    """Peak resident memory of the current process in GB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 1e9 if sys.platform == "darwin" else peak / 1e6
+
+
+def _solve_candidate(path: str, run: dict, configs: dict, options: dict) -> dict:
+    """Loads the tuning network from path and solves it with the given solver options."""
+    n = pypsa.Network(path)
+
+    env = None
+    if configs["solver"]["name"] == "gurobi":
+        import gurobipy
+
+        env = gurobipy.Env()
+
+    n.optimize.create_model()
+    brownfield.ApplyBrownfieldConstraints(n, run, configs)
+
+    start = time.perf_counter()
+    status, condition = n.optimize.solve_model(
+        solver_name=configs["solver"]["name"],
+        solver_options=options,
+        io_api="direct",
+        env=env,
+    )
+    return {
+        "solved": is_solved(status, condition, n.model.solver_model),
+        "status": status,
+        "condition": condition,
+        "wall_time_s": time.perf_counter() - start,
+        "peak_memory_gb": peak_memory_gb(),
+        "objective": n.objective,
+    }
+
+
+def autotune(run: dict, configs: dict, timesteps: int = None) -> dict:
+    """
+    Solves the brownfield of a run with each candidate solver options (see candidate_options)
+    and stores the fastest successful options as the recommendation for the model of the run,
+    which with_tuned_profile then adds to the configs of later runs.
+
+    Each candidate is solved in its own process, started by a fork server, which loads the
+    network from a temporary netCDF file. Its peak memory is that of the worker alone (Python,
+    the network, the model and the solve), not the memory of the current process: a child
+    forked from it, or spawned on Linux, reports the peak memory of its parent as its own.
+    Where a fork server is not available, the candidates are solved in the current process and
+    the peak memory is that of the process so far.
+
+    Parameters:
+    -----------
+    run : dict
+        The run configuration.
+    configs : dict
+        The configuration settings.
+    timesteps : int, optional
+        Solve only the first timesteps snapshots (default: autotune.timesteps, or all).
+
+    Returns:
+    -----------
+    dict
+        The recommendation: the fingerprint of the model, the recommended candidate and its
+        options, and the results of all candidates.
+    """
+    settings = autotune_settings(configs)
+    timesteps = timesteps or settings["timesteps"]
+    candidates = candidate_options(configs)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "network.nc")
+        build_tuning_network(run, configs, timesteps).export_to_netcdf(path)
+
+        for name, options in candidates.items():
+            print(f"Solving with candidate solver options: {name}")
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                with ProcessPoolExecutor(1, mp_context=context) as pool:
+                    result = pool.submit(_solve_candidate, path, run, configs, options).result()
+            else:
+                result = _solve_candidate(path, run, configs, options)
+            results.append({"candidate": name, **result})
+
+    table = pd.DataFrame(results).set_index("candidate")
+    print(table.drop(columns="objective").to_string())
+
+    solved = table[table["solved"]]
+    if solved.empty:
+        raise RuntimeError("No candidate solver options solved the model")
+    best = solved.sort_values(["wall_time_s", "peak_memory_gb"]).index[0]
+
+    recommendation = {
+        "fingerprint": model_fingerprint(run, configs),
+        "run": run["name"],
+        "solver": configs["solver"]["name"],
+        "candidate": best,
+        "options": candidates[best],
+        "timesteps": timesteps,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+    path = recommendation_path(run, configs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as file:
+        json.dump(recommendation, file, indent=2, default=str)
+    os.replace(path + ".tmp", path)
+
+    print(f"Recommended solver options: {best} ({path})")
+    return recommendation
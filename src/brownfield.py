@@ -16,6 +16,8 @@ from tz_pypsa.constraints import (
     constr_cofiring_ccs_generation_join_plant
 )
 
+from .bundle import load_stock_model
+
 def SetupBrownfieldNetwork(run, configs) -> pypsa.Network:
     """
     
@@ -47,18 +49,14 @@ def SetupBrownfieldNetwork(run, configs) -> pypsa.Network:
             )
         )
     else: 
-        network = (
-            Model.load_csv_from_dir(
-                configs['paths']['path_to_model'], 
-                #run['stock_model'],
-                frequency = configs['global_vars']['frequency'],
-                timesteps = configs['global_vars']['timesteps'],
-                #select_nodes=configs['global_vars']['select_nodes'], 
-                years=[ configs['global_vars']['year'] ],
-                #backstop=run['backstop'],
-                set_global_constraints=configs['global_vars']['set_global_constraints'],
-            )
-        )
+    # load the stock model from its CSV files and prune it to the selected nodes, or read only the selected nodes from its compiled bundle (see src/bundle.py)
+        network = load_stock_model(configs, nodes=run.get('select_nodes'))
+
+    # screening runs solve representative days instead of the full year (see src/screening.py)
+    if configs['global_vars'].get('representative_days'):
+        from .screening import cluster_representative_days
+
+        network = cluster_representative_days(network, configs['global_vars']['representative_days'])
 
     # if expansion is set to True, set p_nom_extendable to True for generators and storage units
     # otherwise if False, leaves propreties as they are (in case some are already set to True and others to False)
@@ -68,8 +66,8 @@ def SetupBrownfieldNetwork(run, configs) -> pypsa.Network:
         network.storage_units['p_nom_extendable']   = run["allow_storage_expansion"]
     if run["allow_grid_expansion"]:
         network.links['p_nom_extendable']   = run["allow_grid_expansion"]
-    network.storage_units.p_nom_extendable.loc[network.storage_units.index.str.contains('lithium')] = True
-    network.storage_units.p_nom_extendable.loc[network.storage_units.index.str.contains('pumped')] = False
+    network.storage_units.loc[network.storage_units.index.str.contains('lithium'), 'p_nom_extendable'] = True
+    network.storage_units.loc[network.storage_units.index.str.contains('pumped'), 'p_nom_extendable'] = False
 
     # set p_nom_min to prevent early decommissioning of assets
     network.generators['p_nom_min']      = network.generators['p_nom']
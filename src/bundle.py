@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pypsa
+from tz_pypsa.model import Model
+
+from .helpers import hash_file, package_version
+
+# bump when the layout of the bundle changes, so that old bundles are re-compiled
+BUNDLE_FORMAT = 2
+
+
+def bundle_settings(configs: dict) -> dict:
+    """Returns the stock model bundle settings, disabled if they are not set in the configs."""
+    settings = {"enable": False, "path": "networks/stock_model_bundles/"}
+    settings.update(configs.get("stock_model_bundle") or {})
+    return settings
+
+
+def load_settings(configs: dict) -> dict:
+    """Returns the arguments of Model.load_csv_from_dir for the stock model in the configs."""
+    return dict(
+        frequency = configs['global_vars']['frequency'],
+        timesteps = configs['global_vars']['timesteps'],
+        years = [ configs['global_vars']['year'] ],
+        set_global_constraints = configs['global_vars']['set_global_constraints'],
+    )
+
+
+def bundle_key(path_to_model: str, settings: dict) -> str:
+    """
+    Computes the key of a stock model bundle: a hash of the CSV files of the stock model, the
+    arguments it is loaded with and the versions of the packages that load it.
+    """
+    h = hashlib.sha256()
+    for f in sorted(os.listdir(path_to_model)):
+        if f.endswith(".csv"):
+            h.update(f.encode())
+            hash_file(os.path.join(path_to_model, f), h)
+
+    inputs = {
+        "settings": settings,
+        "format": BUNDLE_FORMAT,
+        "versions": [package_version(p) for p in ["pypsa", "pandas", "tza-pypsa"]],
+    }
+    h.update(json.dumps(inputs, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def bundle_path(configs: dict) -> str:
+    """Returns the directory of the bundle of the stock model in the configs."""
+    path_to_model = configs['paths']['path_to_model']
+    key = bundle_key(path_to_model, load_settings(configs))
+    name = os.path.basename(os.path.normpath(path_to_model))
+    return os.path.join(bundle_settings(configs)["path"], f"{name}-{key[:16]}")
+
+
+def on_nodes(static: pd.DataFrame, list_name: str, nodes: list) -> np.ndarray:
+    """
+    Returns a mask of the components in a static table that are within the given nodes: buses
+    in nodes, and components whose buses (bus, bus0, bus1, ...) are all in nodes. Components
+    without buses (e.g., carriers) are always kept.
+    """
+    if list_name == "buses":
+        return static.index.isin(nodes)
+
+    mask = np.ones(len(static), dtype=bool)
+    for col in static.columns:
+        if col == "bus" or (col.startswith("bus") and col[3:].isdigit()):
+            buses = static[col]
+            mask &= (buses.isin(nodes) | buses.isna() | (buses == "")).values
+    return mask
+
+
+def select_nodes(n: pypsa.Network, nodes: list) -> pypsa.Network:
+    """Removes all components that are not within the given nodes (see on_nodes) from a network."""
+    for component in n.all_components - {"SubNetwork"}:
+        list_name = n.components[component]["list_name"]
+        static = getattr(n, list_name)
+        removed = static.index[~on_nodes(static, list_name, nodes)]
+        if len(removed) > 0:
+            n.remove(component, removed)
+    return n
+
+
+def compile_bundle(configs: dict) -> str:
+    """
+    Compiles the stock model in the configs into a bundle and removes outdated bundles of
+    the same stock model.
+
+    Parameters:
+    -----------
+    configs : dict
+        The configuration settings.
+
+    Returns:
+    -----------
+    str
+        The path to the bundle.
+    """
+    # the bundle format relies on private pypsa APIs, so it is only imported when bundles are used
+    from .bundle_io import export_to_bundle
+
+    path = bundle_path(configs)
+    network = Model.load_csv_from_dir(configs['paths']['path_to_model'], **load_settings(configs))
+    export_to_bundle(network, path)
+
+    # bundles of other versions of the stock model files are outdated
+    bundle_dir, name = os.path.split(path)
+    prefix = name[:-16]
+    for f in os.listdir(bundle_dir):
+        other = os.path.join(bundle_dir, f)
+        if f.startswith(prefix) and len(f) == len(name) and other != path and os.path.isdir(other):
+            shutil.rmtree(other, ignore_errors=True)
+
+    return path
+
+
+def load_stock_model(configs: dict, nodes: list = None) -> pypsa.Network:
+    """
+    Loads the stock model from its CSV files with Model.load_csv_from_dir, and then removes the
+    components outside the selected nodes (see select_nodes).
+
+    If stock model bundles are enabled, the network is loaded from the bundle of the stock model
+    instead. The bundle is compiled on first use and whenever the CSV files change. Only a bundle
+    is read selectively: the components outside the nodes are never loaded from it. Either way,
+    all snapshots of the loaded timesteps are read.
+
+    Parameters:
+    -----------
+    configs : dict
+        The configuration settings.
+    nodes : list, optional
+        The nodes to load (e.g., run["select_nodes"]). Components on other buses, and links
+        to them, are left out. All nodes are loaded if None. Nodes that are not buses of the
+        stock model are ignored with a warning.
+
+    Returns:
+    -----------
+    pypsa.Network
+        The stock model.
+    """
+    if not bundle_settings(configs)["enable"]:
+        network = Model.load_csv_from_dir(configs['paths']['path_to_model'], **load_settings(configs))
+        if nodes is not None:
+            network = select_nodes(network, nodes)
+    else:
+        from .bundle_io import import_from_bundle
+
+        path = bundle_path(configs)
+        if not os.path.exists(os.path.join(path, "bundle.pkl")):
+            print(f"Compiling stock model bundle: {path}")
+            compile_bundle(configs)
+        network = import_from_bundle(path, nodes)
+
+    missing = set(nodes or []).difference(network.buses.index)
+    if missing:
+        print(f"Warning: selected nodes are not buses of the stock model and are ignored: {sorted(missing)}")
+    return network
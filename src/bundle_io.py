@@ -0,0 +1,167 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pypsa
+# private pypsa APIs, which may change between releases: this module is only imported when stock
+# model bundles are enabled (see bundle.py), and the pypsa versions it works with are pinned
+from pypsa.io import Exporter, Importer, _export_to_exporter, _import_from_importer, _import_series_from_df
+
+from .bundle import on_nodes
+
+
+class ExporterBundle(Exporter):
+    """
+    Writes a network as a bundle: the time series as one .npy file per component attribute, and
+    everything else (static tables, snapshots, network attributes) in bundle.pkl.
+
+    The time series are stored by component (one row per component), which is the layout of
+    pandas float blocks, so that the series of a subset of components are contiguous on disk.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.data = {"static": {}, "series": {}}
+        os.makedirs(path, exist_ok=True)
+
+    def save_attributes(self, attrs: dict) -> None:
+        self.data["attributes"] = attrs
+
+    def save_meta(self, meta: dict) -> None:
+        self.data["meta"] = meta
+
+    def save_crs(self, crs: dict) -> None:
+        self.data["crs"] = crs
+
+    def save_snapshots(self, snapshots: pd.DataFrame) -> None:
+        self.data["snapshots"] = snapshots
+
+    def save_investment_periods(self, investment_periods: pd.DataFrame) -> None:
+        self.data["investment_periods"] = investment_periods
+
+    def save_static(self, list_name: str, df: pd.DataFrame) -> None:
+        self.data["static"][list_name] = df
+
+    def save_series(self, list_name: str, attr: str, df: pd.DataFrame) -> None:
+        series = self.data["series"].setdefault(list_name, {})
+        if df.dtypes.nunique() != 1 or df.dtypes.iloc[0] == object:
+            # mixed or object columns cannot be memory-mapped
+            series[attr] = {"df": df}
+            return
+        file = f"{list_name}-{attr}.npy"
+        np.save(os.path.join(self.path, file), np.ascontiguousarray(df.values.T))
+        series[attr] = {"file": file, "columns": df.columns}
+
+    def close(self) -> None:
+        pd.to_pickle(self.data, os.path.join(self.path, "bundle.pkl"))
+
+
+class ImporterBundle(Importer):
+    """
+    Reads a bundle written by ExporterBundle. The time series are memory-mapped copy-on-write:
+    pages are read from disk when they are used and copied only when they are modified.
+
+    If nodes are given, only the components within them (see on_nodes) are read: the other rows
+    of the static tables are dropped before pypsa imports them, and only the time series of the
+    remaining components are read from disk.
+    """
+
+    def __init__(self, path: str, nodes: list = None) -> None:
+        self.path = path
+        self.nodes = nodes
+        self.data = pd.read_pickle(os.path.join(path, "bundle.pkl"))
+        self.kept = {}
+
+    def get_attributes(self) -> dict:
+        return dict(self.data["attributes"])
+
+    def get_meta(self) -> dict:
+        return dict(self.data["meta"])
+
+    def get_crs(self) -> dict:
+        return dict(self.data["crs"])
+
+    def get_snapshots(self) -> pd.DataFrame:
+        return self.data["snapshots"].copy()
+
+    def get_investment_periods(self) -> pd.DataFrame:
+        return self.data["investment_periods"]
+
+    def get_static(self, list_name: str) -> pd.DataFrame:
+        df = self.data["static"].get(list_name)
+        if df is None or self.nodes is None:
+            return df
+        df = df[on_nodes(df, list_name, self.nodes)]
+        self.kept[list_name] = df.index
+        return df
+
+    def get_series(self, list_name: str):
+        kept = self.kept.get(list_name)
+        for attr, series in self.data["series"].get(list_name, {}).items():
+            if "df" in series:
+                df = series["df"]
+                yield attr, (df if kept is None else df.loc[:, df.columns.isin(kept)]).copy()
+                continue
+
+            values = np.load(os.path.join(self.path, series["file"]), mmap_mode="c")
+            columns = series["columns"]
+            if kept is not None and not columns.isin(kept).all():
+                # only reads the rows of the remaining components
+                mask = columns.isin(kept)
+                values, columns = values[mask], columns[mask]
+            yield attr, pd.DataFrame(values.T, columns=columns, copy=False)
+
+
+def export_to_bundle(n: pypsa.Network, path: str) -> None:
+    """
+    Exports a network to a bundle directory. The bundle is written to a temporary directory
+    first, so that readers never see a partial bundle.
+    """
+    tmp_path = path + f".tmp{os.getpid()}"
+    exporter = ExporterBundle(tmp_path)
+    _export_to_exporter(n, exporter, basename=os.path.basename(path))
+
+    # pypsa only exports the time series that differ from the attribute default, which drops
+    # e.g. a p_max_pu series of ones on a generator with a different static p_max_pu
+    for component in n.all_components - {"SubNetwork"}:
+        list_name = n.components[component]["list_name"]
+        for attr, df in getattr(n, list_name + "_t").items():
+            if not df.empty:
+                exporter.save_series(list_name, attr, df.reset_index(drop=True))
+
+    exporter.close()
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # another process has written the same bundle in the meantime
+        shutil.rmtree(tmp_path)
+
+
+def import_from_bundle(path: str, nodes: list = None) -> pypsa.Network:
+    """
+    Imports a network from a bundle directory, optionally only the components within the
+    given nodes.
+
+    The static attributes are imported by pypsa as usual. The time series are attached as
+    DataFrames over the memory-mapped arrays instead of being copied into the network.
+    """
+    importer = ImporterBundle(path, nodes)
+    n = pypsa.Network()
+    _import_from_importer(n, importer, basename=os.path.basename(path), skip_time=True)
+
+    for component in n.all_components - {"SubNetwork"}:
+        list_name = n.components[component]["list_name"]
+        attrs = n.components[component]["attrs"]
+        for attr, df in importer.get_series(list_name):
+            df.index = n.snapshots
+            if attr in attrs.index and not attrs.at[attr, "static"]:
+                # output series cover all components, so they are filled in by pypsa
+                _import_series_from_df(n, df, component, attr)
+            else:
+                df.columns.name = component
+                df.index.name = "snapshot"
+                getattr(n, list_name + "_t")[attr] = df
+
+    return n
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import shutil
+
+from . import brownfield, bundle, cfe
+from .helpers import hash_file, package_version
+
+# the run settings and global variables that the brownfield network depends on
+BROWNFIELD_RUN_KEYS = [
+    "palette",
+    "stock_model",
+    "select_nodes",
+    "nodes_with_ci_load",
+    "ci_load_fraction",
+    "allow_grid_expansion",
+    "allow_generation_expansion",
+    "allow_storage_expansion",
+    "backstop",
+]
+BROWNFIELD_GLOBAL_VARS = ["year", "frequency", "timesteps", "set_global_constraints"]
+
+
+def brownfield_cache_key(run: dict, configs: dict) -> str:
+    """
+    Computes the cache key of a solved brownfield network.
+
+    The key is a hash of everything that goes into SetupBrownfieldNetwork, PrepareNetworkForCFE
+    and ApplyBrownfieldConstraints: the stock model files, the run settings (nodes, C&I load,
+    palette, expansion flags), the global model settings, the constraint flags and the code of
+    the modules that build the network.
+
+    Parameters:
+    -----------
+    run : dict
+        The run configuration.
+    configs : dict
+        The configuration settings.
+
+    Returns:
+    -----------
+    str
+        Hex digest identifying the solved brownfield network.
+    """
+    h = hashlib.sha256()
+
+    # stock model files
+    path_to_model = configs["paths"]["path_to_model"]
+    if os.path.isdir(path_to_model):
+        for f in sorted(os.listdir(path_to_model)):
+            if f.endswith(".csv"):
+                h.update(f.encode())
+                hash_file(os.path.join(path_to_model, f), h)
+
+    # code that builds and constrains the network
+    for module in [brownfield, bundle, cfe]:
+        hash_file(module.__file__, h)
+    # without importing it, as it is only imported when stock model bundles are enabled
+    hash_file(os.path.join(os.path.dirname(bundle.__file__), "bundle_io.py"), h)
+
+    inputs = {
+        "run": {k: run.get(k) for k in BROWNFIELD_RUN_KEYS},
+        "global_vars": {k: configs["global_vars"].get(k) for k in BROWNFIELD_GLOBAL_VARS},
+        "technology_palette": configs["technology_palette"][run["palette"]],
+        "constraints": configs["constraints"],
+        "versions": [package_version(p) for p in ["pypsa", "linopy", "tza-pypsa"]],
+    }
+    # only for screening runs, so that the keys of full-resolution networks are unchanged
+    if configs["global_vars"].get("representative_days"):
+        inputs["representative_days"] = configs["global_vars"]["representative_days"]
+    h.update(json.dumps(inputs, sort_keys=True, default=str).encode())
+
+    return h.hexdigest()
+
+
+def cache_settings(configs: dict) -> dict:
+    """Returns the brownfield cache settings, disabled if they are not set in the configs."""
+    settings = {"enable": False, "path": "networks/brownfield_cache/", "max_size_gb": 20}
+    settings.update(configs.get("brownfield_cache") or {})
+    return settings
+
+
+def lookup_brownfield(run: dict, configs: dict):
+    """
+    Looks up a solved brownfield network in the cache.
+
+    Returns the path to the cached netCDF file, or None if there is no entry or caching is disabled.
+    A hit refreshes the entry so that it is evicted last.
+    """
+    settings = cache_settings(configs)
+    if not settings["enable"]:
+        return None
+
+    path = os.path.join(settings["path"], brownfield_cache_key(run, configs) + ".nc")
+    if not os.path.exists(path):
+        return None
+
+    # touch the entry to mark it as recently used
+    os.utime(path)
+    return path
+
+
+def store_brownfield(run: dict, configs: dict, path_to_network: str) -> None:
+    """
+    Copies a solved brownfield netCDF file into the cache and evicts the least recently used
+    entries until the cache is within its size limit.
+    """
+    settings = cache_settings(configs)
+    if not settings["enable"]:
+        return
+
+    os.makedirs(settings["path"], exist_ok=True)
+    path = os.path.join(settings["path"], brownfield_cache_key(run, configs) + ".nc")
+
+    # write to a temporary file first so that readers never see a partial entry
+    shutil.copyfile(path_to_network, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+    evict_lru(settings["path"], max_bytes=settings["max_size_gb"] * 1e9, keep=path)
+
+
+def evict_lru(cache_dir: str, max_bytes: float, keep: str = None) -> None:
+    """
+    Removes the least recently used cache entries until the total size is below max_bytes.
+
+    Parameters:
+    -----------
+    cache_dir : str
+        The cache directory.
+    max_bytes : float
+        Maximum total size of the cache entries in bytes.
+    keep : str, optional
+        An entry that must not be evicted (e.g., the one just stored).
+    """
+    entries = [
+        os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".nc")
+    ]
+    entries.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in entries)
+
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(entry) == os.path.abspath(keep):
+            continue
+        total -= os.path.getsize(entry)
+        os.remove(entry)
+
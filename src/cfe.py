@@ -2,6 +2,9 @@ import pypsa
 import numpy as np
 import pandas as pd
 
+from .registry import ci_components, empty_ci_registry
+from .helpers import snapshot_weights
+
 def PrepareNetworkForCFE(
         network: pypsa.Network, 
         buses_with_ci_load: list,
@@ -44,321 +47,342 @@ def PrepareNetworkForCFE(
     - The function adds jitter to the coordinates of new buses to avoid overlap.
     - Small capital and marginal costs are added to links to prevent model infeasibilities.
     - The function ensures that the C&I load is subtracted from the overall load to prevent double-counting.
+    - The names of the added components are recorded by role in network.meta["ci_registry"] 
+      (see src/registry.py), so that they can be looked up without scanning component names.
+    - The components of all C&I buses are built as DataFrames and added with one call per component 
+      type. PPA generators take their parameters from the extendable generators of the same type on 
+      the bus; if several of these fall in the same emissions class (clean/fossil), the first one sets 
+      the marginal cost, carrier and blend share.
 
     """
-    
-    # STEP 1:
-    # Loop through each bus on which we want to model a C&I system/asset. 
-    # The logic here is to abstract the C&I system as a separate entity.
-    # This is done by adding a new bus, load, and storage unit to the network.
 
-    for bus in buses_with_ci_load:
+    registry = network.meta.setdefault("ci_registry", {})
+    registry.update(empty_ci_registry(buses_with_ci_load))
 
-        # define names
-        ci_bus_name = f'{bus} C&I Grid'
-        ci_load_name = f'{bus} C&I Load'
-        ci_storage_bus_name = f'{bus} C&I Storage'
+    ci_bus_names = [f'{bus} C&I Grid' for bus in buses_with_ci_load]
+    ci_storage_bus_names = [f'{bus} C&I Storage' for bus in buses_with_ci_load]
+    ci_load_names = [f'{bus} C&I Load' for bus in buses_with_ci_load]
 
-        # add a bus for the C&I system
-        network.add(
-            'Bus',
-            ci_bus_name,
-            x = network.buses.x.iloc[0] + 1, # add jitter
-            y = network.buses.y.iloc[0] + 1, # add jitter
-        )
+    # sort the technology palette into generator and storage technologies
+    generator_technologies = []
+    storage_technologies = []
+    for technology in technology_palette:
+        if technology in network.generators.type.unique():
+            generator_technologies.append(technology)
+        elif technology in network.storage_units.carrier.unique():
+            storage_technologies.append(technology)
+        else:
+            raise ValueError(f"Invalid technology: {technology}")
 
-        # add another bus to connect C&I bus with energy storage
-        network.add(
-            'Bus',
-            ci_storage_bus_name,
-            x = network.buses.x.iloc[0] - 1, # add jitter
-            y = network.buses.y.iloc[0] - 1, # add jitter
-        )
+    # STEP 1:
+    # Abstract the C&I system on each bus as a separate entity.
+    # This is done by adding a new bus, load, and storage bus to the network.
+
+    # add a bus for the C&I system and another bus to connect it with energy storage
+    network.add(
+        'Bus',
+        [name for pair in zip(ci_bus_names, ci_storage_bus_names) for name in pair],
+        x = [network.buses.x.iloc[0] + 1, network.buses.x.iloc[0] - 1] * len(buses_with_ci_load), # add jitter
+        y = [network.buses.y.iloc[0] + 1, network.buses.y.iloc[0] - 1] * len(buses_with_ci_load), # add jitter
+    )
+
+    # add C&I loads
+    ci_p_set = network.loads_t.p_set[buses_with_ci_load] * ci_load_fraction
+    network.add(
+        "Load",
+        ci_load_names,
+        bus = ci_bus_names,
+        p_set = ci_p_set.set_axis(ci_load_names, axis=1),
+    )
+
+    # now subtract the C&I load from the overall load to prevent double-counting
+    network.loads_t.p_set[buses_with_ci_load] = network.loads_t.p_set[buses_with_ci_load] - ci_p_set.values
+
+    for bus, ci_load_name in zip(buses_with_ci_load, ci_load_names):
+        registry[bus]['load'].append(ci_load_name)
+
+    # STEP 2:
+    # Add virtual links between buses to represent flows of electricity.
+    # Specifically, we add the following:
+    #   - LocalGrid <-> C&I system
+    #   - C&I system <-> C&I storage
+
+    links = pd.DataFrame(
+        [
+            row
+            for bus, ci_bus_name, ci_storage_bus_name in zip(buses_with_ci_load, ci_bus_names, ci_storage_bus_names)
+            for row in [
+                # keep imports extendable to prevent infeasibilities
+                (f"{bus} C&I Grid Imports", bus, ci_bus_name, True, bus, 'import'),
+                (f"{bus} C&I Grid Exports", ci_bus_name, bus, p_nom_extendable, bus, 'export'),
+                (f"{bus} C&I Storage Charge", ci_bus_name, ci_storage_bus_name, p_nom_extendable, bus, 'charge'),
+                (f"{bus} C&I Storage Discharge", ci_storage_bus_name, ci_bus_name, p_nom_extendable, bus, 'discharge'),
+            ]
+        ],
+        columns=['name', 'bus0', 'bus1', 'p_nom_extendable', 'ci_bus', 'role'],
+    ).set_index('name')
+
+    network.add(
+        "Link",
+        links.index,
+        bus0=links.bus0,
+        bus1=links.bus1,
+        p_nom=0,
+        p_nom_extendable=links.p_nom_extendable,
+        # add small capital and marginal costs to prevent model infeasibilities
+        marginal_cost=0.01,
+        capital_cost=0.01,
+    )
+
+    for name, link in links.iterrows():
+        registry[link.ci_bus][link.role].append(name)
+
+    # STEP 3:
+    # Add generators and storages to C&I bus within the technology palette. 
+    # This represents the technologies procured in the C&I's PPA.
+
+    # the extendable generators of the palette on each bus serve as templates
+    templates = network.generators.loc[
+        network.generators.bus.isin(buses_with_ci_load)
+        & network.generators.type.isin(generator_technologies)
+        & (network.generators.p_nom_extendable == True)
+    ]
+    params = templates.groupby(by=['bus', 'type']).first()
+    template_groups = templates.groupby(by=['bus', 'type']).groups
+
+    ppa = []
+    ppa_cf = {}
+    for bus, ci_bus_name in zip(buses_with_ci_load, ci_bus_names):
+        for technology in generator_technologies:
+            if (bus, technology) not in template_groups:
+                continue
+
+            generator_names = template_groups[(bus, technology)]
+            build_year = params.loc[(bus, technology), 'build_year']
+
+            # one PPA generator per technology and emissions class, with the marginal cost,
+            # carrier and blend share of the first template in that class
+            for generator in generator_names:
+                carrier = network.generators.at[generator, 'carrier']
+                clean = network.carriers.at[carrier, 'co2_emissions'] <= 0
+                ppa.append((
+                    ci_bus_name + '-' + technology + '-ext-' + str(build_year) + '-' + 'PPA' + '-' + ('Clean' if clean else 'Fossil'),
+                    generator, bus, technology, ci_bus_name, 'ppa_clean' if clean else 'ppa_fossil',
+                ))
+
+            # get capacity factors if technology is renewable, ensuring correct technology and bus is used
+            ppa_cf[(bus, technology)] = _ppa_capacity_factor(network, generator_names)
+
+    ppa = (
+        pd.DataFrame(ppa, columns=['name', 'template', 'ci_bus', 'type', 'bus', 'role'])
+        .drop_duplicates(subset='name', keep='first')
+        .set_index('name')
+    )
+
+    if not ppa.empty:
+        ppa_params = params.loc[list(zip(ppa.ci_bus, ppa.type))].set_axis(ppa.index)
+        ppa_templates = network.generators.loc[ppa.template].set_axis(ppa.index)
+
+        # constant capacity factors are static attributes, only varying ones are time series
+        cf = [ppa_cf[(ci_bus, technology)] for ci_bus, technology in zip(ppa.ci_bus, ppa.type)]
+        static_cf = pd.Series([c if np.isscalar(c) else 1.0 for c in cf], index=ppa.index)
+        varying_cf = {name: c for name, c in zip(ppa.index, cf) if not np.isscalar(c)}
 
-        # add C&I load
         network.add(
-            "Load",
-            ci_load_name,
-            bus = ci_bus_name,
-            p_set = network.loads_t.p_set[bus] * ci_load_fraction,
+            'Generator', # PyPSA component
+            ppa.index, # generator names
+            type = ppa.type, # technology type (e.g., solar, gas-ccgt etc.)
+            bus = ppa.bus, # region/bus/balancing zone
+            # ---
+            # unique technology parameters by bus
+            p_nom = 0, # starting capacity (MW)
+            p_nom_min = 0, # minimum capacity (MW)
+            #p_nom_max = ppa_params['p_nom_max'], # set this to constrain capacity build out, e.g. to a technical potential
+            p_max_pu = static_cf, # capacity factor
+            p_min_pu = ppa_params['p_min_pu'], # minimum capacity factor
+            efficiency = ppa_params['efficiency'], # efficiency
+            ramp_limit_up = ppa_params['ramp_limit_up'], # per unit
+            ramp_limit_down = ppa_params['ramp_limit_down'], # per unit
+            # ---
+            # universal technology parameters
+            p_nom_extendable = p_nom_extendable, # can the model build more?
+            capital_cost = ppa_params['capital_cost'], # currency/MW
+            marginal_cost = ppa_templates['marginal_cost'], # currency/MWh
+            carrier = ppa_templates['carrier'], # commodity/carrier
+            build_year = ppa_params['build_year'], # year available from
+            lifetime = ppa_params['lifetime'], # years
+            start_up_cost = ppa_params['start_up_cost'], # currency/MW
+            shut_down_cost = ppa_params['shut_down_cost'], # currency/MW
+            committable = ppa_params['committable'], # UNIT COMMITMENT
+            ramp_limit_start_up = ppa_params['ramp_limit_start_up'], # 
+            ramp_limit_shut_down = ppa_params['ramp_limit_shut_down'], # 
+            min_up_time = ppa_params['min_up_time'], # 
+            min_down_time = ppa_params['min_down_time'], # 
+            is_blend_or_ccs = ppa_params['is_blend_or_ccs'],
+            generation_blend_share = ppa_templates['generation_blend_share'], #
+            min_utilisation_rate = ppa_params['min_utilisation_rate'], 
+            max_utilisation_rate = ppa_params['max_utilisation_rate'],
         )
 
-        # now subtract the C&I load from the overall load to prevent double-counting
-        network.loads_t.p_set[bus] = network.loads_t.p_set[bus] - network.loads_t.p_set[ci_load_name]
+        if varying_cf:
+            network.generators_t.p_max_pu = pd.concat(
+                [network.generators_t.p_max_pu, pd.DataFrame(varying_cf)], axis=1
+            )
 
-        # STEP 2:
-        # Add virtual links between buses to represent flows of electricity.
-        # Specifically, we add the following:
-        #   - LocalGrid <-> C&I system
-        #   - C&I system <-> C&I storage
+    for name, generator in ppa.iterrows():
+        registry[generator.ci_bus][generator.role].append(name)
+
+    # the extendable storage units of the palette on each bus serve as templates
+    storage_templates = network.storage_units.loc[
+        network.storage_units.bus.isin(buses_with_ci_load)
+        & network.storage_units.carrier.isin(storage_technologies)
+        & (network.storage_units.p_nom_extendable == True)
+    ]
+    storage_params = (
+        storage_templates
+        .groupby(by=['bus', 'carrier', 'type'])
+        .first()
+        # use the last type if a carrier has several
+        .groupby(level=['bus', 'carrier'])
+        .tail(1)
+        .droplevel('type')
+    )
+
+    storage = pd.DataFrame(
+        [
+            (ci_bus_name + '-' + technology, bus, technology, ci_storage_bus_name)
+            for bus, ci_bus_name, ci_storage_bus_name in zip(buses_with_ci_load, ci_bus_names, ci_storage_bus_names)
+            for technology in storage_technologies
+            if (bus, technology) in storage_params.index
+        ],
+        columns=['name', 'ci_bus', 'carrier', 'bus'],
+    ).set_index('name')
+
+    if not storage.empty:
+        storage_unit_params = storage_params.loc[list(zip(storage.ci_bus, storage.carrier))].set_axis(storage.index)
 
-        # LocalGrid <-> C&I system
         network.add(
-            "Link",
-            f"{bus} C&I Grid Imports",
-            bus0=bus, 
-            bus1=ci_bus_name, 
-            p_nom=0,
-            p_nom_extendable=True, # keep this as True to prevent infeasibilities
-            # add small capital and marginal costs to prevent model infeasibilities
-            marginal_cost=0.01, 
-            capital_cost=0.01,
+            "StorageUnit",
+            storage.index,
+            bus = storage.bus,
+            p_nom_extendable = p_nom_extendable,
+            cyclic_state_of_charge=True,
+            max_hours=storage_unit_params['max_hours'],
+            build_year=storage_unit_params['build_year'],
+            carrier=storage.carrier,
+            capital_cost=storage_unit_params['capital_cost'],
+            efficiency_store=storage_unit_params['efficiency_store'],
+            efficiency_dispatch=storage_unit_params['efficiency_dispatch'],
+            standing_loss=storage_unit_params['standing_loss'],
+            lifetime=storage_unit_params['lifetime']
         )
 
-        network.add(
-            "Link",
-            f"{bus} C&I Grid Exports",
-            bus0=ci_bus_name, 
-            bus1=bus,
-            p_nom=0,
-            p_nom_extendable=p_nom_extendable,
-            # add small capital and marginal costs to prevent model infeasibilities
-            marginal_cost=0.01, 
-            capital_cost=0.01,
-        )
+    for name, storage_unit in storage.iterrows():
+        registry[storage_unit.ci_bus]['storage'].append(name)
 
-        # C&I system <-> C&I storage
-        network.add(
-            "Link",
-            f"{bus} C&I Storage Charge",
-            bus0=ci_bus_name, 
-            bus1=ci_storage_bus_name, 
-            p_nom=0,
-            p_nom_extendable=p_nom_extendable,
-            # add small capital and marginal costs to prevent model infeasibilities
-            marginal_cost=0.01, 
-            capital_cost=0.01,
-        )
+    '''
 
-        network.add(
-            "Link",
-            f"{bus} C&I Storage Discharge",
-            bus0=ci_storage_bus_name, 
-            bus1=ci_bus_name, 
-            p_nom=0,
-            p_nom_extendable=p_nom_extendable,
-            # add small capital and marginal costs to prevent model infeasibilities
-            marginal_cost=0.01, 
-            capital_cost=0.01,
-        )
+    TODO!
+    
+    Hydrogen storages need to be modelled with fundamental stores (i.e., PyPSA Store components)
+    
+    This is described in the links below:
+        - https://fneum.github.io/data-science-for-esm/09-workshop-pypsa.html
+        - https://groups.google.com/g/pypsa/c/Owf6_6aHhRM
+        - https://pypsa.readthedocs.io/en/stable/examples/replace-generator-storage-units-with-store.html
+    
+    '''
 
-        # STEP 3:
-        # Add generators and storages to C&I bus within the technology palette. 
-        # This represents the technologies procured in the C&I's PPA.
+    return network
 
-        for technology in technology_palette:
 
-            # check if technology is generator or storage
-            if technology in network.generators.type.unique():
-                
-                # get params from existing technologies
-                params = (
-                    network
-                    .generators
-                    .loc[ 
-                        ((network.generators["type"] == technology) & (network.generators["bus"] == bus) & (network.generators["p_nom_extendable"] == True))
-                    ]
-                    .groupby(by='type')
-                    .first()
-                    .melt()
-                    .set_index('variable')
-                    ['value']
-                    .to_dict()
-                )
-
-                # get capacity factors if technology is renewable, ensuring correct technology and bus is used
-                generator_names = network.generators.index[
-                    ((network.generators["type"] == technology) & (network.generators["bus"] == bus) 
-                     & (network.generators["p_nom_extendable"] == True))
-                ]
-
-                for generator in generator_names:
-                    if (network.generators.loc[generator].is_blend_or_ccs is True or
-                    generator not in network.generators_t.p_max_pu.columns):
-                        cf_int = np.ones((8760,1))
-                        cf = pd.DataFrame(cf_int)
-                    else:
-                        cf = network.generators_t.p_max_pu[generator_names]
-
-                if cf.empty:
-                    cf = params['p_max_pu']
-                else:
-                    cf = cf.iloc[:,0].values
-
-                for generator in generator_names:
-                    
-                    if network.carriers.loc[network.generators.carrier[generator]].co2_emissions <= 0:
-                    # add generator
-                        network.add(
-                            'Generator', # PyPSA component
-                            ci_bus_name + '-' + technology + '-ext-' + str(params['build_year']) + '-' + 'PPA' + '-' + 'Clean', # generator name
-                            type = technology, # technology type (e.g., solar, gas-ccgt etc.)
-                            bus = ci_bus_name, # region/bus/balancing zone
-                            # ---
-                            # unique technology parameters by bus
-                            p_nom = 0, # starting capacity (MW)
-                            p_nom_min = 0, # minimum capacity (MW)
-                            #p_nom_max = params['p_nom_max'], # set this to constrain capacity build out, e.g. to a technical potential
-                            p_max_pu = cf, # capacity factor
-                            p_min_pu = params['p_min_pu'], # minimum capacity factor
-                            efficiency = params['efficiency'], # efficiency
-                            ramp_limit_up = params['ramp_limit_up'], # per unit
-                            ramp_limit_down = params['ramp_limit_down'], # per unit
-                            # ---
-                            # universal technology parameters
-                            p_nom_extendable = p_nom_extendable, # can the model build more?
-                            capital_cost = params['capital_cost'], # currency/MW
-                            marginal_cost = network.generators.loc[generator].marginal_cost, # currency/MWh
-                            carrier = network.generators.loc[generator].carrier, # commodity/carrier
-                            build_year = params['build_year'], # year available from
-                            lifetime = params['lifetime'], # years
-                            start_up_cost = params['start_up_cost'], # currency/MW
-                            shut_down_cost = params['shut_down_cost'], # currency/MW
-                            committable = params['committable'], # UNIT COMMITMENT
-                            ramp_limit_start_up = params['ramp_limit_start_up'], # 
-                            ramp_limit_shut_down = params['ramp_limit_shut_down'], # 
-                            min_up_time = params['min_up_time'], # 
-                            min_down_time = params['min_down_time'],
-                            is_blend_or_ccs = params['is_blend_or_ccs'],
-                            generation_blend_share = network.generators.loc[generator].generation_blend_share, #
-                            min_utilisation_rate = params['min_utilisation_rate'], 
-                            max_utilisation_rate = params['max_utilisation_rate']  
-                        )
-                    
-                    else:
-
-                        network.add(
-                            'Generator', # PyPSA component
-                            ci_bus_name + '-' + technology + '-ext-' + str(params['build_year']) + '-' + 'PPA' + '-' + 'Fossil', # generator name
-                            type = technology, # technology type (e.g., solar, gas-ccgt etc.)
-                            bus = ci_bus_name, # region/bus/balancing zone
-                            # ---
-                            # unique technology parameters by bus
-                            p_nom = 0, # starting capacity (MW)
-                            p_nom_min = 0, # minimum capacity (MW)
-                            #p_nom_max = params['p_nom_max'], # set this to constrain capacity build out, e.g. to a technical potential
-                            p_max_pu = cf, # capacity factor
-                            p_min_pu = params['p_min_pu'], # minimum capacity factor
-                            efficiency = params['efficiency'], # efficiency
-                            ramp_limit_up = params['ramp_limit_up'], # per unit
-                            ramp_limit_down = params['ramp_limit_down'], # per unit
-                            # ---
-                            # universal technology parameters
-                            p_nom_extendable = p_nom_extendable, # can the model build more?
-                            capital_cost = params['capital_cost'], # currency/MW
-                            marginal_cost = network.generators.loc[generator].marginal_cost, # currency/MWh
-                            carrier = network.generators.loc[generator].carrier, # commodity/carrier
-                            build_year = params['build_year'], # year available from
-                            lifetime = params['lifetime'], # years
-                            start_up_cost = params['start_up_cost'], # currency/MW
-                            shut_down_cost = params['shut_down_cost'], # currency/MW
-                            committable = params['committable'], # UNIT COMMITMENT
-                            ramp_limit_start_up = params['ramp_limit_start_up'], # 
-                            ramp_limit_shut_down = params['ramp_limit_shut_down'], # 
-                            min_up_time = params['min_up_time'], # 
-                            min_down_time = params['min_down_time'], # 
-                            is_blend_or_ccs = params['is_blend_or_ccs'],
-                            generation_blend_share = network.generators.loc[generator].generation_blend_share,
-                            min_utilisation_rate = params['min_utilisation_rate'], 
-                            max_utilisation_rate = params['max_utilisation_rate']  #                             
-                        )
-                
-            elif technology in network.storage_units.carrier.unique():
-                
-                # get params
-                params = (
-                    network
-                    .storage_units
-                    .loc[ 
-                        ((network.storage_units["carrier"] == technology)
-                        & (network.storage_units["bus"] == bus)
-                        & (network.storage_units["p_nom_extendable"] == True))
-                    ]
-                    .groupby(by='type')
-                    .first()
-                    .melt()
-                    .set_index('variable')
-                    ['value']
-                    .to_dict()
-                )
-
-                network.add(
-                    "StorageUnit",
-                    ci_bus_name + '-' + params['carrier'],
-                    bus = ci_storage_bus_name,
-                    p_nom_extendable = p_nom_extendable,
-                    cyclic_state_of_charge=True,
-                    max_hours=params['max_hours'],
-                    build_year=params['build_year'],
-                    carrier=params['carrier'],
-                    capital_cost=params['capital_cost'],
-                    efficiency_store=params['efficiency_store'],
-                    efficiency_dispatch=params['efficiency_dispatch'],
-                    standing_loss=params['standing_loss'],
-                    lifetime=params['lifetime']
-                )
-                
-                '''
+def _ppa_capacity_factor(network: pypsa.Network, generator_names: pd.Index):
+    """
+    Resolves the capacity factor of a PPA generator from the generators it is copied from.
 
-                TODO!
-                
-                Hydrogen storages need to be modelled with fundamental stores (i.e., PyPSA Store components)
-                
-                This is described in the links below:
-                    - https://fneum.github.io/data-science-for-esm/09-workshop-pypsa.html
-                    - https://groups.google.com/g/pypsa/c/Owf6_6aHhRM
-                    - https://pypsa.readthedocs.io/en/stable/examples/replace-generator-storage-units-with-store.html
-                
-                '''
+    Parameters:
+    -----------
+    network : pypsa.Network
+        The PyPSA network.
+    generator_names : pd.Index
+        The extendable generators of the technology on the bus.
 
-            else:
-                raise ValueError(f"Invalid technology: {technology}")
+    Returns:
+    -----------
+    float or pd.Series
+        A float if the capacity factor is constant over the snapshots: 1 for blends and CCS, or 
+        the static p_max_pu of a generator without a time series. Otherwise the p_max_pu time 
+        series of the first generator.
+    """
+    generator = generator_names[0]
+    if network.generators.at[generator, 'is_blend_or_ccs'] == True:
+        return 1.0
 
-    return network
+    if generator not in network.generators_t.p_max_pu.columns:
+        return float(network.generators.at[generator, 'p_max_pu'])
+
+    cf = network.generators_t.p_max_pu[generator]
+    if (cf == cf.iloc[0]).all():
+        return float(cf.iloc[0])
+    return cf
+
+
+def bus_grid_cfe(GridCFE, bus : str) -> list:
+    '''Returns the hourly GridCFE of a C&I bus from a (snapshots x buses) GridCFE table 
+    (get.grid_cfe), or a single hourly GridCFE that is used for every bus
+    '''
+    if isinstance(GridCFE, pd.DataFrame):
+        return GridCFE[bus].tolist()
+    return list(GridCFE)
 
 
 def apply_cfe_constraint(
         n : pypsa.Network, 
-        GridCFE : list, 
+        GridCFE : pd.DataFrame, 
         ci_buses : list, 
         ci_identifier : str, 
         CFE_Score : float,
         max_excess_export : float,
     ) -> pypsa.Network:
     '''Set CFE constraint
+
+    The annual terms (CFE target and excess) are weighted by the snapshot weightings, so that 
+    they also hold for networks reduced to representative days (see src/screening.py).
     '''
+    weights = snapshot_weights(n)
+
     for bus in ci_buses:
         # ---
         # fetch necessary variables to implement CFE
 
         CI_Demand = (
-            n.loads_t.p_set.filter(regex=bus).filter(regex=ci_identifier).values.flatten()
+            n.loads_t.p_set[ci_components(n, 'load', bus, ci_identifier)].sum(axis=1).values
         )
 
         CI_StorageCharge = (
             n.model.variables['Link-p'].sel(
-                Link=[i for i in n.links.index if ci_identifier in i and 'Charge' in i and bus in i]
+                Link=ci_components(n, 'charge', bus, ci_identifier)
             )
             .sum(dims='Link')
         )
 
         CI_StorageDischarge = (
             n.model.variables['Link-p'].sel(
-                Link=[i for i in n.links.index if ci_identifier in i and 'Discharge' in i and bus in i]
+                Link=ci_components(n, 'discharge', bus, ci_identifier)
             )
             .sum(dims='Link')
         )
 
         CI_GridExport = (
             n.model.variables['Link-p'].sel(
-                Link=[i for i in n.links.index if ci_identifier in i and 'Export' in i and bus in i]
+                Link=ci_components(n, 'export', bus, ci_identifier)
             )
             .sum(dims='Link')
         )
 
         CI_GridImport = (
             n.model.variables['Link-p'].sel(
-                Link=[i for i in n.links.index if ci_identifier in i and 'Import' in i and bus in i]
+                Link=ci_components(n, 'import', bus, ci_identifier)
             )
             .sum(dims='Link')
         )
@@ -367,7 +391,7 @@ def apply_cfe_constraint(
         CI_PPA_Fossil = (
 
         ((n.model.variables['Generator-p'].sel(
-            Generator=[i for i in n.generators.index if ci_identifier in i and 'PPA' in i and bus in i and 'Fossil' in i]
+            Generator=ci_components(n, 'ppa_fossil', bus, ci_identifier)
         )))
         .sum(dims='Generator')
         )
@@ -375,7 +399,7 @@ def apply_cfe_constraint(
         CI_PPA_Clean = (
     
         ((n.model.variables['Generator-p'].sel(
-            Generator=[i for i in n.generators.index if ci_identifier in i and 'PPA' in i and bus in i and 'Clean' in i]
+            Generator=ci_components(n, 'ppa_clean', bus, ci_identifier)
         )))
         .sum(dims='Generator')
         )
@@ -389,9 +413,10 @@ def apply_cfe_constraint(
         )
 
         # Constraint 2: CFE target - note the CI_PPA_Fossil is offset by the share of fossil production which must be exported (set by CFE score)
+        # The grid import terms come first so that update_cfe_grid_coefficients can find them
         # ---------------------------------------------------------------
         n.model.add_constraints(
-            ( CI_PPA_Clean - (CI_GridExport - (CI_PPA_Fossil * CFE_Score) ) + (CI_GridImport * list(GridCFE) ) ).sum() >= ( (CI_StorageCharge - CI_StorageDischarge) + CI_Demand ).sum() * CFE_Score,
+            (CI_GridImport * (weights * bus_grid_cfe(GridCFE, bus)) ).sum() + ( ( CI_PPA_Clean - (CI_GridExport - (CI_PPA_Fossil * CFE_Score) ) ) * weights ).sum() >= ( ( (CI_StorageCharge - CI_StorageDischarge) + CI_Demand ) * weights ).sum() * CFE_Score,
             name=f"cfe-constraint-target-{bus}",
  
         )
@@ -399,7 +424,7 @@ def apply_cfe_constraint(
         # Constraint 3: Excess
         # ---------------------------------------------------------------
         n.model.add_constraints(
-            CI_GridExport.sum() <= sum(CI_Demand) * max_excess_export,
+            (CI_GridExport * weights).sum() <= sum(CI_Demand * weights) * max_excess_export,
             name=f"cfe-constraint-excess-{bus}",
         )
 
@@ -416,5 +441,167 @@ def apply_cfe_constraint(
             CI_GridExport >= CI_PPA_Fossil * CFE_Score,
             name=f"cfe-constraint-fossil-excess-{bus}",
         )
-    
-    return n
\ No newline at end of file
+
+    # the CFE score is a parameter of the model, which update_cfe_score changes in place
+    n.model.parameters["cfe_score"] = CFE_Score
+
+    return n
+
+
+def get_cfe_score(n : pypsa.Network) -> float:
+    '''Returns the CFE score that the CFE constraints of a network's linopy model are set to
+    (see apply_cfe_constraint and update_cfe_score), or None if it has none
+    '''
+    if "cfe_score" not in n.model.parameters:
+        return None
+    return float(n.model.parameters["cfe_score"])
+
+
+def update_cfe_grid_coefficients(
+        n : pypsa.Network, 
+        GridCFE : pd.DataFrame, 
+        ci_buses : list, 
+        ci_identifier : str, 
+        session = None,
+    ) -> pypsa.Network:
+    '''Update the GridCFE coefficients of the CFE target constraint in place
+
+    Between grid CFE iterations only the CI_GridImport * GridCFE terms of the CFE target 
+    constraint change. Instead of removing and re-creating all CFE constraints, this 
+    overwrites those terms on the existing linopy model. The import terms are the first 
+    terms of the constraint (see apply_cfe_constraint). Their variables are written back 
+    too, since linopy drops terms with a zero coefficient (GridCFE = 0) when solving.
+
+    If a solver session (src.solver.SolverSession) is given, the changed coefficients are also 
+    passed on to its native solver model.
+    '''
+    weights = snapshot_weights(n)
+
+    for bus in ci_buses:
+
+        constraint = n.model.constraints[f"cfe-constraint-target-{bus}"]
+
+        # labels of the grid import variables, ordered by snapshot (and import link)
+        import_labels = (
+            n.model.variables['Link-p'].sel(
+                Link=ci_components(n, 'import', bus, ci_identifier)
+            )
+            .labels
+            .transpose('snapshot', 'Link')
+            .values
+        )
+        n_terms = import_labels.size
+
+        variables = constraint.vars.values.copy()
+        coeffs = constraint.coeffs.values.copy()
+
+        if not np.isin(variables[:n_terms], [-1, *import_labels.ravel()]).all():
+            raise ValueError(f"Unexpected term order in cfe-constraint-target-{bus}")
+
+        new_coeffs = np.repeat(weights * np.asarray(bus_grid_cfe(GridCFE, bus), dtype=float), import_labels.shape[1])
+
+        if session is not None:
+            changed = coeffs[:n_terms] != new_coeffs
+            session.change_coefficients(
+                constraint.labels.item(), import_labels.ravel()[changed], new_coeffs[changed]
+            )
+
+        variables[:n_terms] = import_labels.ravel()
+        coeffs[:n_terms] = new_coeffs
+
+        constraint.vars = constraint.vars.copy(data=variables)
+        constraint.coeffs = constraint.coeffs.copy(data=coeffs)
+
+    return n
+
+
+def update_cfe_score(
+        n : pypsa.Network, 
+        CFE_Score : float, 
+        ci_buses : list, 
+        ci_identifier : str, 
+        session = None,
+    ) -> pypsa.Network:
+    '''Update the CFE score of the CFE constraints in place
+
+    The CFE score enters the CFE target constraint (as the coefficient of the fossil PPA 
+    generators and the storage links, and in the right-hand side) and the fossil excess 
+    constraint (as the coefficient of the fossil PPA generators). This overwrites those 
+    coefficients and right-hand sides, so that a model built by apply_cfe_constraint can 
+    be re-used for another CFE score. If a solver session (src.solver.SolverSession) is 
+    given, the changes are also passed on to its native solver model.
+
+    The score is stored as the cfe_score parameter of the model, so that the model can be 
+    swept over scores without being rebuilt; nothing changes if it already has the score.
+    '''
+    if get_cfe_score(n) == CFE_Score:
+        return n
+
+    weights = snapshot_weights(n)
+
+    for bus in ci_buses:
+
+        CI_Demand = (
+            n.loads_t.p_set[ci_components(n, 'load', bus, ci_identifier)].sum(axis=1).values
+        )
+
+        def labels(dim, role):
+            # (snapshot, component) labels of the variables of a role
+            names = ci_components(n, role, bus, ci_identifier)
+            return n.model.variables[f"{dim}-p"].sel({dim: names}).labels.transpose('snapshot', dim).values
+
+        def weighted(labels, coeff):
+            # hourly terms of the CFE target constraint are weighted by the snapshot weightings
+            return dict(zip(labels.ravel(), np.repeat(coeff * weights, labels.shape[1])))
+
+        fossil = labels('Generator', 'ppa_fossil')
+
+        # coefficients of the CFE target constraint (storage terms are moved to the left-hand side)
+        target_coeffs = {
+            **weighted(fossil, CFE_Score),
+            **weighted(labels('Link', 'charge'), -CFE_Score),
+            **weighted(labels('Link', 'discharge'), CFE_Score),
+        }
+        _set_coefficients(
+            n.model.constraints[f"cfe-constraint-target-{bus}"], target_coeffs, session
+        )
+
+        # coefficients of the fossil excess constraint
+        _set_coefficients(
+            n.model.constraints[f"cfe-constraint-fossil-excess-{bus}"],
+            {label: -CFE_Score for label in fossil.ravel()},
+            session,
+        )
+
+        # right-hand side of the CFE target constraint
+        constraint = n.model.constraints[f"cfe-constraint-target-{bus}"]
+        rhs = (CI_Demand * weights).sum() * CFE_Score
+        constraint.rhs = constraint.rhs.copy(data=np.full(constraint.rhs.shape, rhs))
+        if session is not None:
+            session.change_rhs(constraint.labels.values, ">=", rhs)
+
+    n.model.parameters["cfe_score"] = CFE_Score
+
+    return n
+
+
+def _set_coefficients(constraint, new_coeffs : dict, session = None) -> None:
+    '''Set the coefficients of the variables in new_coeffs (label -> coefficient) in a constraint'''
+    variables = constraint.vars.values
+    coeffs = constraint.coeffs.values.copy()
+
+    labels = np.fromiter(new_coeffs.keys(), dtype=int, count=len(new_coeffs))
+    values = np.fromiter(new_coeffs.values(), dtype=float, count=len(new_coeffs))
+    order = np.argsort(labels)
+
+    mask = np.isin(variables, labels)
+    updated = values[order][np.searchsorted(labels[order], variables[mask])]
+
+    if session is not None:
+        con_labels = np.broadcast_to(
+            constraint.labels.values[..., np.newaxis], variables.shape
+        )[mask]
+        session.change_coefficients(con_labels, variables[mask], updated)
+
+    coeffs[mask] = updated
+    constraint.coeffs = constraint.coeffs.copy(data=coeffs)
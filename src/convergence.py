@@ -0,0 +1,160 @@
+import numpy as np
+
+
+def convergence_settings(configs: dict) -> dict:
+    """Returns the settings of the grid CFE fixed-point iteration, with defaults for missing keys."""
+    settings = {
+        "tolerance": 0.01,
+        "norm": "l2",
+        "damping": 1.0,
+        "anderson_depth": 3,
+        "max_iterations": 100,
+        "stall_iterations": 3,
+        "seed": "brownfield",
+    }
+    settings.update(configs.get("grid_cfe_convergence") or {})
+    return settings
+
+
+def residual_norm(residual: np.ndarray, norm: str = "l2") -> float:
+    """Hourly residual norm: the largest absolute change (inf) or the RMS change (l2)."""
+    if residual.size == 0:
+        return 0.0
+    if norm == "inf":
+        return float(np.abs(residual).max())
+    if norm == "l2":
+        return float(np.sqrt(np.mean(residual**2)))
+    raise ValueError(f"Invalid norm: {norm}")
+
+
+class GridCFEConvergence:
+    """
+    Fixed-point iteration on the hourly grid CFE of the C&I buses.
+
+    Each solve of the CFE model maps the grid CFE used as input (x) to the grid CFE of the
+    solved dispatch (g(x)). The iteration has converged when the hourly residual g(x) - x is
+    below the tolerance. The next input is the damped fixed-point step, improved by Anderson
+    acceleration over the last anderson_depth iterations. Hours without any generation (NaN)
+    have no grid supply CFE and are treated as zero.
+
+    Parameters:
+    -----------
+    tolerance : float
+        Convergence tolerance on the residual norm.
+    norm : str
+        "inf" for the largest hourly change, or "l2" for the RMS hourly change.
+    damping : float
+        Step size between 0 and 1. With 1, the next input is the last grid CFE (plain iteration).
+    anderson_depth : int
+        Number of previous iterations used for Anderson acceleration (0 to disable).
+    max_iterations : int
+        Maximum number of solves.
+    stall_iterations : int
+        Stop if the residual norm has not improved for this many iterations.
+    """
+
+    def __init__(
+        self,
+        tolerance: float = 0.01,
+        norm: str = "l2",
+        damping: float = 1.0,
+        anderson_depth: int = 3,
+        max_iterations: int = 100,
+        stall_iterations: int = 3,
+    ):
+        self.tolerance = tolerance
+        self.norm = norm
+        self.damping = damping
+        self.anderson_depth = anderson_depth
+        self.max_iterations = max_iterations
+        self.stall_iterations = stall_iterations
+
+        self.iterations = 0
+        self.residuals = []
+        self.best = np.inf
+        self.best_iteration = None  # solve with the smallest residual
+        self.best_input = None  # grid CFE input of that solve
+        self.since_best = 0
+        self.history = []  # (x, g(x)) of previous iterations
+
+    @property
+    def converged(self) -> bool:
+        # GridCFE is rounded to two decimals, so allow for floating point noise
+        return bool(self.residuals) and self.residuals[-1] <= self.tolerance + 1e-9
+
+    @property
+    def stalled(self) -> bool:
+        return self.since_best >= self.stall_iterations
+
+    @property
+    def best_is_last(self) -> bool:
+        return self.best_iteration == self.iterations
+
+    @property
+    def done(self) -> bool:
+        return self.converged or self.stalled or self.iterations >= self.max_iterations
+
+    def step(self, x, gx) -> np.ndarray:
+        """
+        Records a solve with grid CFE input x and resulting grid CFE gx: hourly vectors, or
+        (snapshots x buses) arrays whose hours and buses are iterated on together.
+
+        Returns:
+        -----------
+        np.ndarray
+            The grid CFE to use as input for the next solve, in the shape of x.
+        """
+        shape = np.shape(x)
+        x = np.nan_to_num(np.asarray(x, dtype=float)).ravel()
+        gx = np.nan_to_num(np.asarray(gx, dtype=float)).ravel()
+
+        self.iterations += 1
+        self.residuals.append(residual_norm(gx - x, self.norm))
+        if self.residuals[-1] < self.best - 1e-9:
+            self.best = self.residuals[-1]
+            self.best_iteration = self.iterations
+            self.best_input = x.reshape(shape)
+            self.since_best = 0
+        else:
+            self.since_best += 1
+
+        self.history.append((x, gx))
+        self.history = self.history[-(self.anderson_depth + 1):]
+
+        x_next = x + self.damping * (gx - x)
+        if len(self.history) > 1:
+            x_anderson = self._anderson()
+            if x_anderson is not None:
+                x_next = x_anderson
+
+        return np.clip(x_next, 0, 1).reshape(shape)
+
+    def _anderson(self):
+        """Anderson (type II) update from the stored history, or None if it is ill-defined."""
+        X = np.array([x for x, _ in self.history]).T
+        G = np.array([gx for _, gx in self.history]).T
+        F = G - X
+
+        dF = np.diff(F, axis=1)
+        dX = np.diff(X, axis=1)
+        if not np.any(dF):
+            return None
+
+        gamma = np.linalg.lstsq(dF, F[:, -1], rcond=None)[0]
+        x_next = (X[:, -1] - dX @ gamma) + self.damping * (F[:, -1] - dF @ gamma)
+
+        if not np.all(np.isfinite(x_next)):
+            return None
+        return x_next
+
+    def summary(self) -> str:
+        if self.converged:
+            state = "converged"
+        elif self.stalled:
+            state = "stalled"
+        else:
+            state = "reached the maximum number of iterations"
+        return (
+            f"Grid CFE iteration {state} after {self.iterations} solves "
+            f"(residual {self.norm}-norm: {self.residuals[-1]:.4f})"
+        )
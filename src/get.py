@@ -1,120 +1,180 @@
 import os
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pypsa
 import pandas as pd
+import xarray as xr
+
+from .metrics import memoise, statistics
+from .registry import ci_components
 
 def get_cfe_score_ts(n, run, ci_identifier='C&I'):
     '''Calculate the CFE score and return it as a time series
     '''
     GridCFE = GetGridCFE(n, ci_identifier=ci_identifier, run=run)
-    CI_Demand = n.loads_t.p.filter(regex=ci_identifier).sum(axis=1)
-    CI_PPA_Clean = n.generators_t.p.filter(regex=ci_identifier).sum(axis=1)
-    CI_PPA_Fossil = n.generators_t.p.filter(regex=ci_identifier).sum(axis=1)
-    CI_GridExport = n.links_t.p0.filter(regex='Exports').sum(axis=1)
-    CI_GridImport = n.links_t.p0.filter(regex='Imports').sum(axis=1)
-    CI_StorageDischarge = n.links_t.p0.filter(regex='Discharge').sum(axis=1)
-    CI_StorageCharge = n.links_t.p0.filter(regex='Charge').sum(axis=1)
-    return (( CI_PPA_Clean + CI_PPA_Fossil - CI_GridExport + (CI_GridImport * list(GridCFE) ) - CI_StorageCharge + CI_StorageDischarge ) / CI_Demand).to_frame(name='CFE Score')
-
-
-def get_ci_cost_summary(n : pypsa.Network) -> pd.DataFrame:
-    '''Returns a summary of the costs for C&I generators, storage units and links
-    '''
-    ci_generator_costs = (
-        n.generators.loc[
-            n.generators.index.str.contains('C&I')
-        ]
-        [['carrier','p_nom','p_nom_opt','capital_cost','marginal_cost', 'p_max_pu']]
-        #.reset_index()
+    CI_Demand = n.loads_t.p.filter(items=ci_components(n, 'load', ci_identifier=ci_identifier)).sum(axis=1)
+    CI_PPA_Clean = n.generators_t.p.filter(items=ci_components(n, 'ppa_clean', ci_identifier=ci_identifier)).sum(axis=1)
+    CI_PPA_Fossil = n.generators_t.p.filter(items=ci_components(n, 'ppa_fossil', ci_identifier=ci_identifier)).sum(axis=1)
+    CI_GridExport = n.links_t.p0.filter(items=ci_components(n, 'export', ci_identifier=ci_identifier)).sum(axis=1)
+    CI_StorageDischarge = n.links_t.p0.filter(items=ci_components(n, 'discharge', ci_identifier=ci_identifier)).sum(axis=1)
+    CI_StorageCharge = n.links_t.p0.filter(items=ci_components(n, 'charge', ci_identifier=ci_identifier)).sum(axis=1)
+    # grid imports of each C&I bus are as clean as the grid of that bus
+    CI_GridImport_Clean = sum(
+        n.links_t.p0.filter(items=ci_components(n, 'import', bus, ci_identifier)).sum(axis=1) * GridCFE[bus].values
+        for bus in GridCFE.columns
     )
+    return (( CI_PPA_Clean + CI_PPA_Fossil - CI_GridExport + CI_GridImport_Clean - CI_StorageCharge + CI_StorageDischarge ) / CI_Demand).to_frame(name='CFE Score')
 
-    ci_generator_p_max_pu = (
-        n.generators_t.p_max_pu.transpose().loc[
-            n.generators_t.p_max_pu.transpose().index.str.contains('C&I')
-        ]
-        .transpose()
-        # [['p_max_pu']]
-        #.reset_index()
-    )
 
-    ci_generator_costs['dispatch'] = n.generators_t.p[ ci_generator_costs.index ].sum()
-    # Calculate potential dispatch accounting for both time-varying and static p_max_pu
-    potential_dispatch = []
-    for gen_id in ci_generator_costs.index:
-        if gen_id in ci_generator_p_max_pu.columns:
-            # Time-varying p_max_pu
-            potential = (ci_generator_costs.loc[gen_id, 'p_nom_opt'] * ci_generator_p_max_pu[gen_id]).sum()
-        else:
-            # Static p_max_pu
-            potential = (ci_generator_costs.loc[gen_id, 'p_nom_opt'] * ci_generator_costs.loc[gen_id, 'p_max_pu'] * len(ci_generator_p_max_pu))
-        potential_dispatch.append(potential)
-    
-    ci_generator_costs['potential_dispatch'] = potential_dispatch
-    ci_generator_costs['curtailment'] = ci_generator_costs['potential_dispatch'] - ci_generator_costs['dispatch']
-    ci_generator_costs['curtailment_perc'] = ci_generator_costs['curtailment']/ci_generator_costs['potential_dispatch']
+# columns of get_ci_cost_summary
+CI_COST_COLUMNS = [
+    'carrier', 'p_nom', 'p_nom_opt', 'capital_cost', 'marginal_cost', 'p_max_pu', 'dispatch', 
+    'potential_dispatch', 'curtailment', 'curtailment_perc', 'capex', 'opex', 'import_cost', 
+    'export_revenue', 'unit_cost',
+]
 
-    # storage
-    ci_storage_costs = (
-        n.storage_units.loc[
-            n.storage_units.index.str.contains('C&I')
-        ]
-        [['carrier','p_nom','p_nom_opt','capital_cost','marginal_cost']]
-        #.reset_index()
-    )
 
-    ci_storage_costs['dispatch'] = n.storage_units_t.p_dispatch[ ci_storage_costs.index ].sum()
+def _column_sums(df: pd.DataFrame, names) -> pd.Series:
+    '''Sums the time series of the given components, with 0 for components without a column 
+    (netCDF files leave out all-zero columns)
+    '''
+    return df.reindex(columns=names, fill_value=0).sum()
+
 
-    # links
-    ci_links_costs = (
-        n.links.loc[
-            n.links.index.str.contains('C&I')
-        ]
-        [['carrier','p_nom','p_nom_opt','capital_cost','marginal_cost']]
-        #.reset_index()
+@memoise
+def _ci_cost_table(n: pypsa.Network) -> pd.DataFrame:
+    '''Returns the C&I generators, storage units and links of a network with their costs, 
+    dispatch, potential dispatch and grid cash flows; one row per component
+    '''
+    static = ['carrier','p_nom','p_nom_opt','capital_cost','marginal_cost']
+
+    # generators, with static or time-varying p_max_pu
+    generators = n.generators.index[n.generators.index.isin(ci_components(n, ['ppa_clean', 'ppa_fossil']))]
+    ci_generator_costs = n.generators.loc[generators, static + ['p_max_pu']]
+    ci_generator_costs['dispatch'] = _column_sums(n.generators_t.p, generators)
+    p_max_pu_sum = n.generators_t.p_max_pu.reindex(columns=generators).sum(min_count=1)
+    ci_generator_costs['potential_dispatch'] = ci_generator_costs['p_nom_opt'] * p_max_pu_sum.fillna(
+        ci_generator_costs['p_max_pu'] * len(n.snapshots)
     )
 
-    # zero link costs because they are virtual
+    # storage
+    storage_units = n.storage_units.index[n.storage_units.index.isin(ci_components(n, 'storage'))]
+    ci_storage_costs = n.storage_units.loc[storage_units, static]
+    ci_storage_costs['dispatch'] = _column_sums(n.storage_units_t.p_dispatch, storage_units)
+
+    # links, with zero costs because they are virtual
+    links = n.links.index[n.links.index.isin(ci_components(n, ['import', 'export', 'charge', 'discharge']))]
+    ci_links_costs = n.links.loc[links, static]
     ci_links_costs['capital_cost'] = 0
     ci_links_costs['marginal_cost'] = 0
+    p0 = n.links_t.p0.reindex(columns=links, fill_value=0)
+    ci_links_costs['dispatch'] = p0.sum()
 
-    ci_links_costs['dispatch'] = n.links_t.p0[ ci_links_costs.index ].sum()
+    # imports are paid at the marginal price of the grid bus they come from
+    imports = links[links.isin(ci_components(n, 'import'))]
+    import_price = n.buses_t.marginal_price.reindex(columns=n.links.loc[imports, 'bus0'], fill_value=0).values
+    ci_links_costs['import_cost'] = pd.Series((p0[imports].values * import_price).sum(axis=0), index=imports)
 
-    df = pd.concat([ci_generator_costs, ci_storage_costs, ci_links_costs]).round(3)
+    # exports earn the mean marginal price of all grid buses
+    exports = links[links.isin(ci_components(n, 'export'))]
+    prices = n.buses_t.marginal_price
+    export_price = prices.loc[:, ~prices.columns.str.contains('C&I')].mean(axis=1).values
+    ci_links_costs['export_revenue'] = pd.Series(-(p0[exports].values * export_price[:, None]).sum(axis=0), index=exports)
 
-    df.loc[:, 'capex'] = df['p_nom_opt'] * df['capital_cost']
-    df.loc[:, 'opex'] = df['dispatch'] * df['marginal_cost']
+    return pd.concat([ci_generator_costs, ci_storage_costs, ci_links_costs])
 
-    # marginal price of the brownfield bus
-    ci_brown_bus = n.buses[n.buses.index.str.contains('C&I')].index.str.split('C&I').str[0].str.strip()[0]
 
-    # calculate import costs
-    import_links_t = n.links_t.p0.filter(regex='C&I').filter(regex='Import').sum(axis=1)
-    import_link_p = n.buses_t.marginal_price[ci_brown_bus]
-    import_cost = ( import_links_t * import_link_p ).sum() 
+def _ci_cost_summary(df: pd.DataFrame) -> pd.DataFrame:
+    '''Derives curtailment, capex, opex and unit costs from C&I cost tables (_ci_cost_table); 
+    works on the table of one network or on the stacked tables of several networks
+    '''
+    df = df.copy()
+    df['curtailment'] = df['potential_dispatch'] - df['dispatch']
+    df['curtailment_perc'] = df['curtailment'] / df['potential_dispatch']
 
-    # append to df
-    df.loc[ df.index.str.contains('Import'), 'import_cost' ] = import_cost
+    rounded = [c for c in CI_COST_COLUMNS[:10] if c in df.columns]
+    df[rounded] = df[rounded].round(3)
 
-    # calculate export revenues
-    export_links_t = n.links_t.p0.filter(regex='C&I').filter(regex='Export').sum(axis=1)
-    export_link_p = n.buses_t.marginal_price.filter(regex='^(?!.*C&I)').mean(axis=1)
-    export_revenue = -( export_links_t * export_link_p ).sum().sum()
+    df['capex'] = df['p_nom_opt'] * df['capital_cost']
+    df['opex'] = df['dispatch'] * df['marginal_cost']
 
-    # append to df
-    df.loc[ df.index.str.contains('Export'), 'export_revenue' ] = export_revenue
+    # other columns (e.g., the name of stacked networks) come last
+    other = [c for c in df.columns if c not in CI_COST_COLUMNS]
+    df = df.reindex(columns=CI_COST_COLUMNS[:-1] + other)
 
     # fillna
-    df.fillna(0, inplace=True)
-
-    df.loc[:, 'unit_cost'] = (df['capex'] + df['opex'] + df['import_cost'] + df['export_revenue']) / df['dispatch']
+    df = df.fillna(0)
 
+    df.insert(len(CI_COST_COLUMNS) - 1, 'unit_cost', (df['capex'] + df['opex'] + df['import_cost'] + df['export_revenue']) / df['dispatch'])
     return df
 
 
+def get_ci_cost_summary(n : pypsa.Network) -> pd.DataFrame:
+    '''Returns a summary of the costs for C&I generators, storage units and links
+    '''
+    return _ci_cost_summary(_ci_cost_table(n))
+
+
+@memoise
+def get_ci_load_served(n: pypsa.Network) -> float:
+    '''Returns the C&I load served in MWh
+    '''
+    return n.loads_t.p.filter(items=ci_components(n, 'load')).sum().sum()
+
+
+def get_ci_cost_summaries(networks) -> pd.DataFrame:
+    '''Returns the C&I cost summaries of several networks (e.g., the solved networks of a run), 
+    stacked with the name of each network and its C&I load
+    '''
+    tables = [
+        _ci_cost_table(n).assign(
+            name=k,
+            ci_load=get_ci_load_served(n),
+        )
+        for k, n in networks.items()
+    ]
+    return _ci_cost_summary(pd.concat(tables))
+
+
+def grid_cfe_incidence(n: pypsa.Network, buses: list, ci_identifier: str = 'C&I') -> dict:
+    '''Returns the grid generators of a network (all generators except C&I assets), their 
+    (generators x buses) incidence with the given buses and a mask of the clean ones (carriers 
+    with co2_emissions <= 0); the inputs of grid_cfe that do not change between solves
+    '''
+    grid = n.generators[~n.generators.index.str.contains(ci_identifier, regex=False)]
+    clean_carriers = n.carriers.index[n.carriers.co2_emissions <= 0]
+    return dict(
+        generators=grid.index,
+        incidence=(grid.bus.values[:, None] == np.asarray(buses, dtype=object)[None, :]).astype(float),
+        clean=grid.carrier.isin(clean_carriers).values,
+    )
+
+
+def grid_cfe(n: pypsa.Network, buses: list, ci_identifier: str = 'C&I', incidence: dict = None) -> pd.DataFrame:
+    '''Returns the hourly grid CFE of the given buses: the clean share of the generation of the 
+    grid generators on each bus, rounded to two decimals; one column per bus. Hours without 
+    generation are NaN. The incidence (grid_cfe_incidence) can be passed in to re-use it between solves.
+    '''
+    if incidence is None:
+        incidence = grid_cfe_incidence(n, buses, ci_identifier)
+
+    p = n.generators_t.p.reindex(columns=incidence['generators'], fill_value=0).values
+    total = p @ incidence['incidence']
+    clean = p[:, incidence['clean']] @ incidence['incidence'][incidence['clean']]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cfe = clean / total
+
+    return pd.DataFrame(cfe, index=n.snapshots, columns=list(buses)).round(2)
+
+
 def GetGridCFE(
     n: pypsa.Network,   
     ci_identifier: str,
     run: dict
-):
+) -> pd.DataFrame:
     """
 
     Calculate the CFE score of a grid, intra- and inter-regionally. Here, we follow the mathematical
@@ -124,15 +184,15 @@ def GetGridCFE(
     -----------
     network : pypsa.Network
         The optimised network for which we are calculating the GridCFE.
-    bus : str
-        The country bus for which we are calculating the GridCFE.
     ci_identifier : str
         The unique identifer used to identify C&I assets.
+    run : dict
+        The run settings; the GridCFE is calculated for each bus in run["nodes_with_ci_load"].
 
     Returns:
     -----------
-    CFE Score: list
-        Hourly resolution CFE scores for each snapshot in the network.
+    CFE Score: pd.DataFrame
+        Hourly resolution CFE scores for each snapshot in the network (rows) and C&I bus (columns).
 
     Let:
     -----------
@@ -140,62 +200,153 @@ def GetGridCFE(
     Z = Inter-regional grid
 
     """
+    return grid_cfe(n, run["nodes_with_ci_load"], ci_identifier)
 
-    
 
-        # get global clean carriers
-    global_clean_carriers = [
-        i
-        for i in n.carriers.query(" co2_emissions <= 0").index.tolist()
-        if i in n.generators.carrier.tolist()
-    ]
+def _network_key(f: str):
+    '''Returns the key of a solved network file (e.g., n_hm_CFE90_2030), or None if it is not one
+    '''
+    if not f.endswith('.nc'):
+        return None
+    if 'brownfield' in f:
+        return 'n_bf'
+    elif 'annual_matching' in f:
+        name = f.split('_')[3].replace('.nc','')
+        cfe = f.split('_')[2]
+        return f'n_am_{cfe}_{name}'
+    elif 'hourly_matching' in f:
+        name = f.split('_')[3].replace('.nc','')
+        cfe = f.split('_')[2]
+        return f'n_hm_{cfe}_{name}'
+    return None
+
+
+# the HDF5 library behind netCDF files is not thread-safe, so files are read one at a time
+_netcdf_lock = threading.Lock()
+
+
+def _load_network(path: str) -> pypsa.Network:
+    '''Loads a solved network
+    '''
+    with _netcdf_lock, xr.open_dataset(path) as ds:
+        ds = ds.load()
+
+    # building the network from the dataset in memory does not need the lock
+    n = pypsa.Network()
+    n.import_from_netcdf(ds)
+    return n
+
+
+class SolvedNetworks(Mapping):
+    '''
+    The solved networks in a directory, keyed as n_bf, n_am_<...>_<year> and n_hm_<...>_<year>.
+
+    Networks are loaded on first access, or in the background after prefetch(), by a pool of 
+    threads. They stay in memory until they are released; stream() loads them one at a time. 
+    The pool is shut down by close(), or at the end of a with block.
+
+    Parameters:
+    -----------
+    path : str
+        Directory with the solved networks (.nc files).
+    max_workers : int
+        Number of networks that are decoded in parallel.
+    '''
 
-    for bus in run["nodes_with_ci_load"]:
-        # get clean generators in R
-        R_clean_generators = n.generators.loc[
-            # clean carriers
-            (n.generators.carrier.isin(global_clean_carriers))
-            &
-            #exclude assets not in R
-            (n.generators.index.str.contains(bus)) &
-            # exclude C&I assets
-            (~n.generators.index.str.contains(ci_identifier))
-        ].index
-
-        # get all generators
-        R_all_generators = n.generators.loc[
-            (~n.generators.index.str.contains(ci_identifier))
-            &
-            (n.generators.index.str.contains(bus)) 
-        ].index
-
-        # calculate CFE sceore
-        total_clean_generation = n.generators_t.p[R_clean_generators].sum(axis=1)
-        total_generation = n.generators_t.p[R_all_generators].sum(axis=1)
-
-    # return CFE score
-    return (total_clean_generation / total_generation).round(2).tolist()
-
-
-def load_from_dir(path) -> dict:
-    '''Loads all networks in a directory into a dictionary
+    def __init__(self, path: str, max_workers: int = 4):
+        self.path = path
+        self.max_workers = max_workers
+        self.files = {}
+        for f in os.listdir(path):
+            key = _network_key(f)
+            if key is not None:
+                self.files[key] = f
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _future(self, key: str):
+        with self._lock:
+            if key not in self._futures:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+                self._futures[key] = self._pool.submit(
+                    _load_network, os.path.join(self.path, self.files[key])
+                )
+            return self._futures[key]
+
+    def __getitem__(self, key: str) -> pypsa.Network:
+        if key not in self.files:
+            raise KeyError(key)
+        return self._future(key).result()
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def prefetch(self, keys: list = None) -> None:
+        '''Starts loading networks (all if keys is None) in the background
+        '''
+        for key in self.files if keys is None else keys:
+            self._future(key)
+
+    def stream(self, keys: list = None):
+        '''Yields the networks (all if keys is None) with their keys, while the next network is 
+        loaded in the background
+        '''
+        keys = list(self.files if keys is None else keys)
+        for i, key in enumerate(keys):
+            self.prefetch(keys[i + 1:i + 2])
+            yield key, self[key]
+
+    def release(self, keys: list = None) -> None:
+        '''Drops loaded networks (all if keys is None); they are loaded again on the next access
+        '''
+        with self._lock:
+            for key in list(self._futures) if keys is None else keys:
+                self._futures.pop(key, None)
+
+    def release_time_series(self, keys: list = None) -> None:
+        '''Drops the time series of loaded networks (all if keys is None), which keep their static 
+        data and cached metrics (see metrics.memoise)
+        '''
+        for key in list(self._futures) if keys is None else keys:
+            drop_time_series(self[key])
+
+    def close(self) -> None:
+        '''Waits for the networks being loaded and shuts down the pool of threads; loaded 
+        networks stay available
+        '''
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def drop_time_series(n: pypsa.Network) -> None:
+    '''Replaces the time series of a network by empty tables with the same snapshots
     '''
-    networks = {}
-    for f in os.listdir(path):
-        if f.endswith('.nc'):
-            if 'brownfield' in f:
-                networks['n_bf'] = pypsa.Network(f'{path}/{f}')
-            elif 'annual_matching' in f:
-                name = f.split('_')[3].replace('.nc','')
-                cfe = f.split('_')[2]
-                networks[f'n_am_{cfe}_{name}'] = pypsa.Network(f'{path}/{f}')
-            elif 'hourly_matching' in f:
-                name = f.split('_')[3].replace('.nc','')
-                cfe = f.split('_')[2]
-                networks[f'n_hm_{cfe}_{name}'] = pypsa.Network(f'{path}/{f}')
-    return networks
+    for c in n.iterate_components():
+        for attr, df in c.dynamic.items():
+            c.dynamic[attr] = df.iloc[:, :0]
 
 
+def load_from_dir(path) -> SolvedNetworks:
+    '''Returns the networks in a directory as a dictionary-like collection, which loads them on 
+    first access (see SolvedNetworks)
+    '''
+    return SolvedNetworks(path)
+
+
+@memoise
 def get_emissions(n: pypsa.Network) -> float:
     '''Returns emissions in tonnes CO2-eq
     '''
@@ -209,6 +360,7 @@ def get_emissions(n: pypsa.Network) -> float:
         .sum()
     )
 
+@memoise
 def get_ci_parent_emissions(n: pypsa.Network, nodes_with_ci_loads) -> float:
     '''Returns hourly emissions in tonnes CO2-eq for the C&I bus
     '''
@@ -227,15 +379,31 @@ def get_ci_parent_emissions(n: pypsa.Network, nodes_with_ci_loads) -> float:
     return emissions_intensity
 
 
+@memoise
+def get_ci_load(n: pypsa.Network) -> float:
+    '''Returns the total C&I load in MWh
+    '''
+    return n.loads_t.p_set.filter(regex='C&I').sum().sum()
+
+
+@memoise
+def get_ci_imports(n: pypsa.Network) -> pd.DataFrame:
+    '''Returns the hourly grid imports of the C&I buses in MW
+    '''
+    return n.links_t.p0.filter(regex='C&I').filter(regex='Import')
+
+
+@memoise
 def get_unit_cost(n : pypsa.Network) -> pd.DataFrame:
     '''Returns the unit cost in $/MWh for each component and carrier
     '''
+    stats = statistics(n)
     return (
         (
-            n.statistics()['Capital Expenditure'] 
-            + n.statistics()['Operational Expenditure']
+            stats['Capital Expenditure'] 
+            + stats['Operational Expenditure']
         )
-        .div(n.statistics()['Supply'])
+        .div(stats['Supply'])
         .round(2)
         .reset_index()
         .rename(columns={'level_0' : 'component','level_1' : 'carrier', 0: 'System Cost [$/MWh]'})
@@ -246,20 +414,22 @@ def get_ci_generation(n : pypsa.Network) -> pd.DataFrame:
     '''
 
     # ci_buses = n.buses[n.buses.index.str.contains('C&I')].index.tolist()
-    ci_generation = n.generators_t.p.filter(regex='C&I').sum().sum()
+    ci_generation = n.generators_t.p.filter(items=ci_components(n, ['ppa_clean', 'ppa_fossil'])).sum().sum()
     ci_generation_df = pd.DataFrame({
         'name': [n.name],
         'ci_generation': [ci_generation]
     })
     return ci_generation_df
 
+@memoise
 def get_total_ci_procurement_cost(n : pypsa.Network) -> pd.DataFrame:
     '''Returns the total annual system cost in M$ for each C&I procured component and carrier
     '''
+    stats = statistics(n, groupby=["bus","carrier"])
     return (
         (
-            n.statistics(groupby=["bus","carrier"])['Capital Expenditure'].fillna(0) 
-            + n.statistics(groupby=["bus","carrier"])['Operational Expenditure'].fillna(0)
+            stats['Capital Expenditure'].fillna(0) 
+            + stats['Operational Expenditure'].fillna(0)
         )
         .div(1e6)
         .round(2)
@@ -270,13 +440,15 @@ def get_total_ci_procurement_cost(n : pypsa.Network) -> pd.DataFrame:
     )
 
 
+@memoise
 def get_total_annual_system_cost(n : pypsa.Network) -> pd.DataFrame:
     '''Returns the total annual system cost in M$ for each component and carrier
     '''
+    stats = statistics(n)
     return (
         (
-            n.statistics()['Capital Expenditure'] 
-            + n.statistics()['Operational Expenditure']
+            stats['Capital Expenditure'] 
+            + stats['Operational Expenditure']
         )
         .div(1e6)
         .round(2)
@@ -285,30 +457,27 @@ def get_total_annual_system_cost(n : pypsa.Network) -> pd.DataFrame:
     )
 
 
+@memoise
 def get_ci_procurement(n, ci_identifier):
     '''Returns the fractional procurement of C&I assets
     '''
-    ci_load = n.loads_t.p.filter(regex=ci_identifier).sum().sum()
+    ci_load = n.loads_t.p.filter(items=ci_components(n, 'load', ci_identifier=ci_identifier)).sum().sum()
     return pd.DataFrame({
         # imports
         'Grid supply' : (
-            n.links_t.p0.filter(regex=ci_identifier).filter(regex='Import').sum().sum(),# / ci_load,
+            n.links_t.p0.filter(items=ci_components(n, 'import', ci_identifier=ci_identifier)).sum().sum(),# / ci_load,
         ),
         # exports
         'Excess' : (
-            n.links_t.p1.filter(regex=ci_identifier).filter(regex='Export').sum().sum(),# / ci_load,
+            n.links_t.p1.filter(items=ci_components(n, 'export', ci_identifier=ci_identifier)).sum().sum(),# / ci_load,
         ),
         # ppa
         'C&I PPA' : (
-            n.generators_t.p[
-                n.generators.loc[
-                    n.generators.index.str.contains(ci_identifier),
-                    ].index
-                ]
+            n.generators_t.p.filter(items=ci_components(n, ['ppa_clean', 'ppa_fossil'], ci_identifier=ci_identifier))
             .sum(axis=1)
             .sum()
-            - n.links_t.p0.filter(regex=ci_identifier).filter(regex='Storage Charge').sum().sum()
-            + n.links_t.p0.filter(regex=ci_identifier).filter(regex='Storage Discharge').sum().sum()
+            - n.links_t.p0.filter(items=ci_components(n, 'charge', ci_identifier=ci_identifier)).sum().sum()
+            + n.links_t.p0.filter(items=ci_components(n, 'discharge', ci_identifier=ci_identifier)).sum().sum()
             #/ ci_load
         ),
     })
@@ -327,7 +496,7 @@ def split_scenario_col(df : pd.DataFrame, col_name: str):
 def get_ci_carriers(n: pypsa.Network) -> pd.DataFrame:
     '''Returns the C&I carriers
     '''
-    ci_carriers = list(n.generators[n.generators.index.str.contains('C&I')].carrier.unique()) + \
-              list(n.storage_units[n.storage_units.index.str.contains('C&I')].carrier.unique())
+    ci_carriers = list(n.generators.loc[ci_components(n, ['ppa_clean', 'ppa_fossil'])].carrier.unique()) + \
+              list(n.storage_units.loc[ci_components(n, 'storage')].carrier.unique())
 
     return (n.carriers.loc[ci_carriers, 'nice_name'])
\ No newline at end of file
@@ -1,5 +1,8 @@
+import copy
+import importlib.metadata
 import os
 import yaml
+import numpy as np
 import pypsa
 
 
@@ -13,8 +16,22 @@ def setup_dir(path_to_dir):
     Returns:
     None
     """
-    if not os.path.exists(path_to_dir):
-        os.makedirs(path_to_dir)
+    os.makedirs(path_to_dir, exist_ok=True)
+
+
+def hash_file(path: str, h) -> None:
+    """Feeds the contents of a file into the hash object h (e.g., hashlib.sha256())."""
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            h.update(chunk)
+
+
+def package_version(name: str) -> str:
+    """Returns the installed version of a package, or an empty string if it is not installed."""
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return ""
 
 
 def load_configs(path):
@@ -42,12 +59,28 @@ def load_configs(path):
     
     return configs
 
+def snapshot_weights(n: pypsa.Network) -> np.ndarray:
+    """
+    Energy weightings of the snapshots (1 for hourly models, see src/screening.py for
+    networks reduced to representative days), to sum hourly terms into annual totals.
+    """
+    return n.snapshot_weightings.generators.values
+
+
+# the decoded solved brownfield of the current run: its path, file signature and network
+_BROWNFIELD_CACHE = {}
+
+
 def load_brownfield_network(run, configs):
     """
     Load a brownfield network from a specified path for use in the CFE run iterations
     This is to prevent:
         a) modifying the brownfield network in each iteration
         b) avoiding re-solving the brownfield network in each iteration
+
+    The netCDF file is only decoded once per run: the decoded network is cached (one brownfield
+    per process, until the file changes or clear_brownfield_cache is called) and each call
+    returns a deep copy of it, which the scenario can modify freely.
     """
 
     brownfield_path = os.path.join(
@@ -57,7 +90,20 @@ def load_brownfield_network(run, configs):
         "brownfield_" + str(configs["global_vars"]["year"]) + ".nc",
     )
 
-    brownfield_original = pypsa.Network()
-    brownfield_original.import_from_netcdf(brownfield_path)
+    stat = os.stat(brownfield_path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+
+    cached = _BROWNFIELD_CACHE.get("path") == brownfield_path and _BROWNFIELD_CACHE.get("signature") == signature
+    if not cached:
+        # drop the previous brownfield before decoding the next one
+        clear_brownfield_cache()
+        brownfield_original = pypsa.Network()
+        brownfield_original.import_from_netcdf(brownfield_path)
+        _BROWNFIELD_CACHE.update(path=brownfield_path, signature=signature, network=brownfield_original)
+
+    return copy.deepcopy(_BROWNFIELD_CACHE["network"])
+
 
-    return brownfield_original
\ No newline at end of file
+def clear_brownfield_cache() -> None:
+    """Releases the brownfield cached by load_brownfield_network (e.g., once the scenarios of a run are solved)."""
+    _BROWNFIELD_CACHE.clear()
@@ -0,0 +1,94 @@
+import hashlib
+import weakref
+from functools import wraps
+
+import pandas as pd
+import pypsa
+
+# metrics of each network by id(network): {"solution": hash, "metrics": {key: value}}
+_cache = {}
+
+# optimised capacities that identify a solution, together with the objective
+SOLUTION_ATTRS = {
+    "generators": "p_nom_opt",
+    "links": "p_nom_opt",
+    "storage_units": "p_nom_opt",
+    "stores": "e_nom_opt",
+    "lines": "s_nom_opt",
+}
+
+
+def solution_hash(n: pypsa.Network) -> str:
+    """Hashes the objective and optimised capacities of a network, so that cached metrics are
+    recomputed if a network is re-solved or modified in place."""
+    h = hashlib.sha256(repr(getattr(n, "objective", None)).encode())
+    h.update(repr(len(n.snapshots)).encode())
+    for list_name, attr in SOLUTION_ATTRS.items():
+        static = getattr(n, list_name)
+        h.update("\0".join(static.index).encode())
+        h.update(static[attr].values.tobytes())
+    return h.hexdigest()
+
+
+def network_metrics(n: pypsa.Network) -> dict:
+    """
+    Returns the metrics cached for a network, emptied if its solution has changed.
+
+    Networks are not hashable, so the cache is keyed by their identity; the entry of a network
+    is removed when the network is garbage collected (e.g., released by get.SolvedNetworks).
+    """
+    key = id(n)
+    solution = solution_hash(n)
+    entry = _cache.get(key)
+    if entry is None:
+        weakref.finalize(n, _cache.pop, key, None)
+    if entry is None or entry["solution"] != solution:
+        entry = _cache[key] = {"solution": solution, "metrics": {}}
+    return entry["metrics"]
+
+
+def memoise(func):
+    """
+    Computes a metric of a network once and returns it from the cache afterwards.
+
+    The key of a metric is the function and its remaining arguments, which must have a stable
+    repr (strings, lists, dicts). Tables are returned as copies, so that callers can modify them.
+    """
+
+    @wraps(func)
+    def wrapper(n, *args, **kwargs):
+        metrics = network_metrics(n)
+        key = (func.__module__, func.__qualname__, repr(args), repr(sorted(kwargs.items())))
+        if key not in metrics:
+            metrics[key] = func(n, *args, **kwargs)
+        value = metrics[key]
+        return value.copy() if isinstance(value, (pd.DataFrame, pd.Series)) else value
+
+    return wrapper
+
+
+def clear_metrics(n: pypsa.Network = None) -> None:
+    """Drops the cached metrics of a network, or of all networks if n is None."""
+    if n is None:
+        for entry in _cache.values():
+            entry["metrics"].clear()
+    elif id(n) in _cache:
+        _cache[id(n)]["metrics"].clear()
+
+
+@memoise
+def statistics(n: pypsa.Network, **kwargs) -> pd.DataFrame:
+    """Returns n.statistics(**kwargs)."""
+    return n.statistics(**kwargs)
+
+
+@memoise
+def expanded_capacity(n: pypsa.Network, **kwargs) -> pd.Series:
+    """Returns n.statistics.expanded_capacity(**kwargs)."""
+    return n.statistics.expanded_capacity(**kwargs)
+
+
+@memoise
+def energy_balance(n: pypsa.Network, **kwargs) -> pd.Series:
+    """Returns n.statistics.energy_balance(**kwargs)."""
+    return n.statistics.energy_balance(**kwargs)
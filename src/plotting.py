@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import plotly.express as px
@@ -8,8 +9,9 @@ import matplotlib.font_manager as fm
 from . import get as cget
 from . import plotting as cplt
 
-def plot_cfe_hmap(n, n_reference, ymax, fields_to_plot, run, ci_identifier='C&I'):
-    '''Plot the CFE score as a heatmap
+def plot_cfe_hmap(cfe_t, procurement_cost, ymax, fields_to_plot):
+    '''Plot the CFE score as a heatmap, from the CFE score time series (get.get_cfe_score_ts) and 
+    the C&I procurement cost (get.get_total_ci_procurement_cost) of a network
     '''
 
     # Add Work Sans font to matplotlib
@@ -18,7 +20,7 @@ def plot_cfe_hmap(n, n_reference, ymax, fields_to_plot, run, ci_identifier='C&I'
     work_sans_font = fm.FontProperties(fname=work_sans_path_light)
     work_sans_font_medium = fm.FontProperties(fname=work_sans_path_medium)
 
-    cfe_t = cget.get_cfe_score_ts(n, run, ci_identifier,)
+    cfe_t = cfe_t.copy()
     cfe_t.index = cfe_t.index #.tz_localize('UTC').tz_convert('Asia/Singapore')
     cfe_t['Hour'] = cfe_t.index.hour + 1
     cfe_t['Day'] = cfe_t.index.day
@@ -34,13 +36,12 @@ def plot_cfe_hmap(n, n_reference, ymax, fields_to_plot, run, ci_identifier='C&I'
     ci_techs = fields_to_plot
 
     cost = (
-        cget
-        .get_total_ci_procurement_cost(n)
+        procurement_cost
         .pivot_table(
             columns='carrier', 
             values='annual_system_cost [M$]'
         )
-        .drop([i for i in cget.get_total_ci_procurement_cost(n).carrier.unique() if i not in ci_techs.values], axis=1)
+        .drop([i for i in procurement_cost.carrier.unique() if i not in ci_techs.values], axis=1)
         .div(1e3)
     )
     if cost.empty: # in the case where there are no C&I nodes in the brownfield network
@@ -63,31 +64,18 @@ def plot_cfe_hmap(n, n_reference, ymax, fields_to_plot, run, ci_identifier='C&I'
     sns.despine(ax=ax0, bottom=False, right=True, top=True)
 
     # heatmap
-    cfe_t.pivot_table(
-        index='Day',
-        columns='Hour',
-        values='CFE Score',
-        aggfunc='mean'
-    ).pipe(
-        sns.heatmap,
+    grid, days, hours = hourly_grid(cfe_t['CFE Score'], cfe_t['Day'], cfe_t['Hour'])
+    image = draw_heatmap(
+        ax1,
+        grid,
         cmap=sns.color_palette("blend:#000000,#c4ffdc", as_cmap=True),
-        ax=ax1,
-        cbar_kws={
-            'orientation':'vertical', 
-            'shrink':0.5,
-            'pad':0.03,
-            'ticks': [0, 1],
-            'format': '%.0f'
-        },
-        square=True,
-        xticklabels=11,
-        yticklabels=15,
-        linecolor='white',
-        linewidths=0.1,
-        vmin=0,
-        vmax=1,
+        xticklabels=hours[::11],
+        yticklabels=days[::15],
+        xstep=11,
+        ystep=15,
     )
-    colorbar = ax1.collections[0].colorbar
+    colorbar = f.colorbar(image, ax=ax1, orientation='vertical', shrink=0.5, pad=0.03, ticks=[0, 1], format='%.0f')
+    colorbar.outline.set_linewidth(0)
     colorbar.set_ticks([0, 1])
     colorbar.set_ticklabels(['100%\nDirty', '100%\nClean'], fontproperties = work_sans_font)
 
@@ -99,8 +87,8 @@ def plot_cfe_hmap(n, n_reference, ymax, fields_to_plot, run, ci_identifier='C&I'
     return f, ax0, ax1
 
 
-def plot_monthly_cfe_hmap(n, run, ci_identifier='C&I'):
-    '''Plot the CFE score as a heatmap
+def plot_monthly_cfe_hmap(cfe_t):
+    '''Plot the CFE score time series (get.get_cfe_score_ts) of a network as a heatmap per month
     '''
 
     # Add Work Sans font to matplotlib
@@ -109,7 +97,7 @@ def plot_monthly_cfe_hmap(n, run, ci_identifier='C&I'):
     work_sans_font = fm.FontProperties(fname=work_sans_path_light)
     work_sans_font_medium = fm.FontProperties(fname=work_sans_path_medium)
 
-    cfe_t = cget.get_cfe_score_ts(n, run, ci_identifier)
+    cfe_t = cfe_t.copy()
     cfe_t.index = cfe_t.index 
     cfe_t['Hour'] = cfe_t.index.hour + 1
     cfe_t['Day'] = cfe_t.index.day
@@ -126,34 +114,84 @@ def plot_monthly_cfe_hmap(n, run, ci_identifier='C&I'):
     cbar_ax = fig.add_axes([.91, .3, .03, .4])
 
     for i, (month, group) in enumerate(cfe_t.groupby('Month', sort=False)):
-        # Pivot to get days on y-axis, hours on x-axis
-        pivot_table = group.pivot_table(index='Day', columns='Hour', values='CFE Score', aggfunc='mean')
-        sns.heatmap(
-            pivot_table,
-            ax=axes[i],
+        # days on y-axis, hours on x-axis
+        grid, days, hours = hourly_grid(group['CFE Score'], group['Day'], group['Hour'])
+        image = draw_heatmap(
+            axes[i],
+            grid,
             cmap=sns.color_palette("blend:#000000,#c4ffdc", as_cmap=True),
-            cbar=i == 0,
-            square=True,
-            xticklabels=11,
-            yticklabels=15,
-            linecolor='white',
-            linewidths=0.1,
-            vmin=0,
-            vmax=1,
-            cbar_ax=None if i else cbar_ax
-            )
+            xticklabels=hours[::11],
+            yticklabels=days[::15],
+            xstep=11,
+            ystep=15,
+        )
+        if i == 0:
+            first_image = image
         axes[i].set_title(months_name[i])
         axes[i].invert_yaxis()
         axes[i].set_xlabel('')
         axes[i].set_ylabel('')
         axes[i].set_xticklabels(['Morning', 'Noon', 'Evening'], fontproperties=work_sans_font)
 
-    cbar = fig.colorbar(axes[0].collections[0], cax=cbar_ax)
+    cbar = fig.colorbar(first_image, cax=cbar_ax)
     cbar.set_ticks([0.0, 1.0])
     cbar.set_ticklabels(['100% Dirty', '100% Clean'])
     return fig,axes
 
 
+def hourly_grid(values, days, hours):
+    '''Averages values into a days x hours array, like a pivot table of the mean by day and hour
+
+    Returns the array (NaN where there are no values) and the days and hours of its rows and columns
+    '''
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    day_index, day_labels = pd.factorize(np.asarray(days)[valid], sort=True)
+    hour_index, hour_labels = pd.factorize(np.asarray(hours)[valid], sort=True)
+
+    total = np.zeros((len(day_labels), len(hour_labels)))
+    count = np.zeros((len(day_labels), len(hour_labels)))
+    np.add.at(total, (day_index, hour_index), values[valid])
+    np.add.at(count, (day_index, hour_index), 1)
+    with np.errstate(invalid='ignore'):
+        return total / count, np.asarray(day_labels), np.asarray(hour_labels)
+
+
+def draw_heatmap(ax, grid, cmap, vmin=0, vmax=1, xticklabels=None, yticklabels=None, xstep=1, ystep=1, gridlines=True):
+    '''Draws a days x hours array as a heatmap with a single image, laid out like sns.heatmap
+
+    Cells are drawn as one raster image (instead of one patch per cell). Gridlines between the 
+    cells are optional and drawn as vector lines on top. Returns the image, e.g. for a colorbar.
+    '''
+    nrows, ncols = grid.shape
+    image = ax.imshow(
+        np.ma.masked_invalid(grid),
+        cmap=cmap,
+        vmin=vmin,
+        vmax=vmax,
+        extent=(0, ncols, nrows, 0),
+        interpolation='nearest',
+        aspect='equal',
+    )
+    if gridlines:
+        # not antialiased, like the cell edges of sns.heatmap, so that thin lines stay visible
+        ax.hlines(np.arange(nrows + 1), 0, ncols, colors='white', linewidth=0.1, antialiased=False)
+        ax.vlines(np.arange(ncols + 1), 0, nrows, colors='white', linewidth=0.1, antialiased=False)
+
+    # matrix layout: first row at the top, ticks at the centre of every xstep-th / ystep-th cell
+    ax.set_xlim(0, ncols)
+    ax.set_ylim(nrows, 0)
+    ax.set_xticks(np.arange(0, ncols, xstep) + 0.5)
+    ax.set_yticks(np.arange(0, nrows, ystep) + 0.5)
+    if xticklabels is not None:
+        ax.set_xticklabels(xticklabels)
+    if yticklabels is not None:
+        ax.set_yticklabels(yticklabels, rotation='vertical', va='center')
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    return image
+
+
 def bar_plot_2row(
         width_ratios=[1,8],
         figsize=(10, 5),
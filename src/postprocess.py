@@ -1,5 +1,11 @@
+import datetime
+import json
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
+import matplotlib
 import numpy as np
 import pandas as pd
 import seaborn as sns
@@ -10,10 +16,131 @@ from matplotlib.ticker import MaxNLocator
 
 from . import plotting as cplt
 from . import get as cget
+from . import metrics as cmetrics
 
-def plot_results(path_to_run_dir: str, run: dict, nodes_with_ci_loads):
-    '''Plot results for a given run
+# default formats of the summary figures and of the (much larger) CFE score heatmaps
+FIGURE_FORMATS = ('png', 'svg')
+HEATMAP_FORMATS = ('png',)
+
+PLOTS_MANIFEST_NAME = 'plots_manifest.json'
+
+# jobs of the render stage; forked workers inherit them (and the networks they refer to)
+# instead of receiving them pickled
+_render_jobs = []
+
+
+def plot_settings(configs: dict = None) -> dict:
+    '''Returns the plot settings, with defaults for missing keys
+    '''
+    plots = (configs or {}).get('plots') or {}
+    return {
+        'workers': plots.get('workers', 1),
+        'formats': {**{f: f in FIGURE_FORMATS for f in ['png', 'svg']}, **(plots.get('formats') or {})},
+        'heatmap_formats': {**{f: f in HEATMAP_FORMATS for f in ['png', 'svg']}, **(plots.get('heatmap_formats') or {})},
+    }
+
+
+def enabled_formats(toggles: dict) -> tuple:
+    '''Returns the formats that are switched on in a dictionary of format toggles
+    '''
+    return tuple(f for f, enabled in toggles.items() if enabled)
+
+
+def save_figure(fig, path_to_run_dir: str, name: str, formats=FIGURE_FORMATS) -> list:
+    '''Saves a figure to the results directory in each format, closes it and returns the saved files
+    '''
+    files = []
+    for fmt in formats:
+        file = os.path.join('results', f'{name}.{fmt}')
+        fig.savefig(os.path.join(path_to_run_dir, file), bbox_inches='tight')
+        files.append(file)
+    plt.close(fig)
+    return files
+
+
+def figure_job(name: str, func, **kwargs) -> dict:
+    '''Returns a render job: a plot function that returns the files it saved, and its arguments
+    '''
+    return {'name': name, 'func': func, 'kwargs': kwargs}
+
+
+def _init_render_worker():
+    matplotlib.use('Agg', force=True)
+
+
+def _render_job(i: int) -> list:
+    job = _render_jobs[i]
+    return job['func'](**job['kwargs'])
+
+
+def render(jobs: list, workers: int = 1) -> dict:
+    '''
+    Renders figure jobs (see figure_job) and returns the files saved by each job, by name.
+
+    With more than one worker, jobs are rendered by forked processes with the Agg backend. The 
+    workers share the networks and cached metrics of this process, so the plot data should be 
+    computed before (see precompute_metrics). Jobs are rendered in this process where fork is 
+    not available (e.g., on Windows) or while other threads run (e.g., loading networks, see 
+    get.SolvedNetworks.close), as forked processes can deadlock on the locks those threads hold.
+    '''
+    global _render_jobs
+    workers = min(workers, len(jobs))
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods() or threading.active_count() > 1:
+        return {job['name']: job['func'](**job['kwargs']) for job in jobs}
+
+    _render_jobs = jobs
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, 
+            mp_context=multiprocessing.get_context('fork'), 
+            initializer=_init_render_worker,
+        ) as pool:
+            files = list(pool.map(_render_job, range(len(jobs))))
+    finally:
+        _render_jobs = []
+    return {job['name']: f for job, f in zip(jobs, files)}
+
+
+def precompute_metrics(n, nodes_with_ci_loads):
+    '''Computes the metrics of a network used by the summary plots (see metrics.memoise), which 
+    then only need its static data
+    '''
+    cmetrics.statistics(n)
+    cmetrics.statistics(n, groupby=['bus', 'carrier'])
+    cmetrics.expanded_capacity(n)
+    cmetrics.energy_balance(n)
+    cget.get_emissions(n)
+    cget.get_ci_parent_emissions(n, nodes_with_ci_loads)
+    cget.get_ci_load(n)
+    cget.get_ci_imports(n)
+    cget.get_total_annual_system_cost(n)
+    cget.get_total_ci_procurement_cost(n)
+    cget.get_ci_procurement(n, 'C&I')
+    cget.get_ci_cost_summary(n)
+    cget.get_ci_load_served(n)
+
+
+def write_plots_manifest(path_to_run_dir: str, figures: dict, settings: dict) -> None:
+    '''Writes the files produced by each figure to the results directory
+    '''
+    manifest = {
+        'figures': figures,
+        'formats': settings['formats'],
+        'heatmap_formats': settings['heatmap_formats'],
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    path = os.path.join(path_to_run_dir, 'results', PLOTS_MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def plot_results(path_to_run_dir: str, run: dict, nodes_with_ci_loads, configs: dict = None) -> dict:
+    '''Plot results for a given run and return the files produced by each figure
     '''
+    settings = plot_settings(configs)
+    formats = enabled_formats(settings['formats'])
+    heatmap_formats = enabled_formats(settings['heatmap_formats'])
 
     # set tz plotting theme
     cplt.set_tz_theme()
@@ -23,104 +150,87 @@ def plot_results(path_to_run_dir: str, run: dict, nodes_with_ci_loads):
     if not os.path.exists(os.path.join(path_to_run_dir, 'results')):
         os.makedirs(os.path.join(path_to_run_dir, 'results'))
 
-    # load solved networks
-    solved_networks = (
-        cget.load_from_dir(
-            os.path.join(
-                path_to_run_dir, 'solved_networks'
-            )
-        )
-    )
-
-    # load list of C&I carriers to be plot
-    ci_carriers = cget.get_ci_carriers(solved_networks['n_bf'])
-
     # Add Work Sans font to matplotlib
     work_sans_path_light = './assets/WorkSans-Light.ttf'
     work_sans_path_medium = './assets/WorkSans-Medium.ttf'
     work_sans_font = fm.FontProperties(fname=work_sans_path_light)
     work_sans_font_medium = fm.FontProperties(fname=work_sans_path_medium)
     # plt.rcParams['font.family'] = work_sans_font.get_name()
-    
-    plot_ci_portfolio_capacity(solved_networks=solved_networks,
-                               path_to_run_dir=path_to_run_dir,
-                               work_sans_font=work_sans_font)
-    
-    plot_ci_portfolio_procurement_cost(solved_networks=solved_networks,
-                                       path_to_run_dir=path_to_run_dir,
-                                       work_sans_font=work_sans_font)
-    
-    plot_ci_and_parent_generation(solved_networks=solved_networks,
-                                  path_to_run_dir=path_to_run_dir,
-                                  nodes_with_ci_loads=nodes_with_ci_loads,
-                                  work_sans_font=work_sans_font)
-
-    plot_ci_and_parent_capacity(solved_networks=solved_networks,
-                                  path_to_run_dir=path_to_run_dir,
-                                  nodes_with_ci_loads=nodes_with_ci_loads,
-                                  work_sans_font=work_sans_font)
-    
-    plot_ci_energy_balance(solved_networks=solved_networks,
-                                       path_to_run_dir=path_to_run_dir,
-                                       work_sans_font=work_sans_font)
 
-    plot_ci_unit_cost_of_electricity(solved_networks=solved_networks,
-                                     path_to_run_dir=path_to_run_dir,
-                                     work_sans_font=work_sans_font)
-    
-    plot_ci_unit_cost_of_electricity_alt(solved_networks=solved_networks,
-                                        path_to_run_dir=path_to_run_dir,
-                                        import_tariff=83.56, # in USD/MWh
-                                        export_tariff=36.33, # in USD/MWh
-                                        work_sans_font=work_sans_font)
-
-    plot_relative_emissions_by_scenario(solved_networks=solved_networks,
-                                        path_to_run_dir=path_to_run_dir,
-                                        work_sans_font=work_sans_font)
-
-    plot_system_emission_rate_by_scenario(solved_networks=solved_networks,
-                                          path_to_run_dir=path_to_run_dir,
-                                          work_sans_font=work_sans_font)
-    
-    plot_ci_emission_rate_by_scenario(solved_networks=solved_networks,
-                                      path_to_run_dir=path_to_run_dir,
-                                      nodes_with_ci_loads=nodes_with_ci_loads,
-                                      run=run,
-                                      work_sans_font=work_sans_font)
-
-    plot_total_system_costs_by_scenario(solved_networks=solved_networks,
-                                        path_to_run_dir=path_to_run_dir,
-                                        work_sans_font=work_sans_font)
-
-    plot_system_generation_mix(solved_networks=solved_networks,
-                               path_to_run_dir=path_to_run_dir,
-                               work_sans_font=work_sans_font)
-    
-    plot_system_capacity_mix(solved_networks=solved_networks,
-                             path_to_run_dir=path_to_run_dir,
-                             work_sans_font=work_sans_font)
+    # load solved networks one at a time: the plot data of each network is computed once here, 
+    # after which only its static data is kept, so that the render jobs only draw
+    with cget.load_from_dir(os.path.join(path_to_run_dir, 'solved_networks')) as solved_networks:
+        hmap_data = {}
+        for k, n in solved_networks.stream():
+            precompute_metrics(n, nodes_with_ci_loads)
+            hmap_data[k] = cfe_score_heatmap_data(n, run)
+            solved_networks.release_time_series([k])
+        hmap_ci_carriers, hmap_ymax = cfe_score_heatmap_scale(solved_networks)
+
+    # the loader threads are shut down at the end of the with block, before the render workers are 
+    # forked (see render)
+    figure_args = dict(solved_networks=solved_networks, path_to_run_dir=path_to_run_dir, formats=formats)
+    heatmap_args = dict(path_to_run_dir=path_to_run_dir, work_sans_font_medium=work_sans_font_medium, formats=heatmap_formats)
+
+    jobs = [
+        figure_job('ci_portfolio_capacity', plot_ci_portfolio_capacity, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_portfolio_procurement_cost', plot_ci_portfolio_procurement_cost, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_and_parent_generation', plot_ci_and_parent_generation, 
+                   nodes_with_ci_loads=nodes_with_ci_loads, work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_and_parent_capacity', plot_ci_and_parent_capacity, 
+                   nodes_with_ci_loads=nodes_with_ci_loads, work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_energy_balance', plot_ci_energy_balance, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_unit_cost_of_electricity', plot_ci_unit_cost_of_electricity, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_unit_cost_of_electricity_alt', plot_ci_unit_cost_of_electricity_alt, 
+                   import_tariff=83.56, # in USD/MWh
+                   export_tariff=36.33, # in USD/MWh
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('relative_emissions_by_scenario', plot_relative_emissions_by_scenario, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('system_emission_rate_by_scenario', plot_system_emission_rate_by_scenario, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_emission_rate_by_scenario', plot_ci_emission_rate_by_scenario, 
+                   nodes_with_ci_loads=nodes_with_ci_loads, run=run, work_sans_font=work_sans_font, **figure_args),
+        figure_job('total_system_costs_by_scenario', plot_total_system_costs_by_scenario, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('system_generation_mix', plot_system_generation_mix, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('system_capacity_mix', plot_system_capacity_mix, 
+                   work_sans_font=work_sans_font, **figure_args),
+        # needs cget.get_unit_cost in precompute_metrics
+        # figure_job('system_unit_cost_by_scenario', plot_system_unit_cost_by_scenario, 
+        #            work_sans_font=work_sans_font, **figure_args),
+        figure_job('system_costs_vs_benefits', plot_system_costs_vs_benefits, 
+                   work_sans_font=work_sans_font, **figure_args),
+        figure_job('ci_curtailment', plot_ci_curtailment, 
+                   work_sans_font=work_sans_font, **figure_args),
+    ]
 
-    # plot_system_unit_cost_by_scenario(solved_networks=solved_networks,
-    #                                   path_to_run_dir=path_to_run_dir,
-    #                                   work_sans_font=work_sans_font)
+    figures = render(jobs, workers=settings['workers'])
 
-    plot_system_costs_vs_benefits(solved_networks=solved_networks,
-                                                path_to_run_dir=path_to_run_dir,
-                                                work_sans_font=work_sans_font)
-    
-    plot_ci_curtailment(solved_networks=solved_networks,
-                        path_to_run_dir=path_to_run_dir,
-                        work_sans_font=work_sans_font)
-
-    plot_cfe_score_heatmaps(solved_networks=solved_networks,
-                            path_to_run_dir=path_to_run_dir,
-                            run=run,
-                            work_sans_font_medium=work_sans_font_medium)
-    
-    plot_monthly_cfe_score_heatmaps(solved_networks=solved_networks,
-                                    path_to_run_dir=path_to_run_dir,
-                                    run=run,
-                                    work_sans_font_medium=work_sans_font_medium)
+    # the heatmaps are drawn from their data alone, so the networks are no longer needed
+    solved_networks.release()
+
+    # one job per heatmap and scenario
+    print('Creating heatmaps of CFE score')
+    jobs = [
+        figure_job(f'cfe_score_heatmap_{k}', plot_cfe_score_heatmap, k=k, **data, 
+                   ci_carriers=hmap_ci_carriers, ymax=hmap_ymax, **heatmap_args)
+        for k, data in hmap_data.items()
+    ]
+    jobs += [
+        figure_job(f'monthly_cfe_score_heatmap_{k}', plot_monthly_cfe_score_heatmap, k=k, cfe_t=data['cfe_t'], 
+                   **heatmap_args)
+        for k, data in hmap_data.items()
+    ]
+    figures.update(render(jobs, workers=settings['workers']))
+
+    write_plots_manifest(path_to_run_dir, figures, settings)
+    return figures
 
 
 def aggregate_capacity(
@@ -159,7 +269,7 @@ def aggregate_capacity(
         )
     )
 
-def plot_ci_portfolio_capacity(solved_networks, path_to_run_dir, work_sans_font):
+def plot_ci_portfolio_capacity(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot C&I Portfolio Capacity [GW] by scenario.
     """
@@ -170,8 +280,8 @@ def plot_ci_portfolio_capacity(solved_networks, path_to_run_dir, work_sans_font)
     expanded_capacity = (
         pd.concat(
             [
-                solved_networks[k]
-                .statistics.expanded_capacity()
+                cmetrics
+                .expanded_capacity(solved_networks[k])
                 .reset_index()
                 .rename(columns={0:'capacity'})
                 .assign(name=k) 
@@ -245,21 +355,12 @@ def plot_ci_portfolio_capacity(solved_networks, path_to_run_dir, work_sans_font)
     # Adjust horizontal space between ax0 and ax1
     fig.subplots_adjust(wspace=0.1)
 
-    # save
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/01_ci_capacity.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/01_ci_capacity.svg'
-        ),
-        bbox_inches='tight'
-    )
+    # save plot
+    files = save_figure(fig, path_to_run_dir, '01_ci_capacity', formats)
 
-def plot_ci_and_parent_generation(solved_networks, path_to_run_dir, nodes_with_ci_loads, work_sans_font):
+    return files
+
+def plot_ci_and_parent_generation(solved_networks, path_to_run_dir, nodes_with_ci_loads, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot generation mix by scenario for C&I and parent node.
     """
@@ -268,8 +369,8 @@ def plot_ci_and_parent_generation(solved_networks, path_to_run_dir, nodes_with_c
     generation_mix = (
         pd.concat(
             [
-                solved_networks[k].statistics(
-                    groupby=['bus', 'carrier']
+                cmetrics.statistics(
+                    solved_networks[k], groupby=['bus', 'carrier']
                 )[['Supply']].assign(name=k)
                 for k in solved_networks.keys()
             ],
@@ -362,20 +463,11 @@ def plot_ci_and_parent_generation(solved_networks, path_to_run_dir, nodes_with_c
         text.set_fontproperties(work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/03_ci_parent_generation.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/03_ci_parent_generation.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '03_ci_parent_generation', formats)
 
-def plot_ci_and_parent_capacity(solved_networks, path_to_run_dir, nodes_with_ci_loads, work_sans_font):
+    return files
+
+def plot_ci_and_parent_capacity(solved_networks, path_to_run_dir, nodes_with_ci_loads, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot capacity mix by scenario for C&I and parent node.
     """
@@ -384,8 +476,8 @@ def plot_ci_and_parent_capacity(solved_networks, path_to_run_dir, nodes_with_ci_
     capacity_mix = (
         pd.concat(
             [
-                solved_networks[k].statistics(
-                    groupby=['bus', 'carrier']
+                cmetrics.statistics(
+                    solved_networks[k], groupby=['bus', 'carrier']
                 )[["Optimal Capacity"]].assign(name=k)
                 for k in solved_networks.keys()
             ],
@@ -478,20 +570,11 @@ def plot_ci_and_parent_capacity(solved_networks, path_to_run_dir, nodes_with_ci_
         text.set_fontproperties(work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/04_ci_parent_capacity.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/04_ci_parent_capacity.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '04_ci_parent_capacity', formats)
 
-def plot_ci_portfolio_procurement_cost(solved_networks, path_to_run_dir, work_sans_font):
+    return files
+
+def plot_ci_portfolio_procurement_cost(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot C&I Portfolio Procurement cost [currency] by scenario.
     """
@@ -579,21 +662,12 @@ def plot_ci_portfolio_procurement_cost(solved_networks, path_to_run_dir, work_sa
     # Adjust horizontal space between ax0 and ax1
     fig.subplots_adjust(wspace=0.1)
 
-    # save
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/02_ci_total_cost.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/02_ci_total_cost.svg'
-        ),
-        bbox_inches='tight'
-    )
+    # save plot
+    files = save_figure(fig, path_to_run_dir, '02_ci_total_cost', formats)
+
+    return files
 
-def plot_relative_emissions_by_scenario(solved_networks, path_to_run_dir, work_sans_font):
+def plot_relative_emissions_by_scenario(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot relative emissions reduction by scenario compared to baseline.
     """
@@ -658,20 +732,11 @@ def plot_relative_emissions_by_scenario(solved_networks, path_to_run_dir, work_s
     ax1.set_xlabel('CFE Score [%]', fontproperties=work_sans_font)
     
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/07_system_emissions_reduction.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/07_system_emissions_reduction.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '07_system_emissions_reduction', formats)
+
+    return files
 
-def plot_system_emission_rate_by_scenario(solved_networks, path_to_run_dir, work_sans_font):
+def plot_system_emission_rate_by_scenario(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot system emission rate [gCO2/kWh] by scenario.
     """
@@ -685,7 +750,7 @@ def plot_system_emission_rate_by_scenario(solved_networks, path_to_run_dir, work
         .DataFrame({
             'name' : [k for k in solved_networks.keys()],
             'emission' : [cget.get_emissions(n) for n in solved_networks.values()],
-            'generation' : [solved_networks[k].statistics.energy_balance().loc['Generator'].sum() for k in solved_networks.keys()],
+            'generation' : [cmetrics.energy_balance(solved_networks[k]).loc['Generator'].sum() for k in solved_networks.keys()],
         })
         .pipe(
             cget.split_scenario_col,
@@ -746,20 +811,11 @@ def plot_system_emission_rate_by_scenario(solved_networks, path_to_run_dir, work
     ax2.set_xlabel('CFE Score [%]', fontproperties=work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/08_system_emissions.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/08_system_emissions.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '08_system_emissions', formats)
+
+    return files
 
-def plot_ci_emission_rate_by_scenario(solved_networks, path_to_run_dir, nodes_with_ci_loads, run, work_sans_font):
+def plot_ci_emission_rate_by_scenario(solved_networks, path_to_run_dir, nodes_with_ci_loads, run, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot C&I emission rate [gCO2/kWh] by scenario.
     """
@@ -772,10 +828,10 @@ def plot_ci_emission_rate_by_scenario(solved_networks, path_to_run_dir, nodes_wi
         pd
         .DataFrame({
             'name' : [k for k in solved_networks.keys()],
-            'load' : [solved_networks[k].loads_t.p_set.filter(regex='C&I').sum().sum() for k in solved_networks.keys()],
+            'load' : [cget.get_ci_load(solved_networks[k]) for k in solved_networks.keys()],
             'emissions' : [
                 np.sum(
-                    solved_networks[k].links_t.p0.filter(regex='C&I').filter(regex='Import').values.flatten() @ np.array(cget.get_ci_parent_emissions(solved_networks[k], nodes_with_ci_loads))
+                    cget.get_ci_imports(solved_networks[k]).values.flatten() @ np.array(cget.get_ci_parent_emissions(solved_networks[k], nodes_with_ci_loads))
                 ) 
                 for k in solved_networks.keys()
             ],
@@ -835,20 +891,11 @@ def plot_ci_emission_rate_by_scenario(solved_networks, path_to_run_dir, nodes_wi
     ax1.set_xlabel('CFE Score [%]', fontproperties=work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/09_ci_emissions_rate.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/09_ci_emissions_rate.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '09_ci_emissions_rate', formats)
+
+    return files
 
-def plot_total_system_costs_by_scenario(solved_networks, path_to_run_dir, work_sans_font):
+def plot_total_system_costs_by_scenario(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot total system costs by scenario (Reference, 100% RES, CFE).
     """
@@ -951,20 +998,11 @@ def plot_total_system_costs_by_scenario(solved_networks, path_to_run_dir, work_s
         text.set_fontproperties(work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/10_system_costs.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/10_system_costs.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '10_system_costs', formats)
+
+    return files
 
-def plot_system_generation_mix(solved_networks, path_to_run_dir, work_sans_font):
+def plot_system_generation_mix(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot system generation mix by scenario.
     """
@@ -975,7 +1013,7 @@ def plot_system_generation_mix(solved_networks, path_to_run_dir, work_sans_font)
     generation_mix = (
         pd.concat(
             [
-                solved_networks[k].statistics()[['Supply']].assign(name=k) 
+                cmetrics.statistics(solved_networks[k])[['Supply']].assign(name=k) 
                 for k in solved_networks.keys()
             ], 
         axis=0
@@ -1063,20 +1101,11 @@ def plot_system_generation_mix(solved_networks, path_to_run_dir, work_sans_font)
         text.set_fontproperties(work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/11_system_generation.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/11_system_generation.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '11_system_generation', formats)
 
-def plot_system_capacity_mix(solved_networks, path_to_run_dir, work_sans_font):
+    return files
+
+def plot_system_capacity_mix(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot system capacity mix by scenario.
     """
@@ -1087,7 +1116,7 @@ def plot_system_capacity_mix(solved_networks, path_to_run_dir, work_sans_font):
     capacity_mix = (
         pd.concat(
             [
-                solved_networks[k].statistics()[['Optimal Capacity']].assign(name=k) 
+                cmetrics.statistics(solved_networks[k])[['Optimal Capacity']].assign(name=k) 
                 for k in solved_networks.keys()
             ], 
         axis=0
@@ -1175,20 +1204,11 @@ def plot_system_capacity_mix(solved_networks, path_to_run_dir, work_sans_font):
         text.set_fontproperties(work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/12_system_capacity.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/12_system_capacity.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '12_system_capacity', formats)
 
-def plot_ci_energy_balance(solved_networks, path_to_run_dir, work_sans_font):
+    return files
+
+def plot_ci_energy_balance(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot C&I energy balance by scenario.
     """
@@ -1269,20 +1289,11 @@ def plot_ci_energy_balance(solved_networks, path_to_run_dir, work_sans_font):
     fig.subplots_adjust(wspace=0.1)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/05_ci_energy_balance.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/05_ci_energy_balance.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '05_ci_energy_balance', formats)
 
-def plot_ci_unit_cost_of_electricity(solved_networks, path_to_run_dir, work_sans_font):
+    return files
+
+def plot_ci_unit_cost_of_electricity(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot unit cost of electricity (USD/MWh) for C&I by scenario.
     This is calculated assuming that import and export costs are as per the model marginal price.
@@ -1302,16 +1313,7 @@ def plot_ci_unit_cost_of_electricity(solved_networks, path_to_run_dir, work_sans
     ci_carriers = cget.get_ci_carriers(solved_networks['n_bf'])
 
     cost_summary = (
-        pd.concat(
-            [
-                cget.get_ci_cost_summary(
-                    solved_networks[k]
-                )
-                .assign(name=k)
-                .assign(ci_load = n.loads_t.p.filter(regex='C&I').sum().sum())
-                for k, n in solved_networks.items()
-            ]
-        )
+        cget.get_ci_cost_summaries(solved_networks)
         .pipe(
             cget.split_scenario_col,
             'name',
@@ -1453,20 +1455,7 @@ def plot_ci_unit_cost_of_electricity(solved_networks, path_to_run_dir, work_sans
     fig.subplots_adjust(wspace=0.1)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/06a_unit_cost.png'
-        ),
-        bbox_inches='tight'
-    )
-
-     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/06a_unit_cost.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '06a_unit_cost', formats)
 
      ### Plot unit cost b
     fig, ax0, ax1 = cplt.bar_plot_2row(figsize=(6,4), width_ratios=[1,10])
@@ -1552,27 +1541,17 @@ def plot_ci_unit_cost_of_electricity(solved_networks, path_to_run_dir, work_sans
     fig.subplots_adjust(wspace=0.1)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/06b_unit_cost.png'
-        ),
-        bbox_inches='tight'
-    )
+    files += save_figure(fig, path_to_run_dir, '06b_unit_cost', formats)
 
-     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/06b_unit_cost.svg'
-        ),
-        bbox_inches='tight'
-    )
+    return files
 
 
 def plot_ci_unit_cost_of_electricity_alt(solved_networks, 
                                          path_to_run_dir, 
                                          import_tariff, 
                                          export_tariff,
-                                         work_sans_font):
+                                         work_sans_font,
+                                         formats=FIGURE_FORMATS):
     """
     Plot unit cost of electricity (USD/MWh) for C&I by scenario.
     This uses an alternative calculation, where the import and export cost are user inputs
@@ -1591,16 +1570,7 @@ def plot_ci_unit_cost_of_electricity_alt(solved_networks,
     ci_carriers = cget.get_ci_carriers(solved_networks['n_bf'])
 
     cost_summary = (
-        pd.concat(
-            [
-                cget.get_ci_cost_summary(
-                    solved_networks[k]
-                )
-                .assign(name=k)
-                .assign(ci_load = n.loads_t.p.filter(regex='C&I').sum().sum())
-                for k, n in solved_networks.items()
-            ]
-        )
+        cget.get_ci_cost_summaries(solved_networks)
         .pipe(
             cget.split_scenario_col,
             'name',
@@ -1741,22 +1711,11 @@ def plot_ci_unit_cost_of_electricity_alt(solved_networks,
     fig.subplots_adjust(wspace=0.1)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/06c_unit_cost.png'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '06c_unit_cost', formats)
 
-     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/06c_unit_cost.svg'
-        ),
-        bbox_inches='tight'
-    )
+    return files
 
-def plot_system_costs_vs_benefits(solved_networks, path_to_run_dir, work_sans_font):
+def plot_system_costs_vs_benefits(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot C&I costs vs benefits relative to reference scenario.
     """
@@ -1766,7 +1725,7 @@ def plot_system_costs_vs_benefits(solved_networks, path_to_run_dir, work_sans_fo
     cost_results = (
         pd.concat(
             [
-                solved_networks[k].statistics()[['Capital Expenditure', 'Operational Expenditure']].assign(name=k) 
+                cmetrics.statistics(solved_networks[k])[['Capital Expenditure', 'Operational Expenditure']].assign(name=k) 
                 for k in solved_networks.keys()
             ], 
         axis=0
@@ -1874,22 +1833,11 @@ def plot_system_costs_vs_benefits(solved_networks, path_to_run_dir, work_sans_fo
         text.set_fontproperties(work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/13_system_costs_benefits.png'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '13_system_costs_benefits', formats)
 
-    # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/13_system_costs_benefits.svg'
-        ),
-        bbox_inches='tight'
-    )
+    return files
 
-def plot_system_unit_cost_by_scenario(solved_networks, path_to_run_dir, work_sans_font):
+def plot_system_unit_cost_by_scenario(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot system costs ($/MWh) by scenario.
     """
@@ -1973,14 +1921,9 @@ def plot_system_unit_cost_by_scenario(solved_networks, path_to_run_dir, work_san
         text.set_fontproperties(work_sans_font)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/unit_cost_by_scenario.png'
-        ),
-        bbox_inches='tight'
-    )
+    return save_figure(fig, path_to_run_dir, 'unit_cost_by_scenario', formats)
 
-def plot_ci_curtailment(solved_networks, path_to_run_dir, work_sans_font):
+def plot_ci_curtailment(solved_networks, path_to_run_dir, work_sans_font, formats=FIGURE_FORMATS):
     """
     Plot C&I curtailment for each scenario.
     """
@@ -1993,16 +1936,7 @@ def plot_ci_curtailment(solved_networks, path_to_run_dir, work_sans_font):
     ci_carriers = cget.get_ci_carriers(solved_networks['n_bf'])
 
     curtailment_summary = (
-        pd.concat(
-            [
-                cget.get_ci_cost_summary(
-                    solved_networks[k]
-                    )
-                .assign(name=k)
-                .assign(ci_load = n.loads_t.p.filter(regex='C&I').sum().sum())
-                for k, n in solved_networks.items()
-            ]
-        )
+        cget.get_ci_cost_summaries(solved_networks)
         .pipe(
             cget.split_scenario_col,
             'name',
@@ -2072,21 +2006,65 @@ def plot_ci_curtailment(solved_networks, path_to_run_dir, work_sans_font):
     fig.subplots_adjust(wspace=0.1)
 
     # save plot
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/14_ci_curtailment.png'
-        ),
-        bbox_inches='tight'
-    )
-    fig.savefig(
-        os.path.join(
-            path_to_run_dir, 'results/14_ci_curtailment.svg'
-        ),
-        bbox_inches='tight'
-    )
+    files = save_figure(fig, path_to_run_dir, '14_ci_curtailment', formats)
+
+    return files
+
+
+def cfe_score_heatmap_scale(solved_networks):
+    """
+    Returns the C&I carriers and the cost axis limit ($ billion) shared by the CFE score heatmaps.
+    """
+    ci_carriers = cget.get_ci_carriers(solved_networks['n_bf'])
+    ymax = cget.get_total_ci_procurement_cost(solved_networks['n_hm_CFE100_2030']).query("carrier.isin(@ci_carriers)")['annual_system_cost [M$]'].sum() / 1e3
+    return ci_carriers, ymax
+
+
+def cfe_score_heatmap_data(n, run):
+    """
+    Returns the data of the CFE score heatmaps of a scenario: the CFE score time series and 
+    the C&I procurement cost. The heatmaps are drawn from these alone, without the network.
+    """
+    return {
+        'cfe_t': cget.get_cfe_score_ts(n, run, ci_identifier='C&I'),
+        'procurement_cost': cget.get_total_ci_procurement_cost(n),
+    }
+
+
+def scenario_title(k):
+    """
+    Returns the file name of a scenario and the CFE score of hourly matching scenarios (else None).
+    """
+    if 'n_bf' in k:
+        return '2030 Reference Scenario', None
+    elif 'n_am' in k:
+        return '100% Annual Matching', None
+    elif 'n_hm' in k:
+        fname = k.split('_')[2]
+        return fname, int(fname.replace('CFE', ''))
+
 
+def plot_cfe_score_heatmap(k, cfe_t, procurement_cost, path_to_run_dir, ci_carriers, ymax, work_sans_font_medium, formats=HEATMAP_FORMATS):
+    """
+    Plot the heatmap of CFE score of one scenario (see cfe_score_heatmap_data).
+    """
+    # init fig
+    fig, ax0, ax1 = cplt.plot_cfe_hmap(cfe_t, procurement_cost, ymax=ymax, fields_to_plot=ci_carriers)
+
+    # set fname
+    fname, cfe_score = scenario_title(k)
+    if cfe_score is None:
+        ax0.set_title(f'{fname}', loc='left', fontproperties=work_sans_font_medium, fontsize=14)
+    else:
+        ax0.set_title(f'{cfe_score}% clean procurement: hour-by-hour\n\n', loc='left', fontproperties=work_sans_font_medium, fontsize=14)
+    
+    print(f'Plotting {fname} heatmap...')
 
-def plot_cfe_score_heatmaps(solved_networks, path_to_run_dir, run, work_sans_font_medium):
+    # save plot
+    return save_figure(fig, path_to_run_dir, f'hmap_score_{fname}', formats)
+
+
+def plot_cfe_score_heatmaps(solved_networks, path_to_run_dir, run, work_sans_font_medium, formats=HEATMAP_FORMATS):
     """
     Plot heatmaps of CFE score for each scenario.
     """
@@ -2094,65 +2072,41 @@ def plot_cfe_score_heatmaps(solved_networks, path_to_run_dir, run, work_sans_fon
     # HEATMAP OF CFE SCORE
     print('Creating heatmap of CFE score')
     
-    ci_carriers = cget.get_ci_carriers(solved_networks['n_bf'])
-    ymax = cget.get_total_ci_procurement_cost(solved_networks['n_hm_CFE100_2030']).query("carrier.isin(@ci_carriers)")['annual_system_cost [M$]'].sum() / 1e3
-    for k in solved_networks.keys():
-        # get networks
-        n_reference = solved_networks['n_bf'].copy()
-        n = solved_networks[k].copy()
-        # init fig
-        fig, ax0, ax1 = cplt.plot_cfe_hmap(n, n_reference, ymax=ymax, fields_to_plot=ci_carriers, run=run, ci_identifier='C&I')
-
-        # set fname
-        if 'n_bf' in k:
-            fname = '2030 Reference Scenario'
-            ax0.set_title(f'{fname}', loc='left', fontproperties=work_sans_font_medium, fontsize=14)
-        elif 'n_am' in k:
-            fname = '100% Annual Matching'
-            ax0.set_title(f'{fname}', loc='left', fontproperties=work_sans_font_medium, fontsize=14)
-        elif 'n_hm' in k:
-            fname = k.split('_')[2]
-            cfe_score = int(fname.replace('CFE', ''))
-            ax0.set_title(f'{cfe_score}% clean procurement: hour-by-hour\n\n', loc='left', fontproperties=work_sans_font_medium, fontsize=14)
-        
-        print(f'Plotting {fname} heatmap...')
+    ci_carriers, ymax = cfe_score_heatmap_scale(solved_networks)
+    files = []
+    for k, n in solved_networks.items():
+        data = cfe_score_heatmap_data(n, run)
+        files += plot_cfe_score_heatmap(k, **data, path_to_run_dir=path_to_run_dir, ci_carriers=ci_carriers, ymax=ymax, 
+                                        work_sans_font_medium=work_sans_font_medium, formats=formats)
+    return files
 
-        # save plot
-        fig.savefig(
-            os.path.join(
-                path_to_run_dir, f'results/hmap_score_{fname}.png'
-            ),
-            bbox_inches='tight'
-        )
 
-def plot_monthly_cfe_score_heatmaps(solved_networks, path_to_run_dir, run, work_sans_font_medium):
+def plot_monthly_cfe_score_heatmap(k, cfe_t, path_to_run_dir, work_sans_font_medium, formats=HEATMAP_FORMATS):
+    """
+    Plot the monthly heatmap of CFE score of one scenario (see cfe_score_heatmap_data).
+    """
+    fig, ax = cplt.plot_monthly_cfe_hmap(cfe_t)
+
+    # set fname
+    fname, cfe_score = scenario_title(k)
+    if cfe_score is None:
+        fig.suptitle(f'{fname}', y=0.95, fontsize=14)
+    else:
+        fig.suptitle(f'{cfe_score}% clean procurement: hour-by-hour\n\n', y=0.95, fontproperties=work_sans_font_medium, fontsize=14)
+
+    # save plot
+    return save_figure(fig, path_to_run_dir, f'monthly_hmap_score_{fname}', formats)
+
+
+def plot_monthly_cfe_score_heatmaps(solved_networks, path_to_run_dir, run, work_sans_font_medium, formats=HEATMAP_FORMATS):
     """
     Plot monthly heatmaps of CFE score for each scenario.
     """
     # ------------------------------------------------------------------
     # MONTHLY HEATMAP OF CFE SCORE
     print('Creating monthly heatmap of CFE score')
+    files = []
     for k in solved_networks.keys():
-        n = solved_networks[k].copy()
-
-        fig, ax = cplt.plot_monthly_cfe_hmap(n, run=run, ci_identifier='C&I')
-
-        # set fname
-        if 'n_bf' in k:
-            fname = '2030 Reference Scenario'
-            fig.suptitle(f'{fname}', y=0.95, fontsize=14)
-        elif 'n_am' in k:
-            fname = '100% Annual Matching'
-            fig.suptitle(f'{fname}', y=0.95, fontsize=14)
-        elif 'n_hm' in k:
-            fname = k.split('_')[2]
-            cfe_score = int(fname.replace('CFE',''))
-            fig.suptitle(f'{cfe_score}% clean procurement: hour-by-hour\n\n', y=0.95, fontproperties=work_sans_font_medium, fontsize=14)
-
-        # save plot
-        fig.savefig(
-            os.path.join(
-                path_to_run_dir, f'results/monthly_hmap_score_{fname}.png'
-            ),
-            bbox_inches='tight'
-        )
\ No newline at end of file
+        cfe_t = cget.get_cfe_score_ts(solved_networks[k], run, ci_identifier='C&I')
+        files += plot_monthly_cfe_score_heatmap(k, cfe_t, path_to_run_dir, work_sans_font_medium, formats)
+    return files
@@ -0,0 +1,93 @@
+import pypsa
+
+# roles of C&I components, with the component list they belong to
+CI_ROLES = {
+    "import": "links",
+    "export": "links",
+    "charge": "links",
+    "discharge": "links",
+    "ppa_clean": "generators",
+    "ppa_fossil": "generators",
+    "load": "loads",
+    "storage": "storage_units",
+}
+
+
+def empty_ci_registry(buses: list) -> dict:
+    """Returns a registry without components for the given C&I buses."""
+    return {bus: {role: [] for role in CI_ROLES} for bus in buses}
+
+
+def scan_ci_registry(n: pypsa.Network, ci_identifier: str = "C&I") -> dict:
+    """
+    Builds the C&I registry of a network from the names of its components.
+
+    This follows the naming used by cfe.PrepareNetworkForCFE and is only needed for networks
+    prepared before the registry was stored in the network (see get_ci_registry).
+    """
+    suffix = f" {ci_identifier} Grid"
+    buses = [b[: -len(suffix)] for b in n.buses.index if b.endswith(suffix)]
+    registry = empty_ci_registry(buses)
+
+    keys = {
+        "import": ["Import"],
+        "export": ["Export"],
+        "charge": ["Charge"],
+        "discharge": ["Discharge"],
+        "ppa_clean": ["PPA", "Clean"],
+        "ppa_fossil": ["PPA", "Fossil"],
+        "load": [],
+        "storage": [],
+    }
+    for bus in buses:
+        for role, list_name in CI_ROLES.items():
+            registry[bus][role] = [
+                i
+                for i in getattr(n, list_name).index
+                if ci_identifier in i and bus in i and all(key in i for key in keys[role])
+            ]
+    return registry
+
+
+def get_ci_registry(n: pypsa.Network, ci_identifier: str = "C&I") -> dict:
+    """
+    Returns the C&I registry of a network: {bus: {role: [component names]}}.
+
+    The registry is built by cfe.PrepareNetworkForCFE and stored in n.meta, so it is kept when
+    the network is exported to and imported from netCDF. For networks without one, it is built
+    from the component names once and then stored.
+    """
+    if "ci_registry" not in n.meta:
+        n.meta["ci_registry"] = scan_ci_registry(n, ci_identifier)
+    return n.meta["ci_registry"]
+
+
+def ci_components(n: pypsa.Network, role, bus: str = None, ci_identifier: str = "C&I") -> list:
+    """
+    Returns the names of the C&I components with a given role.
+
+    Parameters:
+    -----------
+    n : pypsa.Network
+        The network.
+    role : str or list
+        One of CI_ROLES (import, export, charge, discharge, ppa_clean, ppa_fossil, load,
+        storage), or a list of them.
+    bus : str, optional
+        The bus of the C&I system. If None, the components of all C&I systems are returned.
+    ci_identifier : str
+        The unique identifier used to identify C&I assets.
+
+    Returns:
+    -----------
+    list
+        Component names, e.g. to index n.links or to select linopy variables.
+    """
+    roles = [role] if isinstance(role, str) else role
+    for r in roles:
+        if r not in CI_ROLES:
+            raise ValueError(f"Invalid C&I role: {r}")
+
+    registry = get_ci_registry(n, ci_identifier)
+    buses = registry.keys() if bus is None else [bus]
+    return [name for b in buses for r in roles for name in registry[b][r]]
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pypsa
+from scipy.cluster.hierarchy import fcluster, linkage
+
+
+def screening_settings(configs: dict) -> dict:
+    """Returns the representative-period screening settings, with defaults for missing keys."""
+    settings = {
+        "representative_days": 12,
+        "cfe_scores": None,
+        "validate": [],
+        "path": None,
+    }
+    settings.update(configs.get("screening") or {})
+    return settings
+
+
+def daily_profiles(n: pypsa.Network) -> pd.DataFrame:
+    """
+    Returns the features that representative days are clustered on: one row per day, with the
+    24 hourly values of every load (p_set) and variable generator (p_max_pu), each series
+    scaled by its maximum.
+    """
+    series = pd.concat(
+        [n.loads_t.p_set, n.generators_t.p_max_pu], axis=1, keys=["load", "generator"]
+    )
+    series = series.loc[:, series.abs().max() > 0]
+    series = series / series.abs().max()
+
+    hours = 24
+    days = len(n.snapshots) // hours
+    return pd.DataFrame(series.values.reshape(days, hours * series.shape[1]))
+
+
+def representative_days(profiles: pd.DataFrame, n_days: int) -> pd.Series:
+    """
+    Clusters days into n_days groups (Ward hierarchical clustering) and picks the day closest to
+    the mean of each group as its representative.
+
+    Returns:
+    -----------
+    pd.Series
+        The number of days each representative day stands for, indexed by the representative
+        days in chronological order.
+    """
+    X = profiles.values
+    if n_days >= len(X):
+        return pd.Series(1, index=profiles.index)
+
+    clusters = fcluster(linkage(X, method="ward"), t=n_days, criterion="maxclust")
+
+    representatives = {}
+    for cluster in np.unique(clusters):
+        members = np.flatnonzero(clusters == cluster)
+        distance = ((X[members] - X[members].mean(axis=0)) ** 2).sum(axis=1)
+        representatives[members[distance.argmin()]] = len(members)
+
+    return pd.Series(representatives).sort_index()
+
+
+def cluster_representative_days(n: pypsa.Network, n_days: int) -> pypsa.Network:
+    """
+    Reduces a network with hourly snapshots to n_days representative days (see
+    representative_days).
+
+    The representative days are kept in chronological order, with hourly state of charge
+    steps (stores weighting 1), so storage units still charge and discharge within and between
+    days and cyclic_state_of_charge closes over the reduced year. The objective and generator
+    weightings of each hour are the number of days its day stands for, so that costs and
+    annual energy totals are those of the full year.
+
+    Parameters:
+    -----------
+    n : pypsa.Network
+        Network with hourly snapshots covering whole days.
+    n_days : int
+        Number of representative days.
+
+    Returns:
+    -----------
+    pypsa.Network
+        The network, reduced in place.
+    """
+    hours = 24
+    if len(n.snapshots) % hours != 0:
+        raise ValueError("Representative days need hourly snapshots covering whole days")
+
+    weights = representative_days(daily_profiles(n), n_days)
+    hour_index = (weights.index.values[:, None] * hours + np.arange(hours)).ravel()
+    day_weights = np.repeat(weights.values, hours).astype(float)
+
+    original = n.snapshot_weightings.iloc[hour_index]
+    n.set_snapshots(n.snapshots[hour_index])
+    n.snapshot_weightings["objective"] = original["objective"].values * day_weights
+    n.snapshot_weightings["generators"] = original["generators"].values * day_weights
+    n.snapshot_weightings["stores"] = original["stores"].values
+    return n
+
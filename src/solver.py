@@ -0,0 +1,484 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pypsa
+import xarray as xr
+from linopy.constants import SolverStatus, Status
+from pypsa.optimization.optimize import assign_duals, assign_solution, post_processing
+
+# gurobi status codes, see https://www.gurobi.com/documentation/current/refman/optimization_status_codes.html
+GUROBI_CONDITIONS = {
+    2: "optimal",
+    3: "infeasible",
+    4: "infeasible_or_unbounded",
+    5: "unbounded",
+    7: "iteration_limit",
+    9: "time_limit",
+    13: "suboptimal",
+}
+
+
+# option profile that solved a run, in the output directory of the run
+SOLVER_PROFILE_NAME = "solver_profile.json"
+
+
+def solver_settings(configs: dict) -> dict:
+    """Returns the solver settings, without fallback option profiles if none are set in the configs."""
+    settings = {"fallback": []}
+    settings.update(configs["solver"])
+    return settings
+
+
+def is_solved(status: str, condition: str, solver_model=None) -> bool:
+    """
+    Whether a solve with the given status and termination condition has a usable solution.
+
+    linopy reports an unknown termination condition both for IPM runs without crossover that
+    end without a clear status (accepted, as with linopy) and for HiGHS runs that stop at a
+    time or iteration limit, so an unknown condition is checked on the native solver model.
+    """
+    if status != "ok":
+        return False
+    if condition == "optimal":
+        return True
+    return condition == "unknown" and has_solution(solver_model)
+
+
+def has_solution(solver_model) -> bool:
+    """
+    Whether a native HiGHS or Gurobi model has a solution that was not cut off by a limit.
+
+    HiGHS ends IPM runs without crossover with an unknown model status, so any status other
+    than a limit is accepted if the solution values are valid. Gurobi reports such runs as
+    optimal, so only an optimal Gurobi solve is accepted: an incumbent left by a limit, an
+    interruption or a suboptimal termination is not.
+    """
+    if solver_model is None:
+        return False
+    if hasattr(solver_model, "getModelStatus"):
+        model_status = solver_model.modelStatusToString(solver_model.getModelStatus()).lower()
+        return "limit" not in model_status and solver_model.getSolution().value_valid
+    return GUROBI_CONDITIONS.get(solver_model.Status) == "optimal" and solver_model.SolCount > 0
+
+
+def solver_profile_path(run: dict, configs: dict) -> str:
+    return os.path.join(configs["paths"]["output_model_runs"], run["name"], SOLVER_PROFILE_NAME)
+
+
+def load_solver_profile(run: dict, configs: dict) -> str:
+    """
+    Returns the option profile that last solved a model of the run, or None. A profile recorded
+    for another configured profile (solver.options, e.g. after autotuning) is ignored.
+    """
+    path = solver_profile_path(run, configs)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        recorded = json.load(file)
+    if recorded.get("options") != solver_settings(configs)["options"]:
+        return None
+    return recorded.get("profile")
+
+
+def record_solver_profile(run: dict, configs: dict, profile: str) -> None:
+    """Records the option profile that solved a model of the run, if it has changed."""
+    if profile is None or profile == load_solver_profile(run, configs):
+        return
+    path = solver_profile_path(run, configs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + f".tmp{os.getpid()}", "w") as file:
+        json.dump({"profile": profile, "options": solver_settings(configs)["options"]}, file)
+    os.replace(path + f".tmp{os.getpid()}", path)
+
+
+def solver_profiles(run: dict, configs: dict) -> dict:
+    """
+    Returns the solver option profiles to try for a model of a run, in order: the configured
+    profile (solver.options) followed by solver.fallback. The profile that last solved a
+    model of the run (see record_solver_profile) is moved to the front.
+
+    Returns:
+    -----------
+    dict
+        Profile name -> solver options.
+    """
+    settings = solver_settings(configs)
+    chain = [settings["options"], *settings["fallback"]]
+
+    preferred = load_solver_profile(run, configs)
+    if preferred in chain:
+        chain.remove(preferred)
+        chain.insert(0, preferred)
+
+    return {profile: configs["solver_options"][profile] for profile in dict.fromkeys(chain)}
+
+
+def solve_model(n: pypsa.Network, run: dict, configs: dict, env=None) -> tuple:
+    """
+    Solves the linopy model of a network (n.optimize.create_model() must have been called)
+    with the solver option profiles of the run (see solver_profiles), until one of them
+    solves it. The profile that solved it is recorded for the later models of the run.
+
+    Returns:
+    -----------
+    status, condition : tuple
+        The status and termination condition of the successful solve.
+    """
+    profiles = solver_profiles(run, configs)
+    for profile, options in profiles.items():
+        status, condition = n.optimize.solve_model(
+            solver_name=configs["solver"]["name"],
+            solver_options=options,
+            io_api="direct",
+            env=env,
+        )
+        if is_solved(status, condition, n.model.solver_model):
+            record_solver_profile(run, configs, profile)
+            return status, condition
+        print(f"Solve with solver options {profile} failed: {status} ({condition})")
+
+    raise RuntimeError(f"Solve failed with all solver options: {list(profiles)}")
+
+
+class SolverSession:
+    """
+    Keeps the native HiGHS/Gurobi model of a network alive between solves.
+
+    The first call to solve() builds and solves the model through pypsa as usual. Later calls
+    re-optimise the native solver model that is still in memory, after applying the coefficient
+    and right-hand side changes registered with change_coefficients and change_rhs. This skips re-building the model and lets the
+    solver start from its previous state: a simplex basis is re-used as is, and Gurobi gets the
+    previous primal/dual solution as a starting point if there is no basis.
+
+    If a solve does not succeed (see is_solved), it is repeated with the next option profile:
+    the first solve re-builds the native model with it, re-solves reset the options of the
+    native model to the profile (without resolve_options). Later re-solves start from the
+    profile that succeeded, which is available as the profile attribute.
+
+    Parameters:
+    -----------
+    n : pypsa.Network
+        Network with a linopy model (n.optimize.create_model() must have been called).
+    solver_name : str
+        Either "highs" or "gurobi".
+    profiles : dict
+        Solver option profiles to try in order, profile name -> solver options (see
+        solver_profiles).
+    resolve_options : dict, optional
+        Solver options applied on top of solver_options for every re-solve (e.g., a simplex
+        profile, which can re-use the basis of the previous solve).
+    env : gurobipy.Env, optional
+        Gurobi environment.
+    """
+
+    def __init__(
+        self,
+        n: pypsa.Network,
+        solver_name: str,
+        profiles: dict,
+        resolve_options: dict = None,
+        env=None,
+    ):
+        if solver_name not in ["highs", "gurobi"]:
+            raise ValueError(f"Solver sessions are not supported for solver: {solver_name}")
+
+        self.n = n
+        self.solver_name = solver_name
+        self.profiles = profiles
+        self.profile = None
+        self.resolve_options = resolve_options or {}
+        self.env = env
+
+        self.solver_model = None
+        self.vlabels = None
+        self.clabels = None
+        self.columns = None  # vlabels and clabels as indexes, to look up changed labels
+        self.rows = None
+        self.solution = None
+        self.pending = {}
+        self.pending_rhs = {}
+
+    def change_coefficients(self, con_labels, var_labels, coeffs) -> None:
+        """
+        Registers new coefficients of the variables var_labels in the constraints con_labels
+        (one constraint for all, or one per variable). They are applied to the native model on
+        the next re-solve. Missing (NaN) coefficients drop the term, as linopy does when
+        building the model.
+        """
+        var_labels = np.ravel(var_labels)
+        con_labels = np.broadcast_to(con_labels, var_labels.shape)
+        coeffs = np.nan_to_num(np.ravel(coeffs).astype(float), nan=0.0)
+        for con_label, var_label, coeff in zip(con_labels, var_labels, coeffs):
+            self.pending[(int(con_label), int(var_label))] = float(coeff)
+
+    def change_rhs(self, con_labels, sign: str, rhs) -> None:
+        """
+        Registers new right-hand sides of the constraints con_labels (all with the given sign).
+        They are applied to the native model on the next re-solve.
+        """
+        for con_label, value in zip(np.ravel(con_labels), np.ravel(rhs)):
+            self.pending_rhs[int(con_label)] = (sign, float(value))
+
+    def solve(self) -> tuple:
+        """
+        Solves the model and assigns the solution to the network.
+
+        Returns:
+        -----------
+        status, condition : tuple
+            The status and termination condition of the solve, as returned by pypsa.
+        """
+        if self.solver_model is None:
+            return self._first_solve()
+        return self._resolve()
+
+    def _fallback_profiles(self) -> list:
+        """Profiles to try after the current one, in order."""
+        names = list(self.profiles)
+        if self.profile is None:
+            return names
+        return names[names.index(self.profile) + 1:]
+
+    def _first_solve(self, profiles: list = None) -> tuple:
+        for profile in profiles or self._fallback_profiles():
+            status, condition = self.n.optimize.solve_model(
+                solver_name=self.solver_name,
+                solver_options=self.profiles[profile],
+                io_api="direct",
+                env=self.env,
+            )
+            if is_solved(status, condition, self.n.model.solver_model):
+                break
+            print(f"Solve with solver options {profile} failed: {status} ({condition})")
+        else:
+            raise RuntimeError(f"Solve failed with all solver options: {list(self.profiles)}")
+
+        self.profile = profile
+        m = self.n.model
+        self.solver_model = m.solver_model
+
+        # rows/columns of the native model follow the order of the linopy matrices
+        M = m.matrices
+        self.vlabels = np.asarray(M.vlabels)
+        self.clabels = np.asarray(M.clabels)
+        self.columns = pd.Index(self.vlabels)
+        self.rows = pd.Index(self.clabels)
+        self.pending = {}
+        self.pending_rhs = {}
+
+        if self.resolve_options:
+            self._set_options(self.resolve_options)
+
+        self._store_solution()
+        return status, condition
+
+    def _resolve(self) -> tuple:
+        if not self._apply_pending():
+            return self._rebuild()
+        self._warm_start()
+
+        status, condition = self._run()
+        if is_solved(status, condition, self.solver_model):
+            return status, condition
+
+        for profile in self._fallback_profiles():
+            print(f"Re-solve failed: {status} ({condition}), retrying with solver options {profile}")
+            self._reset_options()
+            self._set_options(self.profiles[profile])
+            status, condition = self._run()
+            if is_solved(status, condition, self.solver_model):
+                self.profile = profile
+                return status, condition
+
+        raise RuntimeError(f"Re-solve failed with all solver options: {list(self.profiles)}")
+
+    def _run(self) -> tuple:
+        if self.solver_name == "highs":
+            self.solver_model.run()
+        else:
+            self.solver_model.optimize()
+
+        return self._assign_result()
+
+    def _reset_options(self) -> None:
+        if self.solver_name == "highs":
+            self.solver_model.resetOptions()
+        else:
+            self.solver_model.resetParams()
+
+    def _set_options(self, options: dict) -> None:
+        for k, v in options.items():
+            if self.solver_name == "highs":
+                self.solver_model.setOptionValue(k, v)
+            else:
+                self.solver_model.setParam(k, v)
+
+    def _rebuild(self) -> tuple:
+        """
+        Solves the model from scratch: a native model is built again from the linopy model, which
+        already holds the pending changes, starting with the current option profile.
+        """
+        names = list(self.profiles)
+        profiles = names[names.index(self.profile):]
+        self.solver_model = None
+        self.pending = {}
+        self.pending_rhs = {}
+        return self._first_solve(profiles)
+
+    def _positions(self, index: pd.Index, labels) -> np.ndarray:
+        """Positions of linopy labels in the rows or columns of the native model (-1 if absent)."""
+        return index.get_indexer(np.asarray(labels, dtype=int))
+
+    def _apply_pending(self) -> bool:
+        """
+        Applies the pending changes to the native model. Terms of masked constraints or
+        variables (label -1) are not part of the model, as in linopy, and are skipped.
+
+        Returns:
+        -----------
+        bool
+            False if a changed constraint or variable is not in the native model (e.g., a row
+            that linopy dropped), in which case nothing is changed and the model must be rebuilt.
+        """
+        keys = np.array(list(self.pending.keys()), dtype=int).reshape(-1, 2)
+        values = np.array(list(self.pending.values()), dtype=float)
+        terms = (keys >= 0).all(axis=1)
+        rows = self._positions(self.rows, keys[terms, 0])
+        cols = self._positions(self.columns, keys[terms, 1])
+        values = values[terms]
+
+        rhs_labels = np.array(list(self.pending_rhs.keys()), dtype=int)
+        rhs_values = [v for v, label in zip(self.pending_rhs.values(), rhs_labels) if label >= 0]
+        rhs_rows = self._positions(self.rows, rhs_labels[rhs_labels >= 0])
+
+        if (rows < 0).any() or (cols < 0).any() or (rhs_rows < 0).any():
+            print("Changed constraints or variables are not in the solver model, rebuilding it")
+            return False
+
+        self._apply_rhs(rhs_rows, rhs_values)
+        self._apply_coefficients(rows, cols, values)
+        self.pending = {}
+        self.pending_rhs = {}
+        return True
+
+    def _apply_coefficients(self, rows: np.ndarray, cols: np.ndarray, values) -> None:
+        if len(rows) == 0:
+            return
+
+        if self.solver_name == "highs":
+            for row, col, value in zip(rows, cols, values):
+                self.solver_model.changeCoeff(int(row), int(col), value)
+        else:
+            constrs = self.solver_model.getConstrs()
+            variables = self.solver_model.getVars()
+            for row, col, value in zip(rows, cols, values):
+                self.solver_model.chgCoeff(constrs[row], variables[col], value)
+            self.solver_model.update()
+
+    def _apply_rhs(self, rows: np.ndarray, values: list) -> None:
+        if len(rows) == 0:
+            return
+
+        if self.solver_name == "highs":
+            for row, (sign, value) in zip(rows, values):
+                lower = value if sign in [">=", "="] else -np.inf
+                upper = value if sign in ["<=", "="] else np.inf
+                self.solver_model.changeRowBounds(int(row), lower, upper)
+        else:
+            constrs = self.solver_model.getConstrs()
+            for row, (sign, value) in zip(rows, values):
+                constrs[row].RHS = value
+            self.solver_model.update()
+
+    def _warm_start(self) -> None:
+        # HiGHS keeps its simplex basis across coefficient changes, and IPX cannot use a
+        # starting point, so there is nothing to pass on. Gurobi keeps its basis as well; only
+        # without one (barrier without crossover) the previous primal/dual solution is passed
+        # as a start for a simplex re-solve.
+        if self.solver_name != "gurobi" or self.solution is None:
+            return
+
+        import gurobipy
+
+        variables = self.solver_model.getVars()
+        constrs = self.solver_model.getConstrs()
+        try:
+            self.solver_model.getAttr("VBasis", variables[:1])
+            return
+        except gurobipy.GurobiError:
+            pass
+
+        primal, dual = self.solution
+        self.solver_model.setAttr("PStart", variables, list(primal))
+        self.solver_model.setAttr("DStart", constrs, list(dual))
+
+    def _store_solution(self) -> None:
+        if self.solver_name == "highs":
+            solution = self.solver_model.getSolution()
+            self.solution = (
+                np.asarray(solution.col_value),
+                np.asarray(solution.row_dual),
+            )
+        else:
+            self.solution = (
+                np.asarray(self.solver_model.getAttr("X", self.solver_model.getVars())),
+                np.asarray(self.solver_model.getAttr("Pi", self.solver_model.getConstrs())),
+            )
+
+    def _assign_result(self) -> tuple:
+        m = self.n.model
+
+        # interpret the solver status the same way linopy does
+        if self.solver_name == "highs":
+            h = self.solver_model
+            result = Status.from_termination_condition(
+                h.modelStatusToString(h.getModelStatus()).lower()
+            )
+            has_solution = h.getSolution().value_valid
+        else:
+            g = self.solver_model
+            result = Status.from_termination_condition(
+                GUROBI_CONDITIONS.get(g.Status, "unknown")
+            )
+            has_solution = g.SolCount > 0
+
+        # an unknown status with a solution (e.g., IPM without crossover) is parsed as well;
+        # is_solved then decides whether it is usable
+        if result.status == SolverStatus.unknown and has_solution:
+            result.status = SolverStatus.ok
+
+        m.status = result.status.value
+        m.termination_condition = result.termination_condition.value
+        if not result.is_ok:
+            return m.status, m.termination_condition
+
+        self._store_solution()
+        primal, dual = self.solution
+        m.objective._value = (
+            self.solver_model.getObjectiveValue()
+            if self.solver_name == "highs"
+            else self.solver_model.ObjVal
+        )
+
+        # map the solution back to the linopy variables and constraints (see linopy.Model.solve)
+        sol = pd.Series(primal, index=self.vlabels)
+        sol.loc[-1] = np.nan
+        for var in m.variables.data.values():
+            idx = np.ravel(var.labels)
+            vals = sol.reindex(idx).values.reshape(var.labels.shape)
+            var.solution = xr.DataArray(vals, var.coords)
+
+        dual = pd.Series(dual, index=self.clabels)
+        dual.loc[-1] = np.nan
+        for con in m.constraints.data.values():
+            idx = np.ravel(con.labels)
+            vals = dual.reindex(idx).values.reshape(con.labels.shape)
+            con.dual = xr.DataArray(vals, con.labels.coords)
+
+        assign_solution(self.n)
+        assign_duals(self.n, False)
+        post_processing(self.n)
+
+        return m.status, m.termination_condition